@@ -26,9 +26,11 @@ def get_db():  # Dependency
 from .crud import (create_admin, create_notification_reminder,  # noqa
                    create_user, delete_notification_reminder, get_admin,
                    get_admins, get_jwt_secret_key, get_notification_reminder,
+                   get_notification_reminder_keys, create_notification_reminders,
                    get_or_create_inbound, get_system_usage,
                    get_tls_certificate, get_user, get_user_by_id, get_users,
-                   get_users_count, remove_admin, remove_user, revoke_user_sub,
+                   get_users_count, get_users_to_review, get_users_to_remind,
+                   get_on_hold_users_to_activate, remove_admin, remove_user, revoke_user_sub,
                    set_owner, update_admin, update_user, update_user_status, reset_user_by_next,
                    update_user_sub, start_user_expire, get_admin_by_id,
                    get_admin_by_telegram_id)
@@ -40,6 +42,9 @@ __all__ = [
     "get_user",
     "get_user_by_id",
     "get_users",
+    "get_users_to_review",
+    "get_users_to_remind",
+    "get_on_hold_users_to_activate",
     "get_users_count",
     "create_user",
     "remove_user",
@@ -63,6 +68,8 @@ __all__ = [
 
     "create_notification_reminder",
     "get_notification_reminder",
+    "get_notification_reminder_keys",
+    "create_notification_reminders",
     "delete_notification_reminder",
 
     "GetDB",
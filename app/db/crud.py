@@ -2,12 +2,31 @@
 Functions for managing proxy hosts, users, user templates, nodes, and administrative tasks.
 """
 
-from datetime import datetime, timedelta
+import binascii
+import json
+import threading
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime, timedelta, timezone
 from enum import Enum
-from time import sleep
-from typing import Dict, List, Optional, Tuple, Union
-
-from sqlalchemy import and_, delete, func, or_
+from time import monotonic, sleep
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from sqlalchemy import (
+    DateTime,
+    Integer,
+    Row,
+    and_,
+    bindparam,
+    case,
+    delete,
+    func,
+    insert,
+    literal,
+    or_,
+    select,
+    text,
+    update,
+)
 from sqlalchemy.exc import IntegrityError, OperationalError
 from sqlalchemy.orm import Query, Session, joinedload
 from sqlalchemy.sql.functions import coalesce
@@ -21,7 +40,11 @@ from app.db.models import (
     NextPlan,
     Node,
     NodeUsage,
+    NodeUsageDaily,
+    NodeUsageMonthly,
     NodeUserUsage,
+    NodeUserUsageDaily,
+    NodeUserUsageMonthly,
     NotificationReminder,
     Proxy,
     ProxyHost,
@@ -33,6 +56,8 @@ from app.db.models import (
     UserTemplate,
     UserUsageResetLogs,
 )
+from app.db.user_admin_map import user_admin_map
+from app.db.user_review_queue import user_review_queue
 from app.models.admin import AdminCreate, AdminModify, AdminPartialModify
 from app.models.node import NodeCreate, NodeModify, NodeStatus, NodeUsageResponse
 from app.models.proxy import ProxyHost as ProxyHostModify
@@ -231,6 +256,150 @@ UsersSortingOptions = Enum('UsersSortingOptions', {
 })
 
 
+# resolved on the first search: 'fts5' (SQLite), 'fulltext' (MySQL) or 'like' (also MariaDB)
+_user_search_mode: Optional[str] = None
+
+
+def _get_user_search_mode(db: Session) -> str:
+    global _user_search_mode
+    if _user_search_mode is not None:
+        return _user_search_mode
+
+    mode = 'like'
+    if config_module.USERS_FULLTEXT_SEARCH:
+        dialect = db.bind.dialect.name
+        try:
+            if dialect == 'sqlite':
+                # the triggers keep the index in sync, a rebuilt users table drops them
+                found = db.execute(text(
+                    "SELECT COUNT(*) FROM sqlite_master WHERE name IN "
+                    "('users_fts', 'users_fts_ai', 'users_fts_ad', 'users_fts_au')"
+                )).scalar()
+                if found == 4:
+                    mode = 'fts5'
+            elif dialect == 'mysql' and not db.bind.dialect.is_mariadb:
+                found = db.execute(text(
+                    "SELECT COUNT(*) FROM information_schema.statistics WHERE table_schema = DATABASE() "
+                    "AND table_name = 'users' AND index_name = 'ix_users_fulltext'"
+                )).scalar()
+                if found:
+                    mode = 'fulltext'
+        except Exception as exc:
+            logger.warning(f"Full-text user search is unavailable, using LIKE: {exc}")
+
+    _user_search_mode = mode
+    return mode
+
+
+def _user_search_filter(db: Session, search: str):
+    like = or_(User.username.ilike(f"%{search}%"), User.note.ilike(f"%{search}%"))
+    mode = _get_user_search_mode(db)
+    # the index narrows the candidates and LIKE keeps the exact substring semantics
+    phrase = '"' + search.replace('"', '""') + '"'
+
+    if mode == 'fts5' and len(search) >= 3:  # trigrams
+        matches = text("SELECT rowid FROM users_fts WHERE users_fts MATCH :search_phrase"). \
+            bindparams(search_phrase=phrase). \
+            columns(rowid=Integer)
+        return and_(User.id.in_(matches), like)
+
+    if mode == 'fulltext' and len(search) >= 2:  # default ngram_token_size
+        phrase = '"' + search.replace('"', ' ') + '"'
+        match = text("MATCH (users.username, users.note) AGAINST (:search_phrase IN BOOLEAN MODE)"). \
+            bindparams(search_phrase=phrase)
+        return and_(match, like)
+
+    return like
+
+
+_users_count_cache: Dict[tuple, Tuple[float, int]] = {}
+_users_count_cache_lock = threading.Lock()
+_USERS_COUNT_CACHE_MAX_ENTRIES = 1024
+
+
+def _get_cached_count(cache_key: tuple):
+    with _users_count_cache_lock:
+        cached = _users_count_cache.get(cache_key)
+    if cached and cached[0] > monotonic():
+        return cached[1]
+    return None
+
+
+def _set_cached_count(cache_key: tuple, ttl: int, value):
+    with _users_count_cache_lock:
+        if len(_users_count_cache) >= _USERS_COUNT_CACHE_MAX_ENTRIES:
+            _users_count_cache.clear()
+        _users_count_cache[cache_key] = (monotonic() + ttl, value)
+
+
+def _get_users_count(query: Query, cache_key: tuple) -> int:
+    ttl = config_module.USERS_COUNT_CACHE_TTL
+    if ttl > 0:
+        count = _get_cached_count(cache_key)
+        if count is not None:
+            return count
+
+    # count the filtered ids only, without the eager loaded joins of the user queryset
+    count = query.order_by(None).with_entities(func.count(User.id)).scalar()
+
+    if ttl > 0:
+        _set_cached_count(cache_key, ttl, count)
+    return count
+
+
+def _users_sort_keys(sort: Optional[List[UsersSortingOptions]]) -> List[Tuple[str, bool]]:
+    keys = []
+    for opt in sort or []:
+        name = opt.name.lstrip('-')
+        if name not in (key for key, _ in keys):
+            keys.append((name, opt.name.startswith('-')))
+    keys.append(('id', False))
+    return keys
+
+
+def _users_sort_column(name: str):
+    column = getattr(User, name)
+    # nullable keys are compared as 0 so the keyset condition never meets a NULL
+    if name in ('data_limit', 'expire'):
+        return func.coalesce(column, 0)
+    return column
+
+
+def get_users_cursor(dbuser: User, sort: Optional[List[UsersSortingOptions]] = None) -> str:
+    """
+    Builds the cursor that continues a keyset paginated user listing after `dbuser`.
+
+    Args:
+        dbuser (User): The last user of the current page.
+        sort (Optional[List[UsersSortingOptions]]): Sorting options of the listing.
+
+    Returns:
+        str: Opaque cursor to pass to `get_users`.
+    """
+    values = []
+    for name, _ in _users_sort_keys(sort):
+        value = getattr(dbuser, name)
+        if name in ('data_limit', 'expire'):
+            value = value or 0
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        values.append(value)
+    return urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def _decode_users_cursor(cursor: str, keys: List[Tuple[str, bool]]) -> list:
+    try:
+        values = json.loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError
+        return [
+            datetime.fromisoformat(value) if name == 'created_at' and value is not None else value
+            for (name, _), value in zip(keys, values)
+        ]
+    except (ValueError, TypeError, binascii.Error):
+        raise ValueError("Invalid cursor")
+
+
 def get_users(db: Session,
               offset: Optional[int] = None,
               limit: Optional[int] = None,
@@ -241,7 +410,8 @@ def get_users(db: Session,
               admin: Optional[Admin] = None,
               admins: Optional[List[str]] = None,
               reset_strategy: Optional[Union[UserDataLimitResetStrategy, list]] = None,
-              return_with_count: bool = False) -> Union[List[User], Tuple[List[User], int]]:
+              return_with_count: bool = False,
+              cursor: Optional[str] = None) -> Union[List[User], Tuple[List[User], int]]:
     """
     Retrieves users based on various filters and options.
 
@@ -257,14 +427,19 @@ def get_users(db: Session,
         admins (Optional[List[str]]): List of admin usernames to filter users by.
         reset_strategy (Optional[Union[UserDataLimitResetStrategy, list]]): Data limit reset strategy to filter by.
         return_with_count (bool): Whether to return the total count of users.
+        cursor (Optional[str]): Keyset pagination cursor from `get_users_cursor`, an empty
+            string starts from the first page. `offset` is ignored when it is given.
 
     Returns:
         Union[List[User], Tuple[List[User], int]]: List of users or tuple of users and total count.
+
+    Raises:
+        ValueError: If the cursor is malformed.
     """
     query = get_user_queryset(db)
 
     if search:
-        query = query.filter(or_(User.username.ilike(f"%{search}%"), User.note.ilike(f"%{search}%")))
+        query = query.filter(_user_search_filter(db, search))
 
     if usernames:
         query = query.filter(User.username.in_(usernames))
@@ -288,13 +463,29 @@ def get_users(db: Session,
         query = query.filter(User.admin.has(Admin.username.in_(admins)))
 
     if return_with_count:
-        count = query.count()
+        count = _get_users_count(query, (
+            tuple(usernames or ()), search, str(status), admin.id if admin else None,
+            tuple(admins or ()), str(reset_strategy),
+        ))
 
-    if sort:
-        query = query.order_by(*(opt.value for opt in sort))
+    if cursor is not None:
+        keys = _users_sort_keys(sort)
+        columns = [(_users_sort_column(name), desc) for name, desc in keys]
+        if cursor:
+            values = _decode_users_cursor(cursor, keys)
+            # (a, b, id) > (x, y, z) expanded for mixed directions
+            conditions = []
+            for i, ((column, desc), value) in enumerate(zip(columns, values)):
+                equal = [prev_column == prev_value for (prev_column, _), prev_value in zip(columns[:i], values[:i])]
+                conditions.append(and_(*equal, column < value if desc else column > value))
+            query = query.filter(or_(*conditions))
+        query = query.order_by(*(column.desc() if desc else column.asc() for column, desc in columns))
+    else:
+        if sort:
+            query = query.order_by(*(opt.value for opt in sort))
 
-    if offset:
-        query = query.offset(offset)
+        if offset:
+            query = query.offset(offset)
     if limit:
         query = query.limit(limit)
 
@@ -304,6 +495,377 @@ def get_users(db: Session,
     return query.all()
 
 
+def _filter_user_ids(query: Query, user_ids: Optional[Iterable[int]]) -> Query:
+    if user_ids is None:
+        return query
+    return query.filter(User.id.in_(list(user_ids)))
+
+
+def get_users_to_review(db: Session, now: datetime, user_ids: Optional[Iterable[int]] = None) -> List[User]:
+    """
+    Retrieves active users that have reached their data limit or expiration time.
+
+    Args:
+        db (Session): Database session.
+        now (datetime): Current UTC time.
+        user_ids (Optional[Iterable[int]]): Only look at these users.
+
+    Returns:
+        List[User]: Users whose status has to change.
+    """
+    query = get_user_queryset(db).filter(
+        User.status == UserStatus.active,
+        or_(
+            and_(User.data_limit > 0, User.used_traffic >= User.data_limit),
+            and_(User.expire > 0, User.expire <= int(now.timestamp())),
+        )
+    )
+    return _filter_user_ids(query, user_ids).all()
+
+
+def get_users_to_remind(db: Session, now: datetime,
+                        usage_percents: List[int], days_left: List[int],
+                        user_ids: Optional[Iterable[int]] = None) -> List[User]:
+    """
+    Retrieves active users that may have crossed a usage or expiration notification threshold.
+
+    The filter is a superset of the exact checks, which stay with the caller.
+
+    Args:
+        db (Session): Database session.
+        now (datetime): Current UTC time.
+        usage_percents (List[int]): Usage percent thresholds.
+        days_left (List[int]): Days-left thresholds.
+        user_ids (Optional[Iterable[int]]): Only look at these users.
+
+    Returns:
+        List[User]: Candidate users for notification reminders.
+    """
+    conditions = []
+    if usage_percents:
+        conditions.append(and_(
+            User.data_limit > 0,
+            User.used_traffic * 100 >= User.data_limit * min(usage_percents),
+        ))
+    if days_left:
+        # one extra day absorbs the rounding and local time of calculate_expiration_days
+        conditions.append(and_(
+            User.expire > 0,
+            User.expire <= int(now.timestamp()) + (max(days_left) + 2) * 86400,
+        ))
+    if not conditions:
+        return []
+
+    query = get_user_queryset(db).filter(User.status == UserStatus.active, or_(*conditions))
+    return _filter_user_ids(query, user_ids).all()
+
+
+def get_on_hold_users_to_activate(db: Session, now: datetime,
+                                  user_ids: Optional[Iterable[int]] = None) -> List[User]:
+    """
+    Retrieves on-hold users that connected since their last edit or whose on-hold timeout passed.
+
+    Args:
+        db (Session): Database session.
+        now (datetime): Current UTC time.
+        user_ids (Optional[Iterable[int]]): Only look at these users.
+
+    Returns:
+        List[User]: On-hold users to activate.
+    """
+    query = get_user_queryset(db).filter(
+        User.status == UserStatus.on_hold,
+        or_(
+            User.online_at >= func.coalesce(User.edit_at, User.created_at),
+            User.on_hold_timeout <= now,
+        )
+    )
+    return _filter_user_ids(query, user_ids).all()
+
+
+def _floor_hour(dt: datetime) -> datetime:
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def _floor_day(dt: datetime) -> datetime:
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _ceil_day(dt: datetime) -> datetime:
+    floor = _floor_day(dt)
+    return floor if floor == dt else floor + timedelta(days=1)
+
+
+def _next_day(dt: datetime) -> datetime:
+    return dt + timedelta(days=1)
+
+
+def _floor_month(dt: datetime) -> datetime:
+    return _floor_day(dt).replace(day=1)
+
+
+def _next_month(dt: datetime) -> datetime:
+    return (dt.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _ceil_month(dt: datetime) -> datetime:
+    floor = _floor_month(dt)
+    return floor if floor == dt else _next_month(floor)
+
+
+def get_usage_segments(db: Session, hourly, daily, monthly,
+                       start: datetime, end: datetime) -> List[Tuple[type, datetime, datetime]]:
+    """
+    Splits a usage window into the coarsest compacted granularity available for each part.
+
+    Whole months that are already rolled up are read from `monthly`, whole days
+    from `daily` and the remaining edges from the `hourly` table.
+
+    Args:
+        db (Session): Database session.
+        hourly: Hourly usage model.
+        daily: Daily rollup model.
+        monthly: Monthly rollup model.
+        start (datetime): Start of the window, hourly rows at or after it are included.
+        end (datetime): End of the window, hourly rows at or before it are included.
+
+    Returns:
+        List[Tuple[type, datetime, datetime]]: (model, from, to) segments, `to` being exclusive.
+    """
+    if start.tzinfo:
+        start = start.astimezone(timezone.utc).replace(tzinfo=None)
+    if end.tzinfo:
+        end = end.astimezone(timezone.utc).replace(tzinfo=None)
+
+    lo = _floor_hour(start)
+    if lo != start:
+        lo += timedelta(hours=1)
+    hi = _floor_hour(end) + timedelta(hours=1)
+    if lo >= hi:
+        return []
+
+    last_day = db.query(func.max(daily.created_at)).scalar()
+    last_month = db.query(func.max(monthly.created_at)).scalar()
+    daily_until = _next_day(last_day) if last_day else None
+    monthly_until = _next_month(last_month) if last_month else None
+
+    def split(a, b, model, until, floor, ceil, finer):
+        if until is not None:
+            seg_start, seg_end = ceil(a), floor(min(b, until))
+            if seg_start < seg_end:
+                return finer(a, seg_start) + [(model, seg_start, seg_end)] + finer(seg_end, b)
+        return finer(a, b)
+
+    def by_hour(a, b):
+        return [(hourly, a, b)] if a < b else []
+
+    def by_day(a, b):
+        return split(a, b, daily, daily_until, _floor_day, _ceil_day, by_hour)
+
+    return split(lo, hi, monthly, monthly_until, _floor_month, _ceil_month, by_day)
+
+
+# hourly model -> (daily rollup, monthly rollup, group columns, summed columns)
+_USAGE_ROLLUPS = {
+    NodeUserUsage: (NodeUserUsageDaily, NodeUserUsageMonthly, ['user_id', 'node_id'], ['used_traffic']),
+    NodeUsage: (NodeUsageDaily, NodeUsageMonthly, ['node_id'], ['uplink', 'downlink']),
+}
+
+# held while a period is compacted and while usages are written into past hours,
+# so a late row is either read by the compaction or added to the rollup, never both
+usage_rollup_lock = threading.Lock()
+
+
+def _compact_usage_level(db: Session, source, target, group_columns: List[str], sum_columns: List[str],
+                         floor, step, closed_before: datetime) -> int:
+    last = db.query(func.max(target.created_at)).scalar()
+    if last is not None:
+        period = step(last)
+    else:
+        first = db.query(func.min(source.created_at)).scalar()
+        if first is None:
+            return 0
+        period = floor(first)
+
+    end = floor(closed_before)
+    compacted = 0
+    while period < end:
+        next_period = step(period)
+        rows = select(
+            literal(period, DateTime()),
+            *(getattr(source, col) for col in group_columns),
+            *(func.coalesce(func.sum(getattr(source, col)), 0) for col in sum_columns),
+        ).where(
+            source.created_at >= period,
+            source.created_at < next_period,
+        ).group_by(*(getattr(source, col) for col in group_columns))
+
+        with usage_rollup_lock:
+            db.execute(insert(target).from_select(['created_at', *group_columns, *sum_columns], rows))
+            db.commit()
+        period = next_period
+        compacted += 1
+
+    return compacted
+
+
+def compact_usages(db: Session, closed_before: datetime) -> Tuple[int, int]:
+    """
+    Folds closed hours of usage into daily rollups and closed days into monthly rollups.
+
+    Each period is aggregated with a single INSERT ... SELECT ... GROUP BY and only once,
+    continuing after the latest period already present in the rollup table. Usages
+    written into an hour after it was folded are added by `add_late_usages_to_rollups`.
+
+    Args:
+        db (Session): Database session.
+        closed_before (datetime): Hourly rows before this point won't receive more traffic.
+
+    Returns:
+        Tuple[int, int]: Number of days and months compacted.
+    """
+    days = months = 0
+    for hourly, (daily, monthly, group_columns, sum_columns) in _USAGE_ROLLUPS.items():
+        days = max(days, _compact_usage_level(
+            db, hourly, daily, group_columns, sum_columns, _floor_day, _next_day, closed_before))
+        months = max(months, _compact_usage_level(
+            db, daily, monthly, group_columns, sum_columns, _floor_month, _next_month, _floor_day(closed_before)))
+    return days, months
+
+
+def _add_to_rollup(db: Session, target, period: datetime, group_columns: List[str], sum_columns: List[str],
+                   rows: List[dict]) -> bool:
+    last = db.query(func.max(target.created_at)).scalar()
+    if last is None or period > last:
+        return False  # not compacted yet, the compaction will read the hourly rows
+
+    existing = {
+        tuple(row) for row in db.query(*(getattr(target, col) for col in group_columns)).
+        filter(target.created_at == period)
+    }
+    inserts, updates = [], []
+    for row in rows:
+        if tuple(row[col] for col in group_columns) in existing:
+            updates.append({
+                **{f"g_{col}": row[col] for col in group_columns},
+                **{f"v_{col}": row[col] for col in sum_columns},
+            })
+        else:
+            inserts.append({"created_at": period, **row})
+
+    if inserts:
+        db.connection().execute(insert(target), inserts)
+    if updates:
+        # NULL node ids (the master core) compare equal too
+        db.connection().execute(
+            update(target).
+            where(
+                target.created_at == period,
+                *(getattr(target, col).is_not_distinct_from(bindparam(f"g_{col}")) for col in group_columns),
+            ).
+            values({col: getattr(target, col) + bindparam(f"v_{col}") for col in sum_columns}),
+            updates
+        )
+    return True
+
+
+def add_late_usages_to_rollups(db: Session, hourly, created_at: datetime, rows: List[dict]) -> None:
+    """
+    Adds usages written into an hour that was already compacted to its daily and monthly rollups.
+
+    Must run under `usage_rollup_lock` together with the hourly write, otherwise
+    a compaction in between could count the usages twice or not at all.
+
+    Args:
+        db (Session): Database session.
+        hourly: Hourly usage model the usages were written to.
+        created_at (datetime): Hour of the usages.
+        rows (List[dict]): The group and summed columns of every written usage.
+    """
+    daily, monthly, group_columns, sum_columns = _USAGE_ROLLUPS[hourly]
+    if _add_to_rollup(db, daily, _floor_day(created_at), group_columns, sum_columns, rows):
+        _add_to_rollup(db, monthly, _floor_month(created_at), group_columns, sum_columns, rows)
+    db.commit()
+
+
+def get_table_size(db: Session, table_name: str) -> Optional[int]:
+    """
+    Returns the bytes used by a table and its indexes, when the database can report it.
+
+    SQLite has no per-table size, so the used (non-free) size of the whole database file is returned.
+
+    Args:
+        db (Session): Database session.
+        table_name (str): Name of the table.
+
+    Returns:
+        Optional[int]: Size in bytes or None if unsupported.
+    """
+    dialect = db.bind.dialect.name
+    try:
+        if dialect == 'mysql':
+            return db.execute(text(
+                "SELECT data_length + index_length FROM information_schema.tables "
+                "WHERE table_schema = DATABASE() AND table_name = :name"
+            ), {"name": table_name}).scalar()
+        if dialect == 'postgresql':
+            return db.execute(text("SELECT pg_total_relation_size(:name)"), {"name": table_name}).scalar()
+        if dialect == 'sqlite':
+            page_size = db.execute(text("PRAGMA page_size")).scalar()
+            page_count = db.execute(text("PRAGMA page_count")).scalar()
+            free_pages = db.execute(text("PRAGMA freelist_count")).scalar()
+            return (page_count - free_pages) * page_size
+    except Exception as exc:
+        logger.debug(f"Failed to read size of table {table_name}: {exc}")
+    return None
+
+
+def prune_user_usages(db: Session, before: datetime, require_rollup: bool = True,
+                      chunk_size: int = 5000) -> Tuple[int, Optional[int]]:
+    """
+    Deletes hourly user usages created before the given time in primary key ordered chunks.
+
+    Every chunk is committed on its own, so locks are only held for a short time.
+
+    Args:
+        db (Session): Database session.
+        before (datetime): Rows created before this time are deleted.
+        require_rollup (bool): Only delete hours already folded into the daily rollup.
+        chunk_size (int): Maximum number of rows deleted per statement.
+
+    Returns:
+        Tuple[int, Optional[int]]: Number of deleted rows and bytes reclaimed, if measurable.
+    """
+    if require_rollup:
+        last_day = db.query(func.max(NodeUserUsageDaily.created_at)).scalar()
+        if last_day is None:
+            return 0, 0
+        before = min(before, _next_day(last_day))
+
+    size_before = get_table_size(db, NodeUserUsage.__tablename__)
+    deleted = 0
+    last_id = 0
+    while True:
+        ids = [row_id for row_id, in db.query(NodeUserUsage.id).filter(
+            NodeUserUsage.id > last_id,
+            NodeUserUsage.created_at < before,
+        ).order_by(NodeUserUsage.id).limit(chunk_size)]
+        if not ids:
+            break
+
+        db.execute(delete(NodeUserUsage).where(NodeUserUsage.id.in_(ids)))
+        db.commit()
+        deleted += len(ids)
+        last_id = ids[-1]
+
+    size_after = get_table_size(db, NodeUserUsage.__tablename__)
+    reclaimed = None
+    if size_before is not None and size_after is not None:
+        reclaimed = max(size_before - size_after, 0)
+
+    return deleted, reclaimed
+
+
 def get_user_usages(db: Session, dbuser: User, start: datetime, end: datetime) -> List[UserUsageResponse]:
     """
     Retrieves user usages within a specified date range.
@@ -331,15 +893,19 @@ def get_user_usages(db: Session, dbuser: User, start: datetime, end: datetime) -
             used_traffic=0
         )
 
-    cond = and_(NodeUserUsage.user_id == dbuser.id,
-                NodeUserUsage.created_at >= start,
-                NodeUserUsage.created_at <= end)
+    segments = get_usage_segments(db, NodeUserUsage, NodeUserUsageDaily, NodeUserUsageMonthly, start, end)
+    for model, seg_start, seg_end in segments:
+        rows = db.query(model.node_id, func.sum(model.used_traffic)).filter(
+            model.user_id == dbuser.id,
+            model.created_at >= seg_start,
+            model.created_at < seg_end,
+        ).group_by(model.node_id)
 
-    for v in db.query(NodeUserUsage).filter(cond):
-        try:
-            usages[v.node_id or 0].used_traffic += v.used_traffic
-        except KeyError:
-            pass
+        for node_id, used_traffic in rows:
+            try:
+                usages[node_id or 0].used_traffic += int(used_traffic or 0)
+            except KeyError:
+                pass
 
     return list(usages.values())
 
@@ -364,6 +930,39 @@ def get_users_count(db: Session, status: UserStatus = None, admin: Admin = None)
     return query.count()
 
 
+def get_users_status_breakdown(db: Session, admin: Admin = None) -> Dict[UserStatus, int]:
+    """
+    Retrieves the number of users per status with a single GROUP BY query.
+
+    Results are cached per admin for USERS_STATUS_BREAKDOWN_CACHE_TTL seconds.
+
+    Args:
+        db (Session): Database session.
+        admin (Admin, optional): Admin to filter users by.
+
+    Returns:
+        Dict[UserStatus, int]: Count of users for every status, the total is the sum of the values.
+    """
+    ttl = config_module.USERS_STATUS_BREAKDOWN_CACHE_TTL
+    cache_key = ('status_breakdown', admin.id if admin else None)
+    if ttl > 0:
+        breakdown = _get_cached_count(cache_key)
+        if breakdown is not None:
+            return dict(breakdown)
+
+    query = db.query(User.status, func.count(User.id))
+    if admin:
+        query = query.filter(User.admin_id == admin.id)
+
+    breakdown = {status: 0 for status in UserStatus}
+    for status, count in query.group_by(User.status):
+        breakdown[UserStatus(status)] = count
+
+    if ttl > 0:
+        _set_cached_count(cache_key, ttl, breakdown)
+    return dict(breakdown)
+
+
 def create_user(db: Session, user: UserCreate, admin: Admin = None) -> User:
     """
     Creates a new user with provided details.
@@ -410,6 +1009,8 @@ def create_user(db: Session, user: UserCreate, admin: Admin = None) -> User:
     db.add(dbuser)
     db.commit()
     db.refresh(dbuser)
+    user_admin_map.set(dbuser.id, dbuser.admin_id)
+    user_review_queue.mark_changed((dbuser.id,))
     return dbuser
 
 
@@ -426,6 +1027,7 @@ def remove_user(db: Session, dbuser: User) -> User:
     """
     db.delete(dbuser)
     db.commit()
+    user_admin_map.discard(dbuser.id)
     return dbuser
 
 
@@ -440,6 +1042,8 @@ def remove_users(db: Session, dbusers: List[User]):
     for dbuser in dbusers:
         db.delete(dbuser)
     db.commit()
+    for dbuser in dbusers:
+        user_admin_map.discard(dbuser.id)
     return
 
 
@@ -547,6 +1151,7 @@ def update_user(db: Session, dbuser: User, modify: UserModify) -> User:
 
     db.commit()
     db.refresh(dbuser)
+    user_review_queue.mark_changed((dbuser.id,))
     return dbuser
 
 
@@ -569,6 +1174,8 @@ def reset_user_data_usage(db: Session, dbuser: User) -> User:
 
     dbuser.used_traffic = 0
     dbuser.node_usages.clear()
+    dbuser.node_usages_daily.clear()
+    dbuser.node_usages_monthly.clear()
     if dbuser.status not in [UserStatus.expired, UserStatus.disabled]:
         dbuser.status = UserStatus.active.value
 
@@ -579,9 +1186,80 @@ def reset_user_data_usage(db: Session, dbuser: User) -> User:
 
     db.commit()
     db.refresh(dbuser)
+    user_review_queue.mark_changed((dbuser.id,))
     return dbuser
 
 
+def get_users_to_reset_usage(db: Session, now: datetime, reset_strategy_to_days: Dict[str, int]) -> List[Row]:
+    """
+    Retrieves active or limited users whose periodic data usage reset is due.
+
+    The last reset time is the latest usage log of the user (or its creation time)
+    and is computed in SQL with a correlated subquery. Only the columns the reset
+    needs are selected, so the rows stay usable after the reset commits.
+
+    Args:
+        db (Session): Database session.
+        now (datetime): Current UTC time.
+        reset_strategy_to_days (Dict[str, int]): Reset period in days per reset strategy.
+
+    Returns:
+        List[Row]: `(id, username, used_traffic, status)` of the users to reset.
+    """
+    last_reset_at = func.coalesce(
+        select(func.max(UserUsageResetLogs.reset_at)).
+        where(UserUsageResetLogs.user_id == User.id).
+        scalar_subquery(),
+        User.created_at
+    )
+    reset_before = case(
+        {strategy: now - timedelta(days=days) for strategy, days in reset_strategy_to_days.items()},
+        value=User.data_limit_reset_strategy,
+    )
+
+    return db.execute(
+        select(User.id, User.username, User.used_traffic, User.status).
+        where(
+            User.status.in_([UserStatus.active, UserStatus.limited]),
+            User.data_limit_reset_strategy.in_(list(reset_strategy_to_days)),
+            last_reset_at <= reset_before,
+        )
+    ).all()
+
+
+def reset_users_data_usage(db: Session, users: List[Row]) -> None:
+    """
+    Resets the data usage of many users and logs the resets with a few batched statements.
+
+    Args:
+        db (Session): Database session.
+        users (List[Row]): Rows with the `id` and `used_traffic` of the users to reset,
+            as returned by `get_users_to_reset_usage`.
+    """
+    if not users:
+        return
+
+    user_ids = [user.id for user in users]
+    now = datetime.utcnow()
+
+    db.execute(insert(UserUsageResetLogs), [{
+        "user_id": user.id,
+        "used_traffic_at_reset": user.used_traffic,
+        "reset_at": now,
+    } for user in users])
+    for model in (NodeUserUsage, NodeUserUsageDaily, NodeUserUsageMonthly, NextPlan):
+        db.execute(delete(model).where(model.user_id.in_(user_ids)))
+    db.execute(update(User).where(User.id.in_(user_ids)).values(used_traffic=0))
+    db.execute(
+        update(User).
+        where(User.id.in_(user_ids), User.status.notin_([UserStatus.expired, UserStatus.disabled])).
+        values(status=UserStatus.active)
+    )
+
+    db.commit()
+    user_review_queue.mark_changed(user_ids)
+
+
 def reset_user_by_next(db: Session, dbuser: User) -> User:
     """
     Resets the data usage of a user based on next user.
@@ -604,6 +1282,8 @@ def reset_user_by_next(db: Session, dbuser: User) -> User:
     db.add(usage_log)
 
     dbuser.node_usages.clear()
+    dbuser.node_usages_daily.clear()
+    dbuser.node_usages_monthly.clear()
     dbuser.status = UserStatus.active.value
 
     dbuser.data_limit = dbuser.next_plan.data_limit + \
@@ -617,6 +1297,7 @@ def reset_user_by_next(db: Session, dbuser: User) -> User:
 
     db.commit()
     db.refresh(dbuser)
+    user_review_queue.mark_changed((dbuser.id,))
     return dbuser
 
 
@@ -835,16 +1516,20 @@ def reset_all_users_data_usage(db: Session, admin: Optional[Admin] = None):
 
     for dbuser in query.all():
         dbuser.used_traffic = 0
+        dbuser.lifetime_used_traffic = 0
         if dbuser.status not in [UserStatus.on_hold, UserStatus.expired, UserStatus.disabled]:
             dbuser.status = UserStatus.active
         dbuser.usage_logs.clear()
         dbuser.node_usages.clear()
+        dbuser.node_usages_daily.clear()
+        dbuser.node_usages_monthly.clear()
         if dbuser.next_plan:
             db.delete(dbuser.next_plan)
             dbuser.next_plan = None
         db.add(dbuser)
 
     db.commit()
+    user_review_queue.mark_all_changed()
 
 
 def disable_all_active_users(db: Session, admin: Optional[Admin] = None):
@@ -862,6 +1547,7 @@ def disable_all_active_users(db: Session, admin: Optional[Admin] = None):
     query.update({User.status: UserStatus.disabled, User.last_status_change: datetime.utcnow()}, synchronize_session=False)
 
     db.commit()
+    user_review_queue.mark_all_changed()
 
 
 def activate_all_disabled_users(db: Session, admin: Optional[Admin] = None):
@@ -888,6 +1574,7 @@ def activate_all_disabled_users(db: Session, admin: Optional[Admin] = None):
         {User.status: UserStatus.active, User.last_status_change: datetime.utcnow()}, synchronize_session=False)
 
     db.commit()
+    user_review_queue.mark_all_changed()
 
 
 def autodelete_expired_users(db: Session,
@@ -964,19 +1651,22 @@ def get_all_users_usages(
             used_traffic=0
         )
 
-    admin_users = set(user.id for user in get_users(db=db, admins=admin))
-
-    cond = and_(
-        NodeUserUsage.created_at >= start,
-        NodeUserUsage.created_at <= end,
-        NodeUserUsage.user_id.in_(admin_users)
-    )
+    segments = get_usage_segments(db, NodeUserUsage, NodeUserUsageDaily, NodeUserUsageMonthly, start, end)
+    for model, seg_start, seg_end in segments:
+        rows = db.query(model.node_id, func.sum(model.used_traffic)).filter(
+            model.created_at >= seg_start,
+            model.created_at < seg_end,
+        )
+        if admin:
+            rows = rows.filter(model.user_id.in_(
+                select(User.id).where(User.admin.has(Admin.username.in_(admin)))
+            ))
 
-    for v in db.query(NodeUserUsage).filter(cond):
-        try:
-            usages[v.node_id or 0].used_traffic += v.used_traffic
-        except KeyError:
-            pass
+        for node_id, used_traffic in rows.group_by(model.node_id):
+            try:
+                usages[node_id or 0].used_traffic += int(used_traffic or 0)
+            except KeyError:
+                pass
 
     return list(usages.values())
 
@@ -997,6 +1687,7 @@ def update_user_status(db: Session, dbuser: User, status: UserStatus) -> User:
     dbuser.last_status_change = datetime.utcnow()
     db.commit()
     db.refresh(dbuser)
+    user_review_queue.mark_changed((dbuser.id,))
     return dbuser
 
 
@@ -1015,6 +1706,7 @@ def set_owner(db: Session, dbuser: User, admin: Admin) -> User:
     dbuser.admin = admin
     db.commit()
     db.refresh(dbuser)
+    user_admin_map.set(dbuser.id, dbuser.admin_id)
     return dbuser
 
 
@@ -1035,6 +1727,7 @@ def start_user_expire(db: Session, dbuser: User) -> User:
     dbuser.on_hold_timeout = None
     db.commit()
     db.refresh(dbuser)
+    user_review_queue.mark_changed((dbuser.id,))
     return dbuser
 
 
@@ -1182,6 +1875,8 @@ def remove_admin(db: Session, dbadmin: Admin) -> Admin:
     """
     db.delete(dbadmin)
     db.commit()
+    # the users' admin_id is set to NULL by the relationship
+    user_admin_map.drop_admin(dbadmin.id)
     return dbadmin
 
 
@@ -1457,14 +2152,19 @@ def get_nodes_usage(db: Session, start: datetime, end: datetime) -> List[NodeUsa
             downlink=0
         )
 
-    cond = and_(NodeUsage.created_at >= start, NodeUsage.created_at <= end)
+    segments = get_usage_segments(db, NodeUsage, NodeUsageDaily, NodeUsageMonthly, start, end)
+    for model, seg_start, seg_end in segments:
+        rows = db.query(model.node_id, func.sum(model.uplink), func.sum(model.downlink)).filter(
+            model.created_at >= seg_start,
+            model.created_at < seg_end,
+        ).group_by(model.node_id)
 
-    for v in db.query(NodeUsage).filter(cond):
-        try:
-            usages[v.node_id or 0].uplink += v.uplink
-            usages[v.node_id or 0].downlink += v.downlink
-        except KeyError:
-            pass
+        for node_id, uplink, downlink in rows:
+            try:
+                usages[node_id or 0].uplink += int(uplink or 0)
+                usages[node_id or 0].downlink += int(downlink or 0)
+            except KeyError:
+                pass
 
     return list(usages.values())
 
@@ -1633,6 +2333,50 @@ def get_notification_reminder(
     return reminder
 
 
+def get_notification_reminder_keys(
+        db: Session, user_ids: List[int], chunk_size: int = 5000
+) -> Set[Tuple[int, ReminderType, Optional[int]]]:
+    """
+    Loads the live notification reminders of many users at once.
+
+    Args:
+        db (Session): The database session.
+        user_ids (List[int]): The IDs of the users.
+        chunk_size (int): Maximum number of user IDs per query.
+
+    Returns:
+        Set[Tuple[int, ReminderType, Optional[int]]]: (user_id, type, threshold) of every reminder that has not expired.
+    """
+    now = datetime.utcnow()
+    keys = set()
+    for i in range(0, len(user_ids), chunk_size):
+        query = db.query(
+            NotificationReminder.user_id,
+            NotificationReminder.type,
+            NotificationReminder.threshold,
+        ).filter(
+            NotificationReminder.user_id.in_(user_ids[i:i + chunk_size]),
+            or_(NotificationReminder.expires_at.is_(None), NotificationReminder.expires_at >= now),
+        )
+        keys.update((user_id, reminder_type, threshold) for user_id, reminder_type, threshold in query)
+    return keys
+
+
+def create_notification_reminders(db: Session, reminders: List[dict]) -> None:
+    """
+    Creates many notification reminders with a single statement.
+
+    Args:
+        db (Session): The database session.
+        reminders (List[dict]): Rows with `type`, `expires_at`, `user_id` and `threshold` keys.
+    """
+    if not reminders:
+        return
+    now = datetime.utcnow()
+    db.execute(insert(NotificationReminder), [{"created_at": now, **reminder} for reminder in reminders])
+    db.commit()
+
+
 def delete_notification_reminder_by_type(
         db: Session, user_id: int, reminder_type: ReminderType, threshold: Optional[int] = None
 ) -> None:
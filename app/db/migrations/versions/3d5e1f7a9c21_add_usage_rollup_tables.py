@@ -0,0 +1,52 @@
+"""add daily and monthly usage rollup tables
+
+Revision ID: 3d5e1f7a9c21
+Revises: 0b6ef93e6a2c
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3d5e1f7a9c21'
+down_revision = '0b6ef93e6a2c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    for table in ('node_user_usages_daily', 'node_user_usages_monthly'):
+        op.create_table(
+            table,
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=True),
+            sa.Column('node_id', sa.Integer(), nullable=True),
+            sa.Column('used_traffic', sa.BigInteger(), nullable=True),
+            sa.ForeignKeyConstraint(['node_id'], ['nodes.id'], ),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('created_at', 'user_id', 'node_id')
+        )
+
+    for table in ('node_usages_daily', 'node_usages_monthly'):
+        op.create_table(
+            table,
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('node_id', sa.Integer(), nullable=True),
+            sa.Column('uplink', sa.BigInteger(), nullable=True),
+            sa.Column('downlink', sa.BigInteger(), nullable=True),
+            sa.ForeignKeyConstraint(['node_id'], ['nodes.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('created_at', 'node_id')
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('node_usages_monthly')
+    op.drop_table('node_usages_daily')
+    op.drop_table('node_user_usages_monthly')
+    op.drop_table('node_user_usages_daily')
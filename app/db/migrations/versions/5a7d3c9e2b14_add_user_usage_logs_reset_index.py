@@ -0,0 +1,23 @@
+"""add index for the last reset lookup of user usage logs
+
+Revision ID: 5a7d3c9e2b14
+Revises: 8c4b2e6d1f03
+Create Date: 2026-10-17 02:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5a7d3c9e2b14'
+down_revision = '8c4b2e6d1f03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_user_usage_logs_user_id_reset_at', 'user_usage_logs', ['user_id', 'reset_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_usage_logs_user_id_reset_at', table_name='user_usage_logs')
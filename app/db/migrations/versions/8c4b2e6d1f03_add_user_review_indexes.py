@@ -0,0 +1,27 @@
+"""add indexes for the user review job
+
+Revision ID: 8c4b2e6d1f03
+Revises: 3d5e1f7a9c21
+Create Date: 2026-10-17 01:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8c4b2e6d1f03'
+down_revision = '3d5e1f7a9c21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_users_status_expire', 'users', ['status', 'expire'])
+    op.create_index('ix_users_status_data_limit_used_traffic', 'users', ['status', 'data_limit', 'used_traffic'])
+    op.create_index('ix_users_status_on_hold_timeout', 'users', ['status', 'on_hold_timeout'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_status_on_hold_timeout', table_name='users')
+    op.drop_index('ix_users_status_data_limit_used_traffic', table_name='users')
+    op.drop_index('ix_users_status_expire', table_name='users')
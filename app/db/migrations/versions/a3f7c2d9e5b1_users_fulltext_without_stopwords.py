@@ -0,0 +1,49 @@
+"""rebuild the users full-text index without stopwords
+
+Revision ID: a3f7c2d9e5b1
+Revises: e6a9b1c3d7f2
+Create Date: 2026-10-17 06:30:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f7c2d9e5b1'
+down_revision = 'e6a9b1c3d7f2'
+branch_labels = None
+depends_on = None
+
+
+def _has_fulltext_index(bind) -> bool:
+    return bool(bind.exec_driver_sql(
+        "SELECT COUNT(*) FROM information_schema.statistics WHERE table_schema = DATABASE() "
+        "AND table_name = 'users' AND index_name = 'ix_users_fulltext'"
+    ).scalar())
+
+
+def _rebuild_fulltext_index(bind, enable_stopword: bool) -> None:
+    if not _has_fulltext_index(bind):
+        return
+    # InnoDB reads the stopword setting when the index is created and keeps it
+    # for the index, with the ngram parser every token containing a default
+    # stopword ("a", "i", "in", ...) is skipped and MATCH misses those users
+    previous = bind.exec_driver_sql("SELECT @@SESSION.innodb_ft_enable_stopword").scalar()
+    bind.exec_driver_sql(f"SET SESSION innodb_ft_enable_stopword = {int(enable_stopword)}")
+    try:
+        op.execute("ALTER TABLE users DROP INDEX ix_users_fulltext")
+        op.execute("ALTER TABLE users ADD FULLTEXT INDEX ix_users_fulltext (username, note) WITH PARSER ngram")
+    finally:
+        bind.exec_driver_sql(f"SET SESSION innodb_ft_enable_stopword = {int(previous)}")
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == 'mysql' and not bind.dialect.is_mariadb:
+        _rebuild_fulltext_index(bind, enable_stopword=False)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == 'mysql' and not bind.dialect.is_mariadb:
+        _rebuild_fulltext_index(bind, enable_stopword=True)
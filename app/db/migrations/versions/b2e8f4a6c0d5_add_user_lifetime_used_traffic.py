@@ -0,0 +1,49 @@
+"""add lifetime used traffic to users
+
+Revision ID: b2e8f4a6c0d5
+Revises: 5a7d3c9e2b14
+Create Date: 2026-10-17 03:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2e8f4a6c0d5'
+down_revision = '5a7d3c9e2b14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.add_column(
+            sa.Column('lifetime_used_traffic', sa.BigInteger(), nullable=False, server_default='0')
+        )
+
+    users = sa.table(
+        'users',
+        sa.column('id', sa.Integer),
+        sa.column('used_traffic', sa.BigInteger),
+        sa.column('lifetime_used_traffic', sa.BigInteger),
+    )
+    logs = sa.table(
+        'user_usage_logs',
+        sa.column('user_id', sa.Integer),
+        sa.column('used_traffic_at_reset', sa.BigInteger),
+    )
+    reseted_usage = sa.select(
+        sa.func.coalesce(sa.func.sum(logs.c.used_traffic_at_reset), 0)
+    ).where(logs.c.user_id == users.c.id).scalar_subquery()
+
+    op.execute(
+        users.update().values(
+            lifetime_used_traffic=sa.func.coalesce(users.c.used_traffic, 0) + reseted_usage
+        )
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('lifetime_used_traffic')
@@ -0,0 +1,75 @@
+"""add unique keys for master node usage rows
+
+Revision ID: c8e2f6a1d4b9
+Revises: a3f7c2d9e5b1
+Create Date: 2026-10-17 08:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8e2f6a1d4b9'
+down_revision = 'a3f7c2d9e5b1'
+branch_labels = None
+depends_on = None
+
+
+# index name, table, key columns (without node_id), counter columns
+keys = [
+    ('uq_node_user_usages_master', 'node_user_usages', ['created_at', 'user_id'], ['used_traffic']),
+    ('uq_node_usages_master', 'node_usages', ['created_at'], ['uplink', 'downlink']),
+]
+
+
+def _merge_duplicate_master_rows(bind, table_name: str, key_columns: list, counter_columns: list) -> None:
+    # the select/insert/update path could race into duplicate master rows, fold them into one
+    table = sa.table(table_name, *(sa.column(name) for name in ['id', 'node_id'] + key_columns + counter_columns))
+    is_master = table.c.node_id.is_(None)
+    duplicates = bind.execute(
+        sa.select(
+            *(table.c[name] for name in key_columns),
+            sa.func.min(table.c.id),
+            *(sa.func.sum(table.c[name]) for name in counter_columns),
+        ).where(is_master).group_by(*(table.c[name] for name in key_columns)).having(sa.func.count() > 1)
+    ).fetchall()
+
+    for row in duplicates:
+        keys = row[:len(key_columns)]
+        kept_id = row[len(key_columns)]
+        totals = row[len(key_columns) + 1:]
+        same_key = sa.and_(is_master, *(table.c[name] == value for name, value in zip(key_columns, keys)))
+        bind.execute(
+            sa.update(table).where(table.c.id == kept_id).values(dict(zip(counter_columns, totals)))
+        )
+        bind.execute(sa.delete(table).where(same_key, table.c.id != kept_id))
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+
+    for name, table, key_columns, counter_columns in keys:
+        _merge_duplicate_master_rows(bind, table, key_columns, counter_columns)
+
+        if bind.dialect.name == 'mysql':
+            # no partial indexes, a virtual column set only on master rows gives the same key
+            op.add_column(table, sa.Column(
+                'master_key', sa.SmallInteger(), sa.Computed('IF(node_id IS NULL, 1, NULL)', persisted=False)
+            ))
+            op.create_index(name, table, key_columns + ['master_key'], unique=True)
+        else:
+            op.create_index(
+                name, table, key_columns, unique=True,
+                sqlite_where=sa.text('node_id IS NULL'),
+                postgresql_where=sa.text('node_id IS NULL'),
+            )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+
+    for name, table, _, _ in reversed(keys):
+        op.drop_index(name, table_name=table)
+        if bind.dialect.name == 'mysql':
+            op.drop_column(table, 'master_key')
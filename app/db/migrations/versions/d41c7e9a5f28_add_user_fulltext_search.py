@@ -0,0 +1,69 @@
+"""add full-text search index for usernames and notes
+
+Revision ID: d41c7e9a5f28
+Revises: b2e8f4a6c0d5
+Create Date: 2026-10-17 04:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41c7e9a5f28'
+down_revision = 'b2e8f4a6c0d5'
+branch_labels = None
+depends_on = None
+
+
+def _sqlite_supports_trigram(bind) -> bool:
+    # the trigram tokenizer ships with SQLite 3.34+
+    version = bind.exec_driver_sql("SELECT sqlite_version()").scalar()
+    return tuple(int(part) for part in version.split('.')[:2]) >= (3, 34)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+
+    if bind.dialect.name == 'sqlite':
+        if not _sqlite_supports_trigram(bind):
+            return
+        op.execute(
+            "CREATE VIRTUAL TABLE users_fts USING fts5("
+            "username, note, content='users', content_rowid='id', tokenize='trigram')"
+        )
+        op.execute(
+            "CREATE TRIGGER users_fts_ai AFTER INSERT ON users BEGIN "
+            "INSERT INTO users_fts(rowid, username, note) VALUES (new.id, new.username, new.note); "
+            "END"
+        )
+        op.execute(
+            "CREATE TRIGGER users_fts_ad AFTER DELETE ON users BEGIN "
+            "INSERT INTO users_fts(users_fts, rowid, username, note) "
+            "VALUES ('delete', old.id, old.username, old.note); "
+            "END"
+        )
+        op.execute(
+            "CREATE TRIGGER users_fts_au AFTER UPDATE OF username, note ON users BEGIN "
+            "INSERT INTO users_fts(users_fts, rowid, username, note) "
+            "VALUES ('delete', old.id, old.username, old.note); "
+            "INSERT INTO users_fts(rowid, username, note) VALUES (new.id, new.username, new.note); "
+            "END"
+        )
+        op.execute("INSERT INTO users_fts(users_fts) VALUES ('rebuild')")
+
+    elif bind.dialect.name == 'mysql' and not bind.dialect.is_mariadb:
+        # MariaDB has no ngram parser, its user search keeps using LIKE
+        op.execute("ALTER TABLE users ADD FULLTEXT INDEX ix_users_fulltext (username, note) WITH PARSER ngram")
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+
+    if bind.dialect.name == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS users_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS users_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS users_fts_ai")
+        op.execute("DROP TABLE IF EXISTS users_fts")
+
+    elif bind.dialect.name == 'mysql' and not bind.dialect.is_mariadb:
+        op.execute("ALTER TABLE users DROP INDEX ix_users_fulltext")
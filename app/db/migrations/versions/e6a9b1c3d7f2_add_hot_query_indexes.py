@@ -0,0 +1,36 @@
+"""add composite indexes for hot query predicates
+
+Revision ID: e6a9b1c3d7f2
+Revises: d41c7e9a5f28
+Create Date: 2026-10-17 05:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6a9b1c3d7f2'
+down_revision = 'd41c7e9a5f28'
+branch_labels = None
+depends_on = None
+
+
+indexes = [
+    ('ix_users_admin_id_status', 'users', ['admin_id', 'status']),
+    ('ix_users_online_at', 'users', ['online_at']),
+    ('ix_node_user_usages_user_id_created_at', 'node_user_usages', ['user_id', 'created_at']),
+    ('ix_node_user_usages_daily_user_id_created_at', 'node_user_usages_daily', ['user_id', 'created_at']),
+    ('ix_node_user_usages_monthly_user_id_created_at', 'node_user_usages_monthly', ['user_id', 'created_at']),
+    ('ix_user_hwid_devices_last_seen_at', 'user_hwid_devices', ['last_seen_at']),
+    ('ix_notification_reminders_user_id_type_threshold', 'notification_reminders', ['user_id', 'type', 'threshold']),
+]
+
+
+def upgrade() -> None:
+    for name, table, columns in indexes:
+        op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(indexes):
+        op.drop_index(name, table_name=table)
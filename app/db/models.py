@@ -10,15 +10,15 @@ from sqlalchemy import (
     Enum,
     Float,
     ForeignKey,
+    Index,
     Integer,
     String,
     Table,
     UniqueConstraint,
-    func,
 )
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql.expression import select, text
+from sqlalchemy.sql.expression import text
 
 from app import xray
 from app.db.base import Base
@@ -69,13 +69,25 @@ class AppSetting(Base):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # back the limited/expired and on-hold activation lookups of the review job
+        Index("ix_users_status_expire", "status", "expire"),
+        Index("ix_users_status_data_limit_used_traffic", "status", "data_limit", "used_traffic"),
+        Index("ix_users_status_on_hold_timeout", "status", "on_hold_timeout"),
+        Index("ix_users_admin_id_status", "admin_id", "status"),
+        Index("ix_users_online_at", "online_at"),
+    )
 
     id = Column(Integer, primary_key=True)
     username = Column(String(34, collation='NOCASE'), unique=True, index=True)
     proxies = relationship("Proxy", back_populates="user", cascade="all, delete-orphan")
     status = Column(Enum(UserStatus), nullable=False, default=UserStatus.active)
     used_traffic = Column(BigInteger, default=0)
+    # used_traffic plus the usage at every reset, kept current by the usage recorder and resets
+    lifetime_used_traffic = Column(BigInteger, nullable=False, default=0, server_default='0')
     node_usages = relationship("NodeUserUsage", back_populates="user", cascade="all, delete-orphan")
+    node_usages_daily = relationship("NodeUserUsageDaily", back_populates="user", cascade="all, delete-orphan")
+    node_usages_monthly = relationship("NodeUserUsageMonthly", back_populates="user", cascade="all, delete-orphan")
     notification_reminders = relationship("NotificationReminder", back_populates="user", cascade="all, delete-orphan")
     data_limit = Column(BigInteger, nullable=True)
     data_limit_reset_strategy = Column(
@@ -120,22 +132,11 @@ class User(Base):
 
     @hybrid_property
     def reseted_usage(self) -> int:
-        return int(sum([log.used_traffic_at_reset for log in self.usage_logs]))
+        return int((self.lifetime_used_traffic or 0) - (self.used_traffic or 0))
 
     @reseted_usage.expression
     def reseted_usage(cls):
-        return (
-            select(func.sum(UserUsageResetLogs.used_traffic_at_reset)).
-            where(UserUsageResetLogs.user_id == cls.id).
-            label('reseted_usage')
-        )
-
-    @property
-    def lifetime_used_traffic(self) -> int:
-        return int(
-            sum([log.used_traffic_at_reset for log in self.usage_logs])
-            + self.used_traffic
-        )
+        return (cls.lifetime_used_traffic - cls.used_traffic).label('reseted_usage')
 
     @property
     def last_traffic_reset_time(self):
@@ -206,6 +207,9 @@ class UserTemplate(Base):
 
 class UserUsageResetLogs(Base):
     __tablename__ = "user_usage_logs"
+    __table_args__ = (
+        Index("ix_user_usage_logs_user_id_reset_at", "user_id", "reset_at"),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -231,6 +235,7 @@ class UserHwidDevice(Base):
 
     __table_args__ = (
         UniqueConstraint("user_id", "hwid", name="uq_user_hwid_devices_user_hwid"),
+        Index("ix_user_hwid_devices_last_seen_at", "last_seen_at"),
     )
 
 
@@ -347,6 +352,10 @@ class Node(Base):
     downlink = Column(BigInteger, default=0)
     user_usages = relationship("NodeUserUsage", back_populates="node", cascade="all, delete-orphan")
     usages = relationship("NodeUsage", back_populates="node", cascade="all, delete-orphan")
+    user_usages_daily = relationship("NodeUserUsageDaily", back_populates="node", cascade="all, delete-orphan")
+    user_usages_monthly = relationship("NodeUserUsageMonthly", back_populates="node", cascade="all, delete-orphan")
+    usages_daily = relationship("NodeUsageDaily", back_populates="node", cascade="all, delete-orphan")
+    usages_monthly = relationship("NodeUsageMonthly", back_populates="node", cascade="all, delete-orphan")
     usage_coefficient = Column(Float, nullable=False, server_default=text("1.0"), default=1)
 
 
@@ -354,6 +363,12 @@ class NodeUserUsage(Base):
     __tablename__ = "node_user_usages"
     __table_args__ = (
         UniqueConstraint('created_at', 'user_id', 'node_id'),
+        # master rows (NULL node_id) never conflict on the key above; MySQL has no partial
+        # indexes, its migration keys a generated column that is only set on master rows
+        Index("uq_node_user_usages_master", "created_at", "user_id", unique=True,
+              sqlite_where=text("node_id IS NULL"),
+              postgresql_where=text("node_id IS NULL")).ddl_if(dialect=("sqlite", "postgresql")),
+        Index("ix_node_user_usages_user_id_created_at", "user_id", "created_at"),
     )
 
     id = Column(Integer, primary_key=True)
@@ -369,6 +384,9 @@ class NodeUsage(Base):
     __tablename__ = "node_usages"
     __table_args__ = (
         UniqueConstraint('created_at', 'node_id'),
+        Index("uq_node_usages_master", "created_at", unique=True,
+              sqlite_where=text("node_id IS NULL"),
+              postgresql_where=text("node_id IS NULL")).ddl_if(dialect=("sqlite", "postgresql")),
     )
 
     id = Column(Integer, primary_key=True)
@@ -379,8 +397,71 @@ class NodeUsage(Base):
     downlink = Column(BigInteger, default=0)
 
 
+class NodeUserUsageDaily(Base):
+    __tablename__ = "node_user_usages_daily"
+    __table_args__ = (
+        UniqueConstraint('created_at', 'user_id', 'node_id'),
+        Index("ix_node_user_usages_daily_user_id_created_at", "user_id", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, unique=False, nullable=False)  # one day per record
+    user_id = Column(Integer, ForeignKey("users.id"))
+    user = relationship("User", back_populates="node_usages_daily")
+    node_id = Column(Integer, ForeignKey("nodes.id"))
+    node = relationship("Node", back_populates="user_usages_daily")
+    used_traffic = Column(BigInteger, default=0)
+
+
+class NodeUserUsageMonthly(Base):
+    __tablename__ = "node_user_usages_monthly"
+    __table_args__ = (
+        UniqueConstraint('created_at', 'user_id', 'node_id'),
+        Index("ix_node_user_usages_monthly_user_id_created_at", "user_id", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, unique=False, nullable=False)  # one month per record
+    user_id = Column(Integer, ForeignKey("users.id"))
+    user = relationship("User", back_populates="node_usages_monthly")
+    node_id = Column(Integer, ForeignKey("nodes.id"))
+    node = relationship("Node", back_populates="user_usages_monthly")
+    used_traffic = Column(BigInteger, default=0)
+
+
+class NodeUsageDaily(Base):
+    __tablename__ = "node_usages_daily"
+    __table_args__ = (
+        UniqueConstraint('created_at', 'node_id'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, unique=False, nullable=False)  # one day per record
+    node_id = Column(Integer, ForeignKey("nodes.id"))
+    node = relationship("Node", back_populates="usages_daily")
+    uplink = Column(BigInteger, default=0)
+    downlink = Column(BigInteger, default=0)
+
+
+class NodeUsageMonthly(Base):
+    __tablename__ = "node_usages_monthly"
+    __table_args__ = (
+        UniqueConstraint('created_at', 'node_id'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, unique=False, nullable=False)  # one month per record
+    node_id = Column(Integer, ForeignKey("nodes.id"))
+    node = relationship("Node", back_populates="usages_monthly")
+    uplink = Column(BigInteger, default=0)
+    downlink = Column(BigInteger, default=0)
+
+
 class NotificationReminder(Base):
     __tablename__ = "notification_reminders"
+    __table_args__ = (
+        Index("ix_notification_reminders_user_id_type_threshold", "user_id", "type", "threshold"),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"))
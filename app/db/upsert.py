@@ -0,0 +1,59 @@
+"""
+Dialect-aware upsert statements for counters keyed by a unique constraint.
+"""
+
+from typing import Iterable, Optional
+
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import Insert
+
+
+def build_increment_upsert(db: Session,
+                           model,
+                           index_elements: Iterable[str],
+                           increment_columns: Iterable[str],
+                           index_where=None) -> Optional[Insert]:
+    """
+    Builds an INSERT that adds the given columns onto the existing row when
+    the unique key in `index_elements` already exists.
+
+    MySQL/MariaDB use `ON DUPLICATE KEY UPDATE`, SQLite and PostgreSQL use
+    `ON CONFLICT (...) DO UPDATE`. The statement is meant to be executed with
+    a list of parameter dicts keyed by column name.
+
+    Args:
+        db (Session): Database session, used to pick the dialect.
+        model: Declarative model whose table is targeted.
+        index_elements (Iterable[str]): Columns of the unique constraint.
+        increment_columns (Iterable[str]): Columns to add to on conflict.
+        index_where: Predicate of a partial unique index in `index_elements`
+            (SQLite and PostgreSQL, MySQL matches any unique key).
+
+    Returns:
+        Optional[Insert]: The upsert statement, or None if the dialect has no upsert support.
+    """
+    table = model.__table__
+    dialect = db.bind.dialect.name
+
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+
+        stmt = insert(table)
+        return stmt.on_duplicate_key_update({
+            col: table.c[col] + stmt.inserted[col] for col in increment_columns
+        })
+
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+
+        stmt = insert(table)
+        return stmt.on_conflict_do_update(
+            index_elements=list(index_elements),
+            index_where=index_where,
+            set_={col: table.c[col] + stmt.excluded[col] for col in increment_columns}
+        )
+
+    return None
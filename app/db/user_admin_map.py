@@ -0,0 +1,104 @@
+import threading
+from array import array
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from app.db.models import User
+
+
+class UserAdminMap:
+    """
+    Process-wide `user id -> admin id` lookup used to attribute traffic to admins.
+
+    User ids are dense auto-increment integers, so the mapping is kept in a flat
+    array indexed by user id where 0 means "no admin". It is loaded from the
+    database once and then kept current by the crud functions that create,
+    delete or re-own users.
+    """
+
+    def __init__(self):
+        self._admins = array('i')
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(1 for admin_id in self._admins if admin_id)
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def get(self, user_id: int) -> Optional[int]:
+        if not self._loaded:
+            self.load()
+        if 0 <= user_id < len(self._admins):
+            return self._admins[user_id] or None
+        return None
+
+    def set(self, user_id: int, admin_id: Optional[int]):
+        if not self._loaded:
+            return
+        with self._lock:
+            if user_id >= len(self._admins):
+                self._admins.extend([0] * (user_id + 1 - len(self._admins)))
+            self._admins[user_id] = admin_id or 0
+
+    def discard(self, user_id: int):
+        if not self._loaded:
+            return
+        with self._lock:
+            if 0 <= user_id < len(self._admins):
+                self._admins[user_id] = 0
+
+    def drop_admin(self, admin_id: int):
+        if not self._loaded:
+            return
+        with self._lock:
+            for user_id, current in enumerate(self._admins):
+                if current == admin_id:
+                    self._admins[user_id] = 0
+
+    def load(self, db: Optional[Session] = None):
+        if db is None:
+            from app.db import GetDB
+
+            with GetDB() as db:
+                return self.load(db)
+
+        admins = self._fetch(db)
+        with self._lock:
+            self._admins = admins
+            self._loaded = True
+
+    def check(self, db: Session) -> int:
+        """
+        Compares the cached mapping against the database and replaces it on drift.
+
+        Returns:
+            int: Number of user ids whose cached admin was wrong.
+        """
+        admins = self._fetch(db)
+        with self._lock:
+            current = self._admins
+            size = max(len(current), len(admins))
+            mismatches = sum(
+                1 for user_id in range(size)
+                if (current[user_id] if user_id < len(current) else 0)
+                != (admins[user_id] if user_id < len(admins) else 0)
+            ) if self._loaded else 0
+            self._admins = admins
+            self._loaded = True
+        return mismatches
+
+    @staticmethod
+    def _fetch(db: Session) -> array:
+        admins = array('i')
+        for user_id, admin_id in db.query(User.id, User.admin_id).order_by(User.id).yield_per(10000):
+            if user_id >= len(admins):
+                admins.extend([0] * (user_id + 1 - len(admins)))
+            admins[user_id] = admin_id or 0
+        return admins
+
+
+user_admin_map = UserAdminMap()
@@ -0,0 +1,102 @@
+import heapq
+import threading
+from datetime import datetime
+from typing import Iterable, List, Set, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.db.models import User
+from app.models.user import UserStatus
+from app.utils.helpers import expiration_days_reached_at
+
+
+class UserReviewQueue:
+    """
+    Process-wide set of user ids the review job has to look at on its next tick.
+
+    The usage recorder marks users whose traffic changed and the crud functions
+    mark users whose limits were edited. Time based transitions (expiration,
+    on-hold timeout and expiration reminders) are kept in a min-heap keyed on
+    the timestamp they become due. Heap entries are never removed on edit; a
+    stale entry only causes one extra (cheap) review of that user.
+    """
+
+    def __init__(self):
+        self._changed: Set[int] = set()
+        self._timers: List[Tuple[float, int]] = []
+        self._scheduled: Set[Tuple[float, int]] = set()
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def mark_changed(self, user_ids: Iterable[int]):
+        with self._lock:
+            self._changed.update(user_ids)
+
+    def mark_all_changed(self):
+        """Makes the next review scan every user and rebuild the timers, for bulk edits."""
+        with self._lock:
+            self._loaded = False
+
+    def schedule(self, user: User, now_ts: float, remind_days: Iterable[int] = ()):
+        timers = self._user_timers(user, now_ts, remind_days)
+        if not timers:
+            return
+        with self._lock:
+            for timer in timers:
+                if timer not in self._scheduled:
+                    self._scheduled.add(timer)
+                    heapq.heappush(self._timers, timer)
+
+    def take(self, now_ts: float) -> Set[int]:
+        """
+        Returns the changed user ids and those with a timer due at `now_ts`, and forgets them.
+        """
+        with self._lock:
+            user_ids, self._changed = self._changed, set()
+            while self._timers and self._timers[0][0] <= now_ts:
+                timer = heapq.heappop(self._timers)
+                self._scheduled.discard(timer)
+                user_ids.add(timer[1])
+        return user_ids
+
+    def load(self, db: Session, now_ts: float, remind_days: Iterable[int] = ()):
+        """
+        Rebuilds the timer heap from the database, dropping stale entries.
+
+        Only timers after `now_ts` are kept, the caller reviews everything up to it.
+        """
+        remind_days = list(remind_days)
+        timers = []
+        query = db.query(User.id, User.status, User.expire, User.on_hold_timeout).filter(
+            User.status.in_([UserStatus.active, UserStatus.on_hold]),
+            or_(User.expire.isnot(None), User.on_hold_timeout.isnot(None)),
+        )
+        for user in query.yield_per(10000):
+            timers.extend(self._user_timers(user, now_ts, remind_days))
+        timers = list(set(timers))
+        heapq.heapify(timers)
+
+        with self._lock:
+            self._timers = timers
+            self._scheduled = set(timers)
+            self._loaded = True
+
+    @staticmethod
+    def _user_timers(user, now_ts: float, remind_days: Iterable[int]) -> List[Tuple[float, int]]:
+        timers = []
+        if user.status == UserStatus.active and user.expire:
+            timers.append((user.expire, user.id))
+            timers.extend((expiration_days_reached_at(user.expire, days), user.id) for days in remind_days)
+        elif user.status == UserStatus.on_hold and user.on_hold_timeout:
+            timers.append((datetime.timestamp(user.on_hold_timeout), user.id))
+        # due timers were handled by the review that scheduled them
+        return [timer for timer in timers if timer[0] > now_ts]
+
+
+user_review_queue = UserReviewQueue()
+
@@ -8,6 +8,19 @@ import config as config_module
 from xray_api import exc as xray_exc
 
 
+def probe_nodes(apis: dict) -> dict:
+    if config_module.JOB_STATS_ASYNC_COLLECTOR:
+        return xray.collector.get_sys_stats(apis, timeout=2)
+
+    results = {}
+    for node_id, api in apis.items():
+        try:
+            results[node_id] = api.get_sys_stats(timeout=2)
+        except xray_exc.XrayError as exc:
+            results[node_id] = exc
+    return results
+
+
 def core_health_check():
     config = None
 
@@ -18,6 +31,8 @@ def core_health_check():
         xray.core.restart(config)
 
     # nodes' core
+    failures = {}
+    node_apis = {}
     for node_id, node in list(xray.nodes.items()):
         error_message = None
         try:
@@ -29,19 +44,9 @@ def core_health_check():
         if node_connected:
             try:
                 assert node.started
-                node.api.get_sys_stats(timeout=2)
-                xray.operations.mark_node_connected(node_id)
+                node_apis[node_id] = node.api
             except (ConnectionError, xray_exc.XrayError, AssertionError) as exc:
-                failure_count = xray.operations.mark_node_error(node_id, str(exc))
-                if failure_count < 2:
-                    continue
-                if not config:
-                    config = xray.config.include_db_users()
-                xray.operations.restart_node(
-                    node_id,
-                    config,
-                    reason=f"Health check failed: {exc}",
-                )
+                failures[node_id] = exc
         else:
             xray.operations.mark_node_error(node_id, error_message or "Node ping failed")
             if not config:
@@ -51,6 +56,25 @@ def core_health_check():
             else:
                 xray.operations.connect_node(node_id, config)
 
+    # ping every started node's api at once
+    for node_id, result in probe_nodes(node_apis).items():
+        if isinstance(result, Exception):
+            failures[node_id] = result
+        else:
+            xray.operations.mark_node_connected(node_id)
+
+    for node_id, exc in failures.items():
+        failure_count = xray.operations.mark_node_error(node_id, str(exc))
+        if failure_count < 2:
+            continue
+        if not config:
+            config = xray.config.include_db_users()
+        xray.operations.restart_node(
+            node_id,
+            config,
+            reason=f"Health check failed: {exc}",
+        )
+
 
 @app.on_event("startup")
 def start_core():
@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+
+from app import logger, scheduler
+from app.db import GetDB, crud
+from config import (
+    JOB_FLUSH_USER_USAGES_INTERVAL,
+    USER_USAGES_RETENTION_CHUNK_SIZE,
+    USER_USAGES_RETENTION_DAYS,
+    USER_USAGES_RETENTION_REQUIRE_ROLLUP,
+)
+
+
+def compact_usages():
+    # buffered usages may still land in the last hour(s) until the next flush
+    closed_before = datetime.utcnow() - timedelta(hours=1, seconds=max(JOB_FLUSH_USER_USAGES_INTERVAL, 0))
+    with GetDB() as db:
+        days, months = crud.compact_usages(db, closed_before)
+
+    if days or months:
+        logger.info(f"Compacted usages into {days} daily and {months} monthly rollups")
+
+    # pruning runs right after compaction so freshly folded hours can go in the same pass
+    if USER_USAGES_RETENTION_DAYS > 0:
+        prune_user_usages()
+
+
+def prune_user_usages():
+    before = datetime.utcnow() - timedelta(days=USER_USAGES_RETENTION_DAYS)
+    with GetDB() as db:
+        deleted, reclaimed = crud.prune_user_usages(
+            db,
+            before,
+            require_rollup=USER_USAGES_RETENTION_REQUIRE_ROLLUP,
+            chunk_size=max(USER_USAGES_RETENTION_CHUNK_SIZE, 1),
+        )
+
+    if deleted:
+        reclaimed_text = f"{reclaimed} bytes" if reclaimed is not None else "unknown bytes"
+        logger.info(f"Pruned {deleted} hourly user usages older than {before}, reclaimed {reclaimed_text}")
+
+
+scheduler.add_job(compact_usages, 'interval', coalesce=True, hours=1, max_instances=1)
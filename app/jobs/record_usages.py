@@ -1,19 +1,25 @@
 from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime
 from operator import attrgetter
 import time
-from typing import Union
+from typing import Optional, Union
 
 from pymysql.err import OperationalError
 from sqlalchemy import and_, bindparam, insert, select, update
+from sqlalchemy.dialects.mysql import Insert as MySQLInsert
 from sqlalchemy.exc import OperationalError as SAOperationalError
 from sqlalchemy.orm import Session
 from sqlalchemy.sql.dml import Insert
 
-from app import logger, scheduler, xray
-from app.db import GetDB
+from app import app, logger, scheduler, xray
+from app.db import GetDB, crud
 from app.db.models import Admin, NodeUsage, NodeUserUsage, System, User
+from app.db.upsert import build_increment_upsert
+from app.db.user_admin_map import user_admin_map
+from app.db.user_review_queue import user_review_queue
+from app.utils.usage_buffer import UsageAccumulator, UsageBatch, UsageBuckets, merge_usage_buckets
 import config as config_module
 from xray_api import XRay as XRayAPI
 from xray_api import exc as xray_exc
@@ -32,16 +38,26 @@ def _is_deadlock_error(err: Exception) -> bool:
 
 
 def safe_execute(db: Session, stmt, params=None):
+    safe_execute_all(db, [(stmt, params)])
+
+
+def safe_execute_all(db: Session, statements: list[tuple]):
+    """Runs every `(stmt, params)` pair in a single transaction."""
     if db.bind.name == 'mysql':
-        if isinstance(stmt, Insert):
-            stmt = stmt.prefix_with('IGNORE')
+        # upserts already handle duplicates with ON DUPLICATE KEY UPDATE
+        statements = [
+            (stmt.prefix_with('IGNORE') if isinstance(stmt, Insert) and not isinstance(stmt, MySQLInsert) else stmt,
+             params)
+            for stmt, params in statements
+        ]
 
         tries = 0
         max_retries = 5
         done = False
         while not done:
             try:
-                db.connection().execute(stmt, params)
+                for stmt, params in statements:
+                    db.connection().execute(stmt, params)
                 db.commit()
                 done = True
             except (OperationalError, SAOperationalError) as err:
@@ -53,38 +69,83 @@ def safe_execute(db: Session, stmt, params=None):
                 raise err
 
     else:
-        db.connection().execute(stmt, params)
+        for stmt, params in statements:
+            db.connection().execute(stmt, params)
         db.commit()
 
 
-def run_recording_tasks(tasks: list[tuple], max_workers: int) -> None:
+def run_recording_tasks(tasks: list[tuple], max_workers: int) -> list[tuple]:
+    """Runs the recording tasks and returns the ones that failed."""
     if not tasks:
-        return
+        return []
 
+    failed = []
     if max_workers is None or max_workers <= 1 or len(tasks) == 1:
-        for func, *args in tasks:
-            func(*args)
-        return
+        for task in tasks:
+            func, *args = task
+            try:
+                func(*args)
+            except Exception as exc:
+                logger.warning(f"Usage recording task failed: {exc}")
+                failed.append(task)
+        return failed
 
     with ThreadPoolExecutor(max_workers=min(max_workers, len(tasks))) as executor:
-        futures = [executor.submit(func, *args) for func, *args in tasks]
-        for future in futures:
+        futures = [(task, executor.submit(*task)) for task in tasks]
+        for task, future in futures:
             try:
                 future.result()
             except Exception as exc:
                 logger.warning(f"Usage recording task failed: {exc}")
+                failed.append(task)
+    return failed
+
+
+def current_usage_hour() -> datetime:
+    return datetime.fromisoformat(
+        datetime.utcnow().strftime('%Y-%m-%dT%H:00:00'))
 
 
 def record_user_stats(params: list,
                       node_id: Union[int, None],
-                      consumption_factor: int = 1):
+                      consumption_factor: int = 1,
+                      created_at: Optional[datetime] = None):
     if not params:
         return
 
-    created_at = datetime.fromisoformat(
-        datetime.utcnow().strftime('%Y-%m-%dT%H:00:00'))
+    created_at = created_at or current_usage_hour()
+    # a past hour (retried or replayed from the spool) may already be compacted
+    late = created_at < current_usage_hour()
 
+    with crud.usage_rollup_lock if late else nullcontext():
+        _record_user_stats(params, node_id, consumption_factor, created_at)
+        if late:
+            with GetDB() as db:
+                crud.add_late_usages_to_rollups(db, NodeUserUsage, created_at, [{
+                    'user_id': int(p['uid']),
+                    'node_id': node_id,
+                    'used_traffic': int(p['value'] * consumption_factor),
+                } for p in params])
+
+
+def _record_user_stats(params: list, node_id: Union[int, None], consumption_factor: int, created_at: datetime):
     with GetDB() as db:
+        # NULL node_id (master) never conflicts on the unique key, it has a partial key of its own
+        upsert_stmt = build_increment_upsert(
+            db, NodeUserUsage, ('created_at', 'user_id', 'node_id'), ('used_traffic',)
+        ) if node_id is not None else build_increment_upsert(
+            db, NodeUserUsage, ('created_at', 'user_id'), ('used_traffic',),
+            index_where=NodeUserUsage.node_id.is_(None)
+        )
+        if upsert_stmt is not None:
+            safe_execute(db, upsert_stmt, [{
+                'created_at': created_at,
+                'user_id': int(p['uid']),
+                'node_id': node_id,
+                'used_traffic': int(p['value'] * consumption_factor),
+            } for p in params])
+            return
+
         # make user usage row if doesn't exist
         select_stmt = select(NodeUserUsage.user_id) \
             .where(and_(NodeUserUsage.node_id == node_id, NodeUserUsage.created_at == created_at))
@@ -117,10 +178,23 @@ def record_node_stats(params: dict, node_id: Union[int, None]):
     if not params:
         return
 
-    created_at = datetime.fromisoformat(
-        datetime.utcnow().strftime('%Y-%m-%dT%H:00:00'))
+    created_at = current_usage_hour()
 
     with GetDB() as db:
+        upsert_stmt = build_increment_upsert(
+            db, NodeUsage, ('created_at', 'node_id'), ('uplink', 'downlink')
+        ) if node_id is not None else build_increment_upsert(
+            db, NodeUsage, ('created_at',), ('uplink', 'downlink'),
+            index_where=NodeUsage.node_id.is_(None)
+        )
+        if upsert_stmt is not None:
+            safe_execute(db, upsert_stmt, {
+                'created_at': created_at,
+                'node_id': node_id,
+                'uplink': sum(p['up'] for p in params),
+                'downlink': sum(p['down'] for p in params),
+            })
+            return
 
         # make node usage row if doesn't exist
         select_stmt = select(NodeUsage.node_id). \
@@ -141,141 +215,236 @@ def record_node_stats(params: dict, node_id: Union[int, None]):
         safe_execute(db, stmt, params)
 
 
-def get_users_stats(api: XRayAPI):
-    try:
-        params = defaultdict(int)
-        for stat in filter(attrgetter('value'),
-                           api.get_users_stats(reset=True, timeout=30)):
-            params[stat.name.split('.', 1)[0]] += stat.value
-        params = list({
-            "uid": uid,
-            "value": value
-        } for uid, value in params.items())
-        return params
-    except xray_exc.XrayError:
-        return []
+def parse_users_stats(stats) -> list:
+    params = defaultdict(int)
+    for stat in filter(attrgetter('value'), stats):
+        params[stat.name.split('.', 1)[0]] += stat.value
+    return list({
+        "uid": uid,
+        "value": value
+    } for uid, value in params.items())
 
 
-def get_outbounds_stats(api: XRayAPI):
-    try:
-        params = [{
-            "up": stat.value,
-            "down": 0
-        } if stat.link == "uplink" else {
-            "up": 0,
-            "down": stat.value
-        } for stat in filter(attrgetter('value'),
-                             api.get_outbounds_stats(reset=True, timeout=10))]
-        return params
-    except xray_exc.XrayError:
-        return []
+def parse_outbounds_stats(stats) -> list:
+    return [{
+        "up": stat.value,
+        "down": 0
+    } if stat.link == "uplink" else {
+        "up": 0,
+        "down": stat.value
+    } for stat in filter(attrgetter('value'), stats)]
 
 
-def record_user_usages():
-    api_instances = {None: xray.api}
-    usage_coefficient = {
-        None: 1
-    }  # default usage coefficient for the main api instance
+def parse_stats_snapshot(snapshot) -> tuple:
+    users = defaultdict(int)
+    for email, value in zip(snapshot.user_emails, snapshot.user_traffic):
+        users[email.split('.', 1)[0]] += value
+    users_params = [{"uid": uid, "value": value} for uid, value in users.items()]
 
-    for node_id, node in xray.operations.get_healthy_nodes():
-        try:
-            if not node.connected:
-                continue
-            api_instances[node_id] = node.api
-            usage_coefficient[
-                node_id] = node.usage_coefficient  # fetch the usage coefficient
-        except Exception as exc:
-            logger.warning(f"Skipping node {node_id} usage collection: {exc}")
+    outbounds_params = []
+    if snapshot.outbound_uplink or snapshot.outbound_downlink:
+        outbounds_params.append({"up": snapshot.outbound_uplink, "down": snapshot.outbound_downlink})
+    return users_params, outbounds_params
+
+
+def fetch_and_parse(api: XRayAPI, fetch, parse, timeout: int, empty):
+    try:
+        return parse(fetch(api, timeout))
+    except xray_exc.XrayError:
+        return empty
+
+
+def collect_stats(api_instances: dict, timeout: int, fetch, parse, empty) -> dict:
+    """
+    Runs `fetch(api, timeout)` against every api instance and parses its result.
+
+    `fetch` is called with an `XRayAPI` or, with the async collector, an `AsyncXRay`,
+    so it must only use methods both provide. A node that fails or misses its
+    deadline contributes `empty`.
+    """
+    if config_module.JOB_STATS_ASYNC_COLLECTOR:
+        results = xray.collector.fan_out(api_instances, lambda client: fetch(client, timeout), timeout)
+        api_params = {}
+        for node_id, result in results.items():
+            if isinstance(result, Exception):
+                logger.warning(f"Failed to collect stats from node {node_id}: {result}")
+                api_params[node_id] = empty
+            else:
+                api_params[node_id] = parse(result)
+        return api_params
 
     with ThreadPoolExecutor(
             max_workers=config_module.JOB_RECORD_USER_USAGES_WORKERS) as executor:
         futures = {
-            node_id: executor.submit(get_users_stats, api)
+            node_id: executor.submit(fetch_and_parse, api, fetch, parse, timeout, empty)
             for node_id, api in api_instances.items()
         }
-    api_params = {
+    return {
         node_id: future.result()
         for node_id, future in futures.items()
     }
 
+
+usage_accumulator = UsageAccumulator(config_module.USER_USAGES_SPOOL_PATH)
+
+
+def store_user_usages(buckets: UsageBuckets):
+    """Adds the usages to the users and their admins in a single transaction."""
     users_usage = defaultdict(int)
-    for node_id, params in api_params.items():
-        coefficient = usage_coefficient.get(
-            node_id, 1)  # get the usage coefficient for the node
-        for param in params:
-            users_usage[param['uid']] += int(
-                param['value'] * coefficient)  # apply the usage coefficient
+    for values in buckets.values():
+        for uid, value in values.items():
+            users_usage[uid] += value
     users_usage = list({
         "uid": uid,
         "value": value
-    } for uid, value in users_usage.items())
+    } for uid, value in users_usage.items() if value)
     if not users_usage:
         return
 
-    with GetDB() as db:
-        user_admin_map = dict(db.query(User.id, User.admin_id).all())
-
     admin_usage = defaultdict(int)
     for user_usage in users_usage:
         admin_id = user_admin_map.get(int(user_usage["uid"]))
         if admin_id:
             admin_usage[admin_id] += user_usage["value"]
 
-    # record users usage
     with GetDB() as db:
-        stmt = update(User). \
-            where(User.id == bindparam('uid')). \
+        statements = [(
+            update(User).
+            where(User.id == bindparam('uid')).
             values(
                 used_traffic=User.used_traffic + bindparam('value'),
+                lifetime_used_traffic=User.lifetime_used_traffic + bindparam('value'),
                 online_at=datetime.utcnow()
-        )
-
-        safe_execute(db, stmt, users_usage)
+            ),
+            users_usage
+        )]
 
         admin_data = [{
             "admin_id": admin_id,
             "value": value
         } for admin_id, value in admin_usage.items()]
         if admin_data:
-            admin_update_stmt = update(Admin). \
-                where(Admin.id == bindparam('admin_id')). \
-                values(users_usage=Admin.users_usage + bindparam('value'))
-            safe_execute(db, admin_update_stmt, admin_data)
+            statements.append((
+                update(Admin).
+                where(Admin.id == bindparam('admin_id')).
+                values(users_usage=Admin.users_usage + bindparam('value')),
+                admin_data
+            ))
+
+        # users and admins commit together, so a failed batch can be retried as a whole
+        safe_execute_all(db, statements)
 
+    # hand the changed users to the review job instead of it scanning everyone
+    user_review_queue.mark_changed(int(user_usage["uid"]) for user_usage in users_usage)
+
+
+def store_node_user_usages(buckets: UsageBuckets) -> UsageBuckets:
+    """Records the per node usages and returns the buckets that could not be written."""
     if config_module.DISABLE_RECORDING_NODE_USAGE:
-        return
+        return {}
 
     recording_tasks = [
-        (record_user_stats, params, node_id, usage_coefficient[node_id])
-        for node_id, params in api_params.items()
+        (record_user_stats,
+         [{"uid": uid, "value": value} for uid, value in values.items() if value],
+         node_id, 1, created_at)
+        for (node_id, created_at), values in buckets.items()
     ]
-    run_recording_tasks(
+    failed = run_recording_tasks(
         recording_tasks,
         config_module.JOB_RECORD_USER_USAGES_WORKERS
     )
+    return {
+        (node_id, created_at): buckets[(node_id, created_at)]
+        for _, _, node_id, _, created_at in failed
+    }
 
 
-def record_node_usages():
+def flush_user_usages():
+    """
+    Writes the accumulated usages to the database.
+
+    The user and admin totals are written first, in one transaction, and the
+    spooled deltas are dropped as soon as it commits. Per node rows that fail
+    after that are kept in memory and retried with the next flush, so the
+    totals are never applied twice for the same delta. A crash between the
+    commit and the removal of the spool replays the batch on startup, so the
+    totals are recorded at least once rather than exactly once.
+    """
+    batch: UsageBatch = usage_accumulator.take()
+    if not batch:
+        usage_accumulator.commit(batch)
+        return
+
+    try:
+        store_user_usages(batch.buckets)
+    except Exception as exc:
+        usage_accumulator.restore(batch)
+        logger.warning(f"Failed to flush {len(usage_accumulator)} pending user usages, will retry: {exc}")
+        return
+
+    usage_accumulator.commit(batch)
+
+    failed = store_node_user_usages(merge_usage_buckets(batch.buckets, batch.node_buckets))
+    if failed:
+        usage_accumulator.defer_node_usages(failed)
+
+
+def get_usage_api_instances() -> tuple:
     api_instances = {None: xray.api}
+    usage_coefficient = {
+        None: 1
+    }  # default usage coefficient for the main api instance
+
     for node_id, node in xray.operations.get_healthy_nodes():
         try:
             if not node.connected:
                 continue
             api_instances[node_id] = node.api
+            usage_coefficient[
+                node_id] = node.usage_coefficient  # fetch the usage coefficient
         except Exception as exc:
-            logger.warning(f"Skipping node {node_id} outbound usage collection: {exc}")
+            logger.warning(f"Skipping node {node_id} usage collection: {exc}")
 
-    with ThreadPoolExecutor(
-            max_workers=config_module.JOB_RECORD_USER_USAGES_WORKERS) as executor:
-        futures = {
-            node_id: executor.submit(get_outbounds_stats, api)
-            for node_id, api in api_instances.items()
+    return api_instances, usage_coefficient
+
+
+def record_users_params(api_params: dict, usage_coefficient: dict):
+    created_at = current_usage_hour()
+    nodes_usage = {}
+    for node_id, params in api_params.items():
+        coefficient = usage_coefficient.get(
+            node_id, 1)  # get the usage coefficient for the node
+        nodes_usage[node_id] = {
+            int(param['uid']): int(param['value'] * coefficient)  # apply the usage coefficient
+            for param in params
         }
-    api_params = {
-        node_id: future.result()
-        for node_id, future in futures.items()
-    }
 
+    # the counters are already reset in Xray, the spool keeps the deltas until they are stored
+    usage_accumulator.add(created_at, nodes_usage)
+    if (config_module.JOB_FLUSH_USER_USAGES_INTERVAL > 0
+            and len(usage_accumulator) < config_module.USER_USAGES_FLUSH_THRESHOLD):
+        return
+    flush_user_usages()
+
+
+def record_user_usages():
+    api_instances, usage_coefficient = get_usage_api_instances()
+    api_params = collect_stats(
+        api_instances, 30,
+        lambda api, timeout: api.get_users_stats(reset=True, timeout=timeout),
+        parse_users_stats, []
+    )
+    record_users_params(api_params, usage_coefficient)
+
+
+def check_user_admin_map():
+    with GetDB() as db:
+        mismatches = user_admin_map.check(db)
+    if mismatches:
+        logger.warning(f"User admin map was out of sync for {mismatches} users, reloaded")
+
+
+def record_outbounds_params(api_params: dict):
     total_up = 0
     total_down = 0
     for node_id, params in api_params.items():
@@ -304,13 +473,66 @@ def record_node_usages():
     )
 
 
-scheduler.add_job(record_user_usages,
-                  'interval',
-                  seconds=config_module.JOB_RECORD_USER_USAGES_INTERVAL,
-                  coalesce=True,
-                  max_instances=config_module.JOB_RECORD_USER_USAGES_MAX_INSTANCES)
-scheduler.add_job(record_node_usages,
+def record_node_usages():
+    api_instances, _ = get_usage_api_instances()
+    api_params = collect_stats(
+        api_instances, 10,
+        lambda api, timeout: api.get_outbounds_stats(reset=True, timeout=timeout),
+        parse_outbounds_stats, []
+    )
+    record_outbounds_params(api_params)
+
+
+def record_usages():
+    """Feeds both the user and node usage recorders from one stats snapshot per node."""
+    api_instances, usage_coefficient = get_usage_api_instances()
+    snapshots = collect_stats(
+        api_instances, 30,
+        lambda api, timeout: api.get_stats_snapshot(reset=True, timeout=timeout),
+        parse_stats_snapshot, ([], [])
+    )
+    # the counters are already reset, so a failed node usage write must not cost the user deltas
+    try:
+        record_users_params({node_id: users for node_id, (users, _) in snapshots.items()}, usage_coefficient)
+    finally:
+        try:
+            record_outbounds_params({node_id: outbounds for node_id, (_, outbounds) in snapshots.items()})
+        except Exception as exc:
+            logger.error(f"Failed to record node usages: {exc}")
+
+
+if config_module.JOB_RECORD_USAGES_COMBINED:
+    scheduler.add_job(record_usages,
+                      'interval',
+                      seconds=config_module.JOB_RECORD_USER_USAGES_INTERVAL,
+                      coalesce=True,
+                      max_instances=config_module.JOB_RECORD_USER_USAGES_MAX_INSTANCES)
+else:
+    scheduler.add_job(record_user_usages,
+                      'interval',
+                      seconds=config_module.JOB_RECORD_USER_USAGES_INTERVAL,
+                      coalesce=True,
+                      max_instances=config_module.JOB_RECORD_USER_USAGES_MAX_INSTANCES)
+    scheduler.add_job(record_node_usages,
+                      'interval',
+                      seconds=config_module.JOB_RECORD_NODE_USAGES_INTERVAL,
+                      coalesce=True,
+                      max_instances=config_module.JOB_RECORD_NODE_USAGES_MAX_INSTANCES)
+if config_module.JOB_FLUSH_USER_USAGES_INTERVAL > 0:
+    scheduler.add_job(flush_user_usages,
+                      'interval',
+                      seconds=config_module.JOB_FLUSH_USER_USAGES_INTERVAL,
+                      coalesce=True,
+                      max_instances=1)
+scheduler.add_job(check_user_admin_map,
                   'interval',
-                  seconds=config_module.JOB_RECORD_NODE_USAGES_INTERVAL,
+                  seconds=config_module.JOB_CHECK_USER_ADMIN_MAP_INTERVAL,
                   coalesce=True,
-                  max_instances=config_module.JOB_RECORD_NODE_USAGES_MAX_INSTANCES)
+                  max_instances=1)
+
+
+@app.on_event("shutdown")
+def flush_pending_user_usages():
+    if usage_accumulator:
+        logger.info("Flushing pending user usages before shutdown...")
+        flush_user_usages()
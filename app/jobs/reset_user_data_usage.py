@@ -1,7 +1,7 @@
 from datetime import datetime
 
 from app import logger, scheduler, xray
-from app.db import crud, GetDB, get_users
+from app.db import crud, GetDB
 from app.models.user import UserDataLimitResetStrategy, UserStatus
 
 reset_strategy_to_days = {
@@ -11,32 +11,28 @@ reset_strategy_to_days = {
     UserDataLimitResetStrategy.year.value: 365,
 }
 
+RESET_CHUNK_SIZE = 1000
+
 
 def reset_user_data_usage():
     now = datetime.utcnow()
     with GetDB() as db:
-        for user in get_users(db,
-                              status=[
-                                  UserStatus.active,
-                                  UserStatus.limited
-                              ],
-                              reset_strategy=[
-                                  UserDataLimitResetStrategy.day.value,
-                                  UserDataLimitResetStrategy.week.value,
-                                  UserDataLimitResetStrategy.month.value,
-                                  UserDataLimitResetStrategy.year.value,
-                              ]):
-            last_reset_time = user.last_traffic_reset_time
-            num_days_to_reset = reset_strategy_to_days[user.data_limit_reset_strategy]
-
-            if not (now - last_reset_time).days >= num_days_to_reset:
-                continue
-
-            crud.reset_user_data_usage(db, user)
-            # make user active if limited on usage reset
-            if user.status == UserStatus.limited:
-                xray.operations.add_user(user)
-
+        # only users whose reset is due are selected, the due date is computed in SQL
+        users = crud.get_users_to_reset_usage(db, now, reset_strategy_to_days)
+        if not users:
+            return
+
+        for i in range(0, len(users), RESET_CHUNK_SIZE):
+            crud.reset_users_data_usage(db, users[i:i + RESET_CHUNK_SIZE])
+
+        # make users active if limited on usage reset
+        limited_usernames = [user.username for user in users if user.status == UserStatus.limited]
+        for i in range(0, len(limited_usernames), RESET_CHUNK_SIZE):
+            xray.operations.add_users(
+                crud.get_users(db, usernames=limited_usernames[i:i + RESET_CHUNK_SIZE])
+            )
+
+        for user in users:
             logger.info(f"User data usage reset for User \"{user.username}\"")
 
 
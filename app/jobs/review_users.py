@@ -1,22 +1,30 @@
 from datetime import datetime
-from typing import TYPE_CHECKING
+from typing import Iterable, Optional
 
 from sqlalchemy.orm import Session
 
 from app import logger, scheduler, xray
-from app.db import (GetDB, get_notification_reminder, get_users,
-                    start_user_expire, update_user_status, reset_user_by_next)
+from app.db import (GetDB, create_notification_reminders, get_notification_reminder,
+                    get_notification_reminder_keys, get_on_hold_users_to_activate,
+                    get_users_to_remind, get_users_to_review, start_user_expire,
+                    update_user_status, reset_user_by_next)
+from app.db.models import User
+from app.db.user_review_queue import user_review_queue
 from app.models.user import ReminderType, UserResponse, UserStatus
 from app.utils import report
 from app.utils.helpers import (calculate_expiration_days,
                                calculate_usage_percent)
 import config as config_module
 
-if TYPE_CHECKING:
-    from app.db.models import User
+def has_notification_reminder(db: Session, user: "User", reminder_type: ReminderType, threshold: int,
+                              reminders: Optional[set] = None) -> bool:
+    if reminders is not None:
+        return (user.id, reminder_type, threshold) in reminders
+    return bool(get_notification_reminder(db, user.id, reminder_type, threshold=threshold))
 
 
-def add_notification_reminders(db: Session, user: "User", now: datetime = datetime.utcnow()) -> None:
+def add_notification_reminders(db: Session, user: "User", now: datetime = datetime.utcnow(),
+                               reminders: Optional[set] = None, pending_reminders: Optional[list] = None) -> None:
     if user.data_limit:
         usage_percent = calculate_usage_percent(user.used_traffic, user.data_limit)
 
@@ -24,10 +32,10 @@ def add_notification_reminders(db: Session, user: "User", now: datetime = dateti
             config_module.NOTIFY_REACHED_USAGE_PERCENT, reverse=True
         ):
             if usage_percent >= percent:
-                if not get_notification_reminder(db, user.id, ReminderType.data_usage, threshold=percent):
+                if not has_notification_reminder(db, user, ReminderType.data_usage, percent, reminders):
                     report.data_usage_percent_reached(
                         db, usage_percent, UserResponse.model_validate(user),
-                        user.id, user.expire, threshold=percent
+                        user.id, user.expire, threshold=percent, pending_reminders=pending_reminders
                     )
                 break
 
@@ -36,10 +44,10 @@ def add_notification_reminders(db: Session, user: "User", now: datetime = dateti
 
         for days_left in sorted(config_module.NOTIFY_DAYS_LEFT):
             if expire_days <= days_left:
-                if not get_notification_reminder(db, user.id, ReminderType.expiration_date, threshold=days_left):
+                if not has_notification_reminder(db, user, ReminderType.expiration_date, days_left, reminders):
                     report.expire_days_reached(
                         db, expire_days, UserResponse.model_validate(user),
-                        user.id, user.expire, threshold=days_left
+                        user.id, user.expire, threshold=days_left, pending_reminders=pending_reminders
                     )
                 break
 
@@ -56,72 +64,102 @@ def reset_user_by_next_report(db: Session, user: "User"):
     report.user_data_reset_by_next(user=UserResponse.model_validate(user), user_admin=user.admin)
 
 
-def review():
-    now = datetime.utcnow()
+REVIEW_CHUNK_SIZE = 5000
+last_full_scan = 0.0
+
+
+def review_users(db: Session, now: datetime, user_ids: Optional[Iterable[int]] = None):
     now_ts = now.timestamp()
-    with GetDB() as db:
-        for user in get_users(db, status=UserStatus.active):
+    for user in get_users_to_review(db, now, user_ids):
 
-            limited = user.data_limit and user.used_traffic >= user.data_limit
-            expired = user.expire and user.expire <= now_ts
+        limited = user.data_limit and user.used_traffic >= user.data_limit
+        expired = user.expire and user.expire <= now_ts
 
-            if (limited or expired) and user.next_plan is not None:
-                if user.next_plan is not None:
+        if (limited or expired) and user.next_plan is not None:
+            if user.next_plan is not None:
 
-                    if user.next_plan.fire_on_either:
-                        reset_user_by_next_report(db, user)
-                        continue
-                        
-                    elif limited and expired:
-                        reset_user_by_next_report(db, user)
-                        continue
+                if user.next_plan.fire_on_either:
+                    reset_user_by_next_report(db, user)
+                    continue
 
-            if limited:
-                status = UserStatus.limited
-            elif expired:
-                status = UserStatus.expired
-            else:
-                if config_module.WEBHOOK_ADDRESS:
-                    add_notification_reminders(db, user, now)
-                continue
+                elif limited and expired:
+                    reset_user_by_next_report(db, user)
+                    continue
 
-            # При недоступности XRAY-нод не допускаем падения задачи: статус все равно обновляем
-            try:
-                xray.operations.remove_user(user)
-            except Exception as e:
-                logger.warning(f"Failed to remove user \"{user.username}\" from XRAY: {e}")
-            update_user_status(db, user, status)
+        if limited:
+            status = UserStatus.limited
+        elif expired:
+            status = UserStatus.expired
+        else:
+            continue
 
-            report.status_change(username=user.username, status=status,
-                                 user=UserResponse.model_validate(user), user_admin=user.admin)
+        # При недоступности XRAY-нод не допускаем падения задачи: статус все равно обновляем
+        try:
+            xray.operations.remove_user(user)
+        except Exception as e:
+            logger.warning(f"Failed to remove user \"{user.username}\" from XRAY: {e}")
+        update_user_status(db, user, status)
 
-            logger.info(f"User \"{user.username}\" status changed to {status}")
+        report.status_change(username=user.username, status=status,
+                             user=UserResponse.model_validate(user), user_admin=user.admin)
 
-        for user in get_users(db, status=UserStatus.on_hold):
+        logger.info(f"User \"{user.username}\" status changed to {status}")
 
-            if user.edit_at:
-                base_time = datetime.timestamp(user.edit_at)
-            else:
-                base_time = datetime.timestamp(user.created_at)
+    if config_module.WEBHOOK_ADDRESS:
+        users = get_users_to_remind(db, now,
+                                    config_module.NOTIFY_REACHED_USAGE_PERCENT,
+                                    config_module.NOTIFY_DAYS_LEFT,
+                                    user_ids)
+        # one query for the existing reminders and one insert for the new ones
+        reminders = get_notification_reminder_keys(db, [user.id for user in users])
+        pending_reminders = []
+        for user in users:
+            add_notification_reminders(db, user, now, reminders, pending_reminders)
+        create_notification_reminders(db, pending_reminders)
 
-            # Check if the user is online After or at 'base_time'
-            if user.online_at and base_time <= datetime.timestamp(user.online_at):
-                status = UserStatus.active
+    for user in get_on_hold_users_to_activate(db, now, user_ids):
+        status = UserStatus.active
 
-            elif user.on_hold_timeout and (datetime.timestamp(user.on_hold_timeout) <= (now_ts)):
-                # If the user didn't connect within the timeout period, change status to "Active"
-                status = UserStatus.active
+        update_user_status(db, user, status)
+        start_user_expire(db, user)
 
-            else:
-                continue
+        report.status_change(username=user.username, status=status,
+                             user=UserResponse.model_validate(user), user_admin=user.admin)
 
-            update_user_status(db, user, status)
-            start_user_expire(db, user)
+        logger.info(f"User \"{user.username}\" status changed to {status}")
 
-            report.status_change(username=user.username, status=status,
-                                 user=UserResponse.model_validate(user), user_admin=user.admin)
 
-            logger.info(f"User \"{user.username}\" status changed to {status}")
+def review():
+    global last_full_scan
+
+    now = datetime.utcnow()
+    now_ts = now.timestamp()
+    remind_days = config_module.NOTIFY_DAYS_LEFT if config_module.WEBHOOK_ADDRESS else []
+    full_scan = (
+        not user_review_queue.loaded
+        or config_module.JOB_REVIEW_USERS_FULL_SCAN_INTERVAL <= 0
+        or now_ts - last_full_scan >= config_module.JOB_REVIEW_USERS_FULL_SCAN_INTERVAL
+    )
+
+    with GetDB() as db:
+        if full_scan:
+            # everyone is looked at below, pending marks and timers are covered
+            user_review_queue.take(now_ts)
+            user_review_queue.load(db, now_ts, remind_days)
+            last_full_scan = now_ts
+            review_users(db, now)
+            return
+
+        # users whose usage or limits changed since the last tick, plus fired timers
+        user_ids = sorted(user_review_queue.take(now_ts))
+        for i in range(0, len(user_ids), REVIEW_CHUNK_SIZE):
+            chunk = user_ids[i:i + REVIEW_CHUNK_SIZE]
+            review_users(db, now, chunk)
+
+            # limits may have been edited, keep the timers of the reviewed users current
+            query = db.query(User.id, User.status, User.expire, User.on_hold_timeout)
+            for user in query.filter(User.id.in_(chunk)):
+                user_review_queue.schedule(user, now_ts, remind_days)
 
 
 scheduler.add_job(review, 'interval',
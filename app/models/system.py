@@ -18,3 +18,11 @@ class SystemStats(BaseModel):
     outgoing_bandwidth: int
     incoming_bandwidth_speed: int
     outgoing_bandwidth_speed: int
+
+
+class SubscriptionCacheStats(BaseModel):
+    backend: str
+    hits: int
+    misses: int
+    coalesced: int
+    in_flight: int
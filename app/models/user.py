@@ -5,7 +5,15 @@ from enum import Enum
 from math import ceil
 from typing import Dict, List, Optional, Union
 
-from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
+from pydantic import (
+    BaseModel,
+    ConfigDict,
+    Field,
+    PrivateAttr,
+    computed_field,
+    field_validator,
+    model_validator,
+)
 
 from app import xray
 from app.models.admin import Admin
@@ -288,7 +296,6 @@ class UserResponse(User):
     used_traffic: int
     lifetime_used_traffic: int = 0
     created_at: datetime
-    links: List[str] = []
     subscription_url: str = ""
     proxies: dict
     excluded_inbounds: Dict[ProxyTypes, List[str]] = {}
@@ -299,13 +306,17 @@ class UserResponse(User):
     admin: Optional[Admin] = None
     model_config = ConfigDict(from_attributes=True)
 
-    @model_validator(mode="after")
-    def validate_links(self):
-        if not self.links:
-            self.links = generate_v2ray_links(
-                self.proxies, self.inbounds, extra_data=self.model_dump(), reverse=False,
+    _links: Optional[List[str]] = PrivateAttr(default=None)
+
+    @computed_field
+    @property
+    def links(self) -> List[str]:
+        # generated on first access, so listings that exclude links never build them
+        if self._links is None:
+            self._links = generate_v2ray_links(
+                self.proxies, self.inbounds, extra_data=self.model_dump(exclude={"links"}), reverse=False,
             )
-        return self
+        return self._links
 
     @model_validator(mode="after")
     def validate_subscription_url(self):
@@ -371,6 +382,7 @@ class UserHwidDevicesResponse(BaseModel):
 class UsersResponse(BaseModel):
     users: List[UserResponse]
     total: int
+    next_cursor: Optional[str] = None
 
 
 class UserUsageResponse(BaseModel):
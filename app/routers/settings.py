@@ -18,6 +18,8 @@ from app.settings import (
     refresh_v2ray_subscription_templates,
     upsert_db_settings,
 )
+from app.subscription.cache import subscription_cache
+from app.templates import invalidate_parsed_templates
 from app.utils import responses
 
 router = APIRouter(tags=["Settings"], prefix="/api", responses={401: responses._401})
@@ -87,6 +89,9 @@ def update_settings(
             refresh_v2ray_subscription_templates()
         updated_values[key] = parsed_value
 
+    # settings may point at other templates or change what they render to
+    invalidate_parsed_templates()
+    subscription_cache.clear()
     upsert_db_settings(db, updated_values)
 
     if can_write_env:
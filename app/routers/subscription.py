@@ -1,9 +1,7 @@
 import hashlib
 import re
-from threading import Lock
 from datetime import datetime, timedelta
 from distutils.version import LooseVersion
-from time import time
 
 from fastapi import APIRouter, Depends, Header, HTTPException, Path, Request, Response
 from fastapi.encoders import jsonable_encoder
@@ -22,12 +20,14 @@ from app.models.user import (
     UserResponse,
     get_next_reset_info,
 )
+from app.subscription.cache import build_etag, negotiate_encoding, subscription_cache, supported_encodings
 from app.subscription.share import (
     encode_title,
     format_subscription_profile_title,
     generate_fake_subscription,
     generate_subscription,
     get_hwid_limit_notes,
+    get_subscription_inputs_digest,
 )
 import config as config_module
 from app.templates import render_template
@@ -43,53 +43,88 @@ client_config = {
 }
 
 router = APIRouter(tags=['Subscription'], prefix=f'/{config_module.XRAY_SUBSCRIPTION_PATH}')
-_SUBSCRIPTION_CACHE: dict[tuple, dict[str, object]] = {}
-_SUBSCRIPTION_CACHE_LOCK = Lock()
-_SUBSCRIPTION_CACHE_TTL_SECONDS = 60
 _SUBSCRIPTION_METADATA_UPDATE_SECONDS = 60
+
+
 def _build_subscription_cache_key(
     user: UserResponse,
     config_format: str,
     as_base64: bool,
     reverse: bool,
 ) -> tuple:
-    return (
-        user.username,
-        config_format,
-        as_base64,
-        reverse,
-        user.used_traffic,
-        user.data_limit,
-        user.expire,
-        user.status,
-        user.on_hold_expire_duration,
+    return (user.username, config_format, as_base64, reverse)
+
+
+def _matched_etag(if_none_match: str, etag: str) -> str | None:
+    """
+    Returns the tag in If-None-Match that matches `etag` or one of its encoded
+    representations, "*" matches the identity one.
+    """
+    if not if_none_match:
+        return None
+    if if_none_match.strip() == "*":
+        return etag
+    representations = {etag, *(_encoded_etag(etag, coding) for coding in supported_encodings())}
+    # If-None-Match uses the weak comparison, only the opaque tags are compared
+    opaque_tags = {tag.removeprefix("W/"): tag for tag in representations}
+    for tag in if_none_match.split(","):
+        tag = opaque_tags.get(tag.strip().removeprefix("W/"))
+        if tag is not None:
+            return tag
+    return None
+
+
+def _encoded_etag(etag: str, encoding: str) -> str:
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def _subscription_response(
+    request: Request,
+    user: UserResponse,
+    config: dict,
+    response_headers: dict[str, str],
+) -> Response:
+    cache_key = _build_subscription_cache_key(
+        user=user,
+        config_format=config["config_format"],
+        as_base64=config["as_base64"],
+        reverse=config["reverse"],
+    )
+    # derived from the inputs rather than the content, so it survives the
+    # cache TTL and random sni/address choices between generations
+    etag = build_etag(cache_key, get_subscription_inputs_digest(user))
+    if config_module.SUBSCRIPTION_COMPRESSION:
+        response_headers["vary"] = "Accept-Encoding"
+
+    matched = _matched_etag(request.headers.get("if-none-match", ""), etag)
+    if matched:
+        response_headers["etag"] = matched
+        return Response(status_code=304, headers=response_headers)
+
+    entry, cache_status = subscription_cache.get_or_create(
+        cache_key,
+        etag,
+        lambda: generate_subscription(
+            user=user,
+            config_format=config["config_format"],
+            as_base64=config["as_base64"],
+            reverse=config["reverse"],
+        ),
     )
+    response_headers["x-subscription-cache"] = cache_status
 
+    encoding = None
+    if config_module.SUBSCRIPTION_COMPRESSION:
+        if len(entry.content) >= config_module.SUBSCRIPTION_COMPRESSION_MIN_SIZE:
+            encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    # every representation gets its own tag, any of them is a valid cached copy
+    response_headers["etag"] = _encoded_etag(etag, encoding) if encoding else etag
 
-def _get_cached_subscription(cache_key: tuple) -> str | None:
-    with _SUBSCRIPTION_CACHE_LOCK:
-        cached = _SUBSCRIPTION_CACHE.get(cache_key)
-        if not cached:
-            return None
-        if cached["expires_at"] < time():
-            _SUBSCRIPTION_CACHE.pop(cache_key, None)
-            return None
-        return str(cached["content"])
-
-
-def _set_cached_subscription(cache_key: tuple, content: str) -> None:
-    user_key, config_format, as_base64, reverse, *_ = cache_key
-    with _SUBSCRIPTION_CACHE_LOCK:
-        keys_to_remove = [
-            key for key in list(_SUBSCRIPTION_CACHE)
-            if key[:4] == (user_key, config_format, as_base64, reverse)
-        ]
-        for key in keys_to_remove:
-            _SUBSCRIPTION_CACHE.pop(key, None)
-        _SUBSCRIPTION_CACHE[cache_key] = {
-            "content": content,
-            "expires_at": time() + _SUBSCRIPTION_CACHE_TTL_SECONDS,
-        }
+    if encoding:
+        response_headers["content-encoding"] = encoding
+        content = subscription_cache.encode(cache_key, entry, encoding)
+        return Response(content=content, media_type=config["media_type"], headers=response_headers)
+    return Response(content=entry.content, media_type=config["media_type"], headers=response_headers)
 
 
 def _should_update_subscription_metadata(dbuser: User) -> bool:
@@ -354,24 +389,7 @@ def user_subscription(
     if _should_update_subscription_metadata(dbuser):
         crud.update_user_sub(db, dbuser, user_agent)
     config = _resolve_client_config(user_agent)
-    cache_key = _build_subscription_cache_key(
-        user=user,
-        config_format=config["config_format"],
-        as_base64=config["as_base64"],
-        reverse=config["reverse"],
-    )
-    conf = _get_cached_subscription(cache_key)
-    cache_status = "hit" if conf is not None else "miss"
-    if conf is None:
-        conf = generate_subscription(
-            user=user,
-            config_format=config["config_format"],
-            as_base64=config["as_base64"],
-            reverse=config["reverse"],
-        )
-        _set_cached_subscription(cache_key, conf)
-    response_headers["x-subscription-cache"] = cache_status
-    return Response(content=conf, media_type=config["media_type"], headers=response_headers)
+    return _subscription_response(request, user, config, response_headers)
 
 
 @router.get("/{token}/info", response_model=SubscriptionUserResponse)
@@ -484,22 +502,4 @@ def user_subscription_with_client_type(
         )
 
     config = client_config.get(client_type)
-    cache_key = _build_subscription_cache_key(
-        user=user,
-        config_format=config["config_format"],
-        as_base64=config["as_base64"],
-        reverse=config["reverse"],
-    )
-    conf = _get_cached_subscription(cache_key)
-    cache_status = "hit" if conf is not None else "miss"
-    if conf is None:
-        conf = generate_subscription(
-            user=user,
-            config_format=config["config_format"],
-            as_base64=config["as_base64"],
-            reverse=config["reverse"],
-        )
-        _set_cached_subscription(cache_key, conf)
-    response_headers["x-subscription-cache"] = cache_status
-
-    return Response(content=conf, media_type=config["media_type"], headers=response_headers)
+    return _subscription_response(request, user, config, response_headers)
@@ -6,10 +6,12 @@ from app import __version__, xray
 from app.db import Session, crud, get_db
 from app.models.admin import Admin
 from app.models.proxy import ProxyHost, ProxyInbound, ProxyTypes
-from app.models.system import SystemStats
+from app.models.system import SubscriptionCacheStats, SystemStats
 from app.models.user import UserStatus
+from app.subscription.cache import subscription_cache
 from app.utils import responses
 from app.utils.system import cpu_usage, memory_usage, realtime_bandwidth
+import config as config_module
 
 router = APIRouter(tags=["System"], prefix="/api", responses={401: responses._401})
 
@@ -24,22 +26,13 @@ def get_system_stats(
     system = crud.get_system_usage(db)
     dbadmin: Union[Admin, None] = crud.get_admin(db, admin.username)
 
-    total_user = crud.get_users_count(db, admin=dbadmin if not admin.is_sudo else None)
-    users_active = crud.get_users_count(
-        db, status=UserStatus.active, admin=dbadmin if not admin.is_sudo else None
-    )
-    users_disabled = crud.get_users_count(
-        db, status=UserStatus.disabled, admin=dbadmin if not admin.is_sudo else None
-    )
-    users_on_hold = crud.get_users_count(
-        db, status=UserStatus.on_hold, admin=dbadmin if not admin.is_sudo else None
-    )
-    users_expired = crud.get_users_count(
-        db, status=UserStatus.expired, admin=dbadmin if not admin.is_sudo else None
-    )
-    users_limited = crud.get_users_count(
-        db, status=UserStatus.limited, admin=dbadmin if not admin.is_sudo else None
-    )
+    breakdown = crud.get_users_status_breakdown(db, admin=dbadmin if not admin.is_sudo else None)
+    total_user = sum(breakdown.values())
+    users_active = breakdown[UserStatus.active]
+    users_disabled = breakdown[UserStatus.disabled]
+    users_on_hold = breakdown[UserStatus.on_hold]
+    users_expired = breakdown[UserStatus.expired]
+    users_limited = breakdown[UserStatus.limited]
     online_users = crud.count_online_users(db, 24)
     realtime_bandwidth_stats = realtime_bandwidth()
 
@@ -63,6 +56,23 @@ def get_system_stats(
     )
 
 
+@router.get(
+    "/system/subscription-cache",
+    response_model=SubscriptionCacheStats,
+    responses={403: responses._403},
+)
+def get_subscription_cache_stats(admin: Admin = Depends(Admin.check_sudo_admin)):
+    """Get hit, miss and coalesced request counters of the subscription cache."""
+    stats = subscription_cache.stats
+    return SubscriptionCacheStats(
+        backend=config_module.SUBSCRIPTION_CACHE_BACKEND,
+        hits=stats.hits,
+        misses=stats.misses,
+        coalesced=stats.coalesced,
+        in_flight=subscription_cache.in_flight,
+    )
+
+
 @router.get("/inbounds", response_model=Dict[ProxyTypes, List[ProxyInbound]])
 def get_inbounds(admin: Admin = Depends(Admin.get_current)):
     """Retrieve inbound configurations grouped by protocol."""
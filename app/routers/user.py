@@ -1,7 +1,7 @@
 from datetime import datetime, timedelta, timezone
 from typing import List, Optional, Union
 
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response
 from sqlalchemy.exc import IntegrityError
 
 from app import logger, xray
@@ -247,10 +247,31 @@ def get_users(
     owner: Union[List[str], None] = Query(None, alias="admin"),
     status: UserStatus = None,
     sort: str = None,
+    fields: str = None,
+    include_links: bool = True,
+    cursor: str = None,
     db: Session = Depends(get_db),
     admin: Admin = Depends(Admin.get_current),
 ):
-    """Get all users"""
+    """
+    Get all users
+
+    - **fields**: Comma separated user fields to return, all fields by default.
+    - **include_links**: Set to `false` to skip generating share links for every user.
+    - **cursor**: Keyset pagination, send an empty value for the first page and then the
+      returned `next_cursor`. `offset` is ignored when it is set.
+    """
+    include = None
+    if fields is not None:
+        include = set(filter(None, (field.strip() for field in fields.split(","))))
+        unknown = include - set(UserResponse.model_fields) - set(UserResponse.model_computed_fields)
+        if unknown:
+            raise HTTPException(
+                status_code=400, detail=f'"{", ".join(sorted(unknown))}" is not a valid user field'
+            )
+    if not include_links:
+        include = (include or set(UserResponse.model_fields) | set(UserResponse.model_computed_fields)) - {"links"}
+
     if sort is not None:
         opts = sort.strip(",").split(",")
         sort = []
@@ -262,19 +283,37 @@ def get_users(
                     status_code=400, detail=f'"{opt}" is not a valid sort option'
                 )
 
-    users, count = crud.get_users(
-        db=db,
-        offset=offset,
-        limit=limit,
-        search=search,
-        usernames=username,
-        status=status,
-        sort=sort,
-        admins=owner if admin.is_sudo else [admin.username],
-        return_with_count=True,
-    )
+    try:
+        users, count = crud.get_users(
+            db=db,
+            offset=offset,
+            limit=limit,
+            search=search,
+            usernames=username,
+            status=status,
+            sort=sort,
+            admins=owner if admin.is_sudo else [admin.username],
+            return_with_count=True,
+            cursor=cursor,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    next_cursor = None
+    if cursor is not None and limit and len(users) == limit:
+        next_cursor = crud.get_users_cursor(users[-1], sort)
+
+    if include is not None:
+        # links are computed lazily, so leaving them out here skips generating them at all
+        response = UsersResponse(users=users, total=count, next_cursor=next_cursor)
+        return Response(
+            content=response.model_dump_json(
+                include={"users": {"__all__": include}, "total": True, "next_cursor": True}
+            ),
+            media_type="application/json",
+        )
 
-    return {"users": users, "total": count}
+    return {"users": users, "total": count, "next_cursor": next_cursor}
 
 
 @router.post("/users/reset", responses={403: responses._403, 404: responses._404})
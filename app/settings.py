@@ -7,6 +7,7 @@ from sqlalchemy.orm import Session
 
 import config as config_module
 from app.db.models import AppSetting
+from app.templates import invalidate_parsed_templates
 
 
 @dataclass(frozen=True)
@@ -244,6 +245,7 @@ def refresh_v2ray_subscription_templates():
         except ValueError:
             templates = {}
     config_module.V2RAY_SUBSCRIPTION_TEMPLATES = templates
+    invalidate_parsed_templates()
 
 
 def get_db_settings(db: Session) -> dict[str, Any]:
@@ -0,0 +1,469 @@
+"""
+Cache of generated subscription configs.
+
+Entries are keyed by ``(username, format, base64, reverse)`` and carry the
+ETag of the inputs they were generated from, so a user only ever holds one
+entry per variant and a stale one is replaced in O(1) on the next write.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from time import time
+from typing import Callable, Dict, Optional, Tuple
+
+from app import logger
+import config as config_module
+
+try:
+    import brotli
+except ModuleNotFoundError:
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+@dataclass
+class SubscriptionCacheEntry:
+    etag: str
+    content: str
+    expires_at: float
+    encoded: Dict[str, bytes] = field(default_factory=dict)
+
+    @property
+    def size(self) -> int:
+        return len(self.content) + sum(len(body) for body in self.encoded.values())
+
+
+def build_etag(key: tuple, inputs_digest: str) -> str:
+    """
+    Builds the ETag of a subscription from its cache key and the digest of its inputs.
+
+    It doesn't depend on the generated content, so regenerating an expired
+    entry keeps the tag clients already hold. The tag is weak, regenerated
+    bodies are equivalent but not byte-identical (random sni, host and user
+    agent choices).
+    """
+    digest = hashlib.sha256(repr(key).encode())
+    digest.update(inputs_digest.encode())
+    return f'W/"{digest.hexdigest()[:32]}"'
+
+
+def supported_encodings() -> list:
+    """Content codings we can produce, in order of preference."""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Picks the preferred supported coding the client accepts, or None for identity."""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding] = weight
+
+    best, best_weight = None, 0.0
+    for coding in supported_encodings():
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def compress(content: str, encoding: str) -> bytes:
+    data = content.encode()
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        # a fixed mtime keeps the output stable for the same content
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Unsupported encoding \"{encoding}\"")
+
+
+class SubscriptionCacheBackend(ABC):
+    """Storage interface for subscription cache entries."""
+
+    @abstractmethod
+    def get(self, key: tuple) -> Optional[SubscriptionCacheEntry]:
+        ...
+
+    @abstractmethod
+    def set(self, key: tuple, entry: SubscriptionCacheEntry) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: tuple) -> None:
+        ...
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+
+class MemorySubscriptionCache(SubscriptionCacheBackend):
+    """Process local LRU bounded by entry count and total content size."""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, SubscriptionCacheEntry]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: tuple) -> Optional[SubscriptionCacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: tuple, entry: SubscriptionCacheEntry) -> None:
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old.size
+            self._entries[key] = entry
+            self._size += entry.size
+            while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+
+    def delete(self, key: tuple) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._size -= entry.size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+class SQLiteSubscriptionCache(SubscriptionCacheBackend):
+    """
+    On-disk LRU shared by every worker process on the host.
+
+    Entries are stored as plain columns, the body and each compressed body
+    as a BLOB, never as serialized objects, so a file writable by others
+    can't make the workers run code. The entry count and total size live in
+    a one row meta table kept up to date by triggers, so checking the bounds
+    does not scan the cache.
+    """
+
+    # how stale accessed_at may get before a hit writes it again
+    TOUCH_INTERVAL = 5
+
+    def __init__(self, path: str, max_entries: int, max_bytes: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(subscription_cache)")}
+            if "entry" in columns:
+                # a cache file of the pickled layout, its entries are dropped rather than loaded
+                conn.execute("DROP TABLE subscription_cache")
+                conn.execute("DROP TABLE IF EXISTS subscription_cache_meta")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS subscription_cache ("
+                "key TEXT PRIMARY KEY, etag TEXT NOT NULL, expires_at REAL NOT NULL, content BLOB NOT NULL, "
+                "gzip BLOB, br BLOB, size INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_subscription_cache_accessed_at ON subscription_cache (accessed_at)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS subscription_cache_meta ("
+                "id INTEGER PRIMARY KEY CHECK (id = 0), entries INTEGER NOT NULL, bytes INTEGER NOT NULL)"
+            )
+            # counts what an older cache file already holds, only once
+            conn.execute(
+                "INSERT OR IGNORE INTO subscription_cache_meta (id, entries, bytes) "
+                "SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM subscription_cache"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS subscription_cache_insert AFTER INSERT ON subscription_cache BEGIN "
+                "UPDATE subscription_cache_meta SET entries = entries + 1, bytes = bytes + NEW.size WHERE id = 0; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS subscription_cache_delete AFTER DELETE ON subscription_cache BEGIN "
+                "UPDATE subscription_cache_meta SET entries = entries - 1, bytes = bytes - OLD.size WHERE id = 0; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS subscription_cache_update AFTER UPDATE OF size ON subscription_cache "
+                "BEGIN UPDATE subscription_cache_meta SET bytes = bytes - OLD.size + NEW.size WHERE id = 0; END"
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(key: tuple) -> str:
+        return json.dumps(key, default=str, separators=(",", ":"))
+
+    def get(self, key: tuple) -> Optional[SubscriptionCacheEntry]:
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT etag, expires_at, content, gzip, br, accessed_at FROM subscription_cache WHERE key = ?",
+            (self._key(key),)
+        ).fetchone()
+        if row is None:
+            return None
+        etag, expires_at, content, gzip_body, br_body, accessed_at = row
+        now = time()
+        # a read only hit does not take the write lock
+        if now - accessed_at > self.TOUCH_INTERVAL:
+            conn.execute("UPDATE subscription_cache SET accessed_at = ? WHERE key = ?", (now, self._key(key)))
+        try:
+            content = content.decode()
+        except (AttributeError, UnicodeDecodeError):
+            self.delete(key)
+            return None
+        encoded = {encoding: body for encoding, body in (("gzip", gzip_body), ("br", br_body)) if body is not None}
+        return SubscriptionCacheEntry(etag=etag, content=content, expires_at=expires_at, encoded=encoded)
+
+    def set(self, key: tuple, entry: SubscriptionCacheEntry) -> None:
+        if entry.size > self.max_bytes:
+            return
+        conn = self._connection()
+        # an upsert rather than INSERT OR REPLACE, so the update trigger sees the replaced size
+        conn.execute(
+            "INSERT INTO subscription_cache (key, etag, expires_at, content, gzip, br, size, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET etag = excluded.etag, expires_at = excluded.expires_at, "
+            "content = excluded.content, gzip = excluded.gzip, br = excluded.br, size = excluded.size, "
+            "accessed_at = excluded.accessed_at",
+            (self._key(key), entry.etag, entry.expires_at, entry.content.encode(),
+             entry.encoded.get("gzip"), entry.encoded.get("br"), entry.size, time()),
+        )
+        self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        # about 1% goes at once, so a full cache does not evict on every write
+        batch = max(self.max_entries // 100, 1)
+        while True:
+            count, size = conn.execute("SELECT entries, bytes FROM subscription_cache_meta WHERE id = 0").fetchone()
+            if not count or (count <= self.max_entries and size <= self.max_bytes):
+                return
+            conn.execute(
+                "DELETE FROM subscription_cache WHERE key IN "
+                "(SELECT key FROM subscription_cache ORDER BY accessed_at LIMIT ?)",
+                (max(count - self.max_entries, batch),),
+            )
+
+    def __len__(self):
+        return self._connection().execute("SELECT entries FROM subscription_cache_meta WHERE id = 0").fetchone()[0]
+
+    def delete(self, key: tuple) -> None:
+        self._connection().execute("DELETE FROM subscription_cache WHERE key = ?", (self._key(key),))
+
+    def clear(self) -> None:
+        self._connection().execute("DELETE FROM subscription_cache")
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs one call per key at a time, concurrent callers of the same key wait
+    for the running call and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._calls: Dict[tuple, _Call] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._calls)
+
+    def do(self, key: tuple, fn: Callable) -> Tuple[object, bool]:
+        """
+        Returns the result of `fn` and whether it was shared from another caller.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+@dataclass
+class SubscriptionCacheStats:
+    hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+
+
+class SubscriptionCache:
+    def __init__(self, backend: SubscriptionCacheBackend, ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+        self.stats = SubscriptionCacheStats()
+        self._flight = SingleFlight()
+        self._stats_lock = threading.Lock()
+
+    def _count(self, status: str):
+        with self._stats_lock:
+            setattr(self.stats, status, getattr(self.stats, status) + 1)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._flight)
+
+    def get_or_create(self, key: tuple, etag: str,
+                      factory: Callable[[], str]) -> Tuple[SubscriptionCacheEntry, str]:
+        """
+        Returns the entry of `key` with `etag`, generating it with `factory` on a miss.
+
+        Concurrent misses of the same key and tag run `factory` once, the
+        other callers wait for it. The second value is "hit", "miss" or "coalesced".
+        """
+        entry = self.get(key, etag)
+        if entry is not None:
+            self._count("hits")
+            return entry, "hit"
+
+        def create() -> Tuple[SubscriptionCacheEntry, bool]:
+            # a call for this key may have finished between the lookup above and now
+            cached = self.get(key, etag)
+            if cached is not None:
+                return cached, True
+            return self.set(key, etag, factory()), False
+
+        (entry, cached), shared = self._flight.do((key, etag), create)
+        if shared:
+            self._count("coalesced")
+            return entry, "coalesced"
+        if cached:
+            self._count("hits")
+            return entry, "hit"
+        self._count("misses")
+        return entry, "miss"
+
+    def get(self, key: tuple, etag: str) -> Optional[SubscriptionCacheEntry]:
+        try:
+            entry = self.backend.get(key)
+        except Exception as exc:
+            logger.warning(f"Subscription cache read failed: {exc}")
+            return None
+        if entry is None:
+            return None
+        if entry.etag != etag or entry.expires_at < time():
+            return None
+        return entry
+
+    def set(self, key: tuple, etag: str, content: str) -> SubscriptionCacheEntry:
+        entry = SubscriptionCacheEntry(
+            etag=etag,
+            content=content,
+            expires_at=time() + self.ttl,
+        )
+        try:
+            self.backend.set(key, entry)
+        except Exception as exc:
+            logger.warning(f"Subscription cache write failed: {exc}")
+        return entry
+
+    def encode(self, key: tuple, entry: SubscriptionCacheEntry, encoding: str) -> bytes:
+        """
+        Returns the body of `entry` compressed with `encoding`.
+
+        The compressed body is stored with the entry, so it is only produced
+        once per version of the subscription.
+        """
+        body = entry.encoded.get(encoding)
+        if body is not None:
+            return body
+        body = compress(entry.content, encoding)
+        # entries are replaced, not mutated, so the backends keep their size accounting
+        entry = replace(entry, encoded={**entry.encoded, encoding: body})
+        try:
+            self.backend.set(key, entry)
+        except Exception as exc:
+            logger.warning(f"Subscription cache write failed: {exc}")
+        return body
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+
+def create_subscription_cache() -> SubscriptionCache:
+    backend_name = config_module.SUBSCRIPTION_CACHE_BACKEND
+    if backend_name == "sqlite":
+        backend = SQLiteSubscriptionCache(
+            config_module.SUBSCRIPTION_CACHE_PATH,
+            config_module.SUBSCRIPTION_CACHE_MAX_ENTRIES,
+            config_module.SUBSCRIPTION_CACHE_MAX_BYTES,
+        )
+    else:
+        if backend_name != "memory":
+            logger.warning(f"Unknown subscription cache backend \"{backend_name}\", using memory")
+        backend = MemorySubscriptionCache(
+            config_module.SUBSCRIPTION_CACHE_MAX_ENTRIES,
+            config_module.SUBSCRIPTION_CACHE_MAX_BYTES,
+        )
+    return SubscriptionCache(backend, config_module.SUBSCRIPTION_CACHE_TTL)
+
+
+subscription_cache = create_subscription_cache()
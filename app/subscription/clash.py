@@ -1,5 +1,4 @@
 import copy
-import json
 from random import choice
 from uuid import UUID
 
@@ -7,10 +6,129 @@ import yaml
 from jinja2.exceptions import TemplateNotFound
 
 from app.subscription.funcs import get_grpc_gun
-from app.templates import render_template
+from app.templates import get_compiled_template, render_parsed_template, render_template
 from app.utils.helpers import yml_uuid_representer
 import config as config_module
 
+_SLOTS = ("proxies", "proxy-groups", "rules", "proxy_remarks")
+_SLOT_MARKERS = {f"__marzban_clash_{slot}__": slot for slot in _SLOTS}
+# key order is deliberately unsorted so the probe tells whether the template sorts it
+_PROBE_VALUES = {
+    "proxies": [
+        {"name": "probe-1", "type": "vless", "server": "127.0.0.1", "port": 443, "network": "ws",
+         "ws-opts": {"path": "/", "headers": {"Host": "probe.example"}}, "udp": True},
+        {"name": "probe-2", "type": "trojan", "server": "127.0.0.2", "port": 8443, "network": "tcp", "udp": True},
+    ],
+    "proxy-groups": [{"name": "probe-group", "type": "select", "proxies": ["probe-1", "probe-2"]}],
+    "rules": ["DOMAIN,probe.example,DIRECT", "MATCH,probe-group"],
+    "proxy_remarks": ["probe-1", "probe-2"],
+}
+
+
+class _ClashDumper(yaml.SafeDumper):
+    def ignore_aliases(self, data):
+        # the round-tripped output never had anchors, keep it that way
+        return True
+
+
+_ClashDumper.add_representer(UUID, yml_uuid_representer)
+yaml.add_representer(UUID, yml_uuid_representer)
+
+if yaml.__with_libyaml__:
+    class _ClashCDumper(yaml.CSafeDumper):
+        ignore_aliases = _ClashDumper.ignore_aliases
+
+    _ClashCDumper.add_representer(UUID, yml_uuid_representer)
+else:
+    _ClashCDumper = None
+
+
+def _dump(data) -> str:
+    if _ClashCDumper is not None:
+        text = yaml.dump(data, Dumper=_ClashCDumper, sort_keys=False, allow_unicode=True)
+        # libyaml escapes characters outside the BMP (emoji flags in remarks)
+        # where the python emitter writes them as is
+        if "\\U" not in text:
+            return text
+    return yaml.dump(data, Dumper=_ClashDumper, sort_keys=False, allow_unicode=True)
+
+
+def _baseline_dump(data) -> str:
+    # what the render, parse and dump path emits, the compiled path has to reproduce it
+    return yaml.dump(data, sort_keys=False, allow_unicode=True)
+
+
+def _template_context(values: dict) -> dict:
+    return {
+        "conf": {key: values[key] for key in ("proxies", "proxy-groups", "rules")},
+        "proxy_remarks": values["proxy_remarks"],
+    }
+
+
+def _render_structure(template, values: dict):
+    return yaml.load(template.render(_template_context(values)), Loader=yaml.SafeLoader)
+
+
+def _sort_keys(node):
+    if isinstance(node, list):
+        return [_sort_keys(item) for item in node]
+    if isinstance(node, dict):
+        return {key: _sort_keys(node[key]) for key in sorted(node)}
+    return node
+
+
+def _fill_slots(node, values: dict, sort_keys: bool):
+    if isinstance(node, list):
+        filled = []
+        for item in node:
+            if isinstance(item, str) and item in _SLOT_MARKERS:
+                items = values[_SLOT_MARKERS[item]]
+                filled.extend(_sort_keys(items) if sort_keys else items)
+            else:
+                filled.append(_fill_slots(item, values, sort_keys))
+        return filled
+    if isinstance(node, dict):
+        return {key: _fill_slots(val, values, sort_keys) for key, val in node.items()}
+    return node
+
+
+class _CompiledClashTemplate:
+    """
+    Parsed form of a Clash subscription template with marker items in place
+    of the proxies, proxy groups, rules and proxy remarks lists.
+
+    The structure depends on which of the lists are empty, so one is compiled
+    per combination. A structure is only used after its dump reproduced the
+    baseline yaml.dump output of the regular render for probe values (the
+    yaml filter sorts keys, so that is detected too); templates doing anything the markers can't follow
+    stay on the render, parse and dump path.
+    """
+
+    def __init__(self, template):
+        self.template = template
+        self._structures = {}
+
+    def structure(self, values: dict):
+        """Returns (structure, sort_keys) for `values`, or None to use the regular render."""
+        signature = tuple(bool(values[slot]) for slot in _SLOTS)
+        if signature not in self._structures:
+            self._structures[signature] = self._compile(signature)
+        return self._structures[signature]
+
+    def _compile(self, signature: tuple):
+        markers = {slot: [marker] for marker, slot in _SLOT_MARKERS.items()}
+        marker_values = {slot: markers[slot] if used else [] for slot, used in zip(_SLOTS, signature)}
+        probe_values = {slot: _PROBE_VALUES[slot] if used else [] for slot, used in zip(_SLOTS, signature)}
+        try:
+            structure = _render_structure(self.template, marker_values)
+            expected = _baseline_dump(_render_structure(self.template, probe_values))
+            for sort_keys in (True, False):
+                if _dump(_fill_slots(structure, probe_values, sort_keys)) == expected:
+                    return structure, sort_keys
+        except Exception:
+            pass
+        return None
+
 
 class ClashConfiguration(object):
     def __init__(self):
@@ -21,8 +139,9 @@ class ClashConfiguration(object):
             'rules': []
         }
         self.proxy_remarks = []
-        self.mux_template = render_template(config_module.MUX_TEMPLATE)
-        user_agent_data = json.loads(render_template(config_module.USER_AGENT_TEMPLATE))
+        # parsed templates are shared between requests, copy before changing them
+        self.mux_template = render_parsed_template(config_module.MUX_TEMPLATE)
+        user_agent_data = render_parsed_template(config_module.USER_AGENT_TEMPLATE)
 
         if 'list' in user_agent_data and isinstance(user_agent_data['list'], list):
             self.user_agent_list = user_agent_data['list']
@@ -30,10 +149,7 @@ class ClashConfiguration(object):
             self.user_agent_list = []
 
         try:
-            self.settings = yaml.load(
-                render_template(config_module.CLASH_SETTINGS_TEMPLATE),
-                Loader=yaml.SafeLoader,
-            )
+            self.settings = render_parsed_template(config_module.CLASH_SETTINGS_TEMPLATE, "yaml")
         except TemplateNotFound:
             self.settings = {}
 
@@ -43,8 +159,22 @@ class ClashConfiguration(object):
         if reverse:
             self.data['proxies'].reverse()
 
-        yaml.add_representer(UUID, yml_uuid_representer)
-        return yaml.dump(
+        values = {
+            "proxies": self.data['proxies'],
+            "proxy-groups": self.data['proxy-groups'],
+            "rules": self.data['rules'],
+            "proxy_remarks": self.proxy_remarks,
+        }
+        compiled = get_compiled_template(config_module.CLASH_SUBSCRIPTION_TEMPLATE, _CompiledClashTemplate)
+        compiled_structure = compiled.structure(values)
+        if compiled_structure is not None:
+            structure, sort_keys = compiled_structure
+            try:
+                return _dump(_fill_slots(structure, values, sort_keys))
+            except yaml.representer.RepresenterError:
+                pass
+
+        return _baseline_dump(
             yaml.load(
                 render_template(
                     config_module.CLASH_SUBSCRIPTION_TEMPLATE,
@@ -52,9 +182,7 @@ class ClashConfiguration(object):
                 ),
                 Loader=yaml.SafeLoader
 
-            ),
-            sort_keys=False,
-            allow_unicode=True,
+            )
         )
 
     def __str__(self) -> str:
@@ -243,8 +371,7 @@ class ClashConfiguration(object):
 
         node[f'{network}-opts'] = net_opts
 
-        mux_json = json.loads(self.mux_template)
-        mux_config = mux_json["clash"]
+        mux_config = copy.deepcopy(self.mux_template["clash"])
 
         if mux_enable:
             node['smux'] = mux_config
@@ -1,15 +1,23 @@
 import base64
+import hashlib
 import random
 import secrets
+import threading
 from collections import defaultdict
+from dataclasses import dataclass
 from datetime import datetime as dt
 from datetime import timedelta
-from typing import TYPE_CHECKING, List, Literal, Union
+from functools import lru_cache
+from string import Formatter
+from time import time
+from types import MappingProxyType
+from typing import TYPE_CHECKING, List, Literal, Mapping, Union
 from uuid import uuid4
 
 from jdatetime import date as jd
 
 from app import xray
+from app.templates import get_template_digest
 from app.utils.system import get_public_ip, get_public_ipv6, readable_size
 
 from . import *
@@ -39,6 +47,17 @@ def get_status_texts() -> dict[str, str]:
         "on_hold": config_module.ONHOLD_STATUS_TEXT,
     }
 
+FORMAT_VARIABLES_CACHE_SIZE = 4096
+
+
+class UserFormatVariables(dict):
+    def __missing__(self, key):
+        return "<missing>"
+
+    def copy(self) -> "UserFormatVariables":
+        return UserFormatVariables(self)
+
+
 DEFAULT_HOST_REMARK = "🚀 Marz ({USERNAME}) [{PROTOCOL} - {TRANSPORT}]"
 DEFAULT_HOST_ADDRESS_TOKENS = {"{SERVER_IP}", "{SERVER_IPV6}"}
 
@@ -59,7 +78,7 @@ def generate_v2ray_links(
         reverse: bool,
         custom_remarks: list[str] | None = None,
 ) -> list:
-    format_variables = setup_format_variables(extra_data)
+    format_variables = get_format_variables(extra_data)
     conf = V2rayShareLink()
     return process_inbounds_and_tags(
         inbounds,
@@ -136,17 +155,6 @@ SUBSCRIPTION_TYPE_ALIASES = {
 }
 
 
-def _host_allows_subscription_type(host: dict, config_format: str) -> bool:
-    subscription_types = host.get("subscription_types")
-    if not subscription_types:
-        return True
-    allowed = {str(value).strip().lower() for value in subscription_types if str(value).strip()}
-    if not allowed:
-        return True
-    config_aliases = SUBSCRIPTION_TYPE_ALIASES.get(config_format, {config_format})
-    return bool(allowed.intersection(config_aliases))
-
-
 def generate_fake_subscription(
     user: "UserResponse",
     config_format: Literal["v2ray", "clash-meta", "clash", "sing-box", "outline", "v2ray-json"],
@@ -157,7 +165,7 @@ def generate_fake_subscription(
     if not notes:
         return ""
 
-    format_variables = setup_format_variables(user.model_dump())
+    format_variables = get_format_variables(user.model_dump()).copy()
     protocol = _fake_protocol_for_format(config_format)
     format_variables.update({"PROTOCOL": protocol, "TRANSPORT": "tcp"})
     formatted_notes = [
@@ -217,7 +225,7 @@ def generate_clash_subscription(
     else:
         conf = ClashConfiguration()
 
-    format_variables = setup_format_variables(extra_data)
+    format_variables = get_format_variables(extra_data)
     return process_inbounds_and_tags(
         inbounds,
         proxies,
@@ -238,7 +246,7 @@ def generate_singbox_subscription(
 ) -> str:
     conf = SingBoxConfiguration()
 
-    format_variables = setup_format_variables(extra_data)
+    format_variables = get_format_variables(extra_data)
     return process_inbounds_and_tags(
         inbounds,
         proxies,
@@ -259,7 +267,7 @@ def generate_outline_subscription(
 ) -> str:
     conf = OutlineConfiguration()
 
-    format_variables = setup_format_variables(extra_data)
+    format_variables = get_format_variables(extra_data)
     return process_inbounds_and_tags(
         inbounds,
         proxies,
@@ -280,7 +288,7 @@ def generate_v2ray_json_subscription(
 ) -> str:
     conf = V2rayJsonConfig()
 
-    format_variables = setup_format_variables(extra_data)
+    format_variables = get_format_variables(extra_data)
     return process_inbounds_and_tags(
         inbounds,
         proxies,
@@ -433,8 +441,7 @@ def setup_format_variables(extra_data: dict) -> dict:
     status_text = status_template.format_map(defaultdict(lambda: "<missing>", temp_vars))
 
     # Create the final format_variables including the formatted STATUS_TEXT
-    format_variables = defaultdict(
-        lambda: "<missing>",
+    format_variables = UserFormatVariables(
         {
             **temp_vars,
             "STATUS_TEXT": status_text,
@@ -444,15 +451,248 @@ def setup_format_variables(extra_data: dict) -> dict:
     return format_variables
 
 
+@lru_cache(maxsize=FORMAT_VARIABLES_CACHE_SIZE)
+def _cached_format_variables(
+    username: str,
+    used_traffic: int,
+    data_limit: int | None,
+    expire: int | None,
+    status,
+    on_hold_expire_duration: int | None,
+    status_template: str,
+    minute: int,
+) -> Mapping:
+    return MappingProxyType(setup_format_variables({
+        "username": username,
+        "used_traffic": used_traffic,
+        "data_limit": data_limit,
+        "expire": expire,
+        "status": status,
+        "on_hold_expire_duration": on_hold_expire_duration,
+    }))
+
+
+def get_format_variables(extra_data: dict) -> Mapping:
+    """
+    Returns the read-only format variables of a user snapshot.
+
+    They are shared by everything formatted for the same snapshot within a
+    minute (profile title, links, remarks), `.copy()` to get a mutable dict.
+    """
+    status = extra_data.get("status")
+    return _cached_format_variables(
+        extra_data.get("username", "{USERNAME}"),
+        extra_data.get("used_traffic"),
+        extra_data.get("data_limit"),
+        extra_data.get("expire"),
+        status,
+        extra_data.get("on_hold_expire_duration"),
+        # the status text is configurable, a changed text must not be served from cache
+        get_status_texts().get(status) or "",
+        int(time() // 60),
+    )
+
+
 def format_subscription_profile_title(
     user: "UserResponse",
     template: str | None = None,
 ) -> str:
     raw_template = template or config_module.SUB_PROFILE_TITLE
-    format_variables = setup_format_variables(user.model_dump())
+    format_variables = get_format_variables(user.model_dump())
     return raw_template.format_map(format_variables)
 
 
+@dataclass(frozen=True)
+class _HostLinkTemplate:
+    """Everything about an (inbound, host) pair that doesn't depend on the user."""
+    inbound: MappingProxyType
+    subscription_types: frozenset
+    remark: str
+    address: tuple
+    path: str
+    sni: tuple
+    host: tuple
+    sids: tuple
+    use_sni_as_host: bool
+
+    def allows(self, config_format: str) -> bool:
+        if not self.subscription_types:
+            return True
+        config_aliases = SUBSCRIPTION_TYPE_ALIASES.get(config_format, {config_format})
+        return not self.subscription_types.isdisjoint(config_aliases)
+
+
+def _build_host_link_template(inbound: dict, host: dict) -> _HostLinkTemplate:
+    subscription_types = frozenset(
+        str(value).strip().lower()
+        for value in host.get("subscription_types") or []
+        if str(value).strip()
+    )
+    host_inbound = dict(inbound)
+    host_inbound.update({
+        "port": host["port"] or inbound["port"],
+        "tls": inbound["tls"] if host["tls"] is None else host["tls"],
+        "alpn": host["alpn"] if host["alpn"] else None,
+        "fp": host["fingerprint"] or inbound.get("fp", ""),
+        "ais": host["allowinsecure"] or inbound.get("allowinsecure", ""),
+        "mux_enable": host["mux_enable"],
+        "fragment_setting": host["fragment_setting"],
+        "noise_setting": host["noise_setting"],
+        "random_user_agent": host["random_user_agent"],
+        "outbound_tag": host.get("outbound_tag"),
+        "balancer_tags": host.get("balancer_tags"),
+    })
+    return _HostLinkTemplate(
+        inbound=MappingProxyType(host_inbound),
+        subscription_types=subscription_types,
+        remark=host["remark"],
+        address=tuple(host["address"] or ()),
+        path=host["path"] if host["path"] is not None else inbound.get("path", ""),
+        sni=tuple(host["sni"] or inbound["sni"] or ()),
+        host=tuple(host["host"] or inbound["host"] or ()),
+        sids=tuple(inbound.get("sids") or ()),
+        use_sni_as_host=bool(host.get("use_sni_as_host", False)),
+    )
+
+
+_link_templates_lock = threading.Lock()
+_link_templates_key = None
+_link_templates: tuple[dict, dict] = ({}, {})
+# digest of the link templates and the format variables they use
+_link_templates_digest: tuple[str, frozenset] = ("", frozenset())
+
+
+def _get_link_templates() -> tuple[dict, dict]:
+    """
+    Returns the inbound order and the host link templates of every inbound tag.
+
+    Rebuilt when the xray config is replaced, the hosts are reloaded or the
+    default hosts setting changes.
+    """
+    global _link_templates_key, _link_templates, _link_templates_digest
+
+    xray.hosts.keys()  # loads the hosts on first use
+    key = (
+        xray.config,
+        xray.hosts.version,
+        config_module.SUBSCRIPTION_HIDE_DEFAULT_HOSTS_WHEN_CUSTOM_HOSTS,
+    )
+    current_key = _link_templates_key
+    # the config is a dict, compare it by identity, it is replaced as a whole on edits
+    if current_key is not None and current_key[0] is key[0] and current_key[1:] == key[1:]:
+        return _link_templates
+
+    inbounds_by_tag = xray.config.inbounds_by_tag
+    order = {tag: index for index, tag in enumerate(inbounds_by_tag.keys())}
+    templates = {}
+    for tag, inbound in inbounds_by_tag.items():
+        hosts = xray.hosts.get(tag, [])
+        if hosts:
+            default_hosts = [host for host in hosts if is_default_host(host)]
+            custom_hosts = [host for host in hosts if not is_default_host(host)]
+            if custom_hosts:
+                hosts = (
+                    custom_hosts
+                    if config_module.SUBSCRIPTION_HIDE_DEFAULT_HOSTS_WHEN_CUSTOM_HOSTS
+                    else custom_hosts + default_hosts
+                )
+        templates[tag] = tuple(_build_host_link_template(inbound, host) for host in hosts)
+
+    digest = hashlib.sha256(repr((order, templates)).encode()).hexdigest()
+    variables = _format_field_names(tuple(
+        text
+        for host_templates in templates.values()
+        for template in host_templates
+        for text in (template.remark, template.path, *template.address, *template.sni, *template.host)
+    ))
+
+    with _link_templates_lock:
+        _link_templates_key = key
+        _link_templates = (order, templates)
+        _link_templates_digest = (digest, variables)
+    return order, templates
+
+
+@lru_cache(maxsize=64)
+def _format_field_names(texts: tuple) -> frozenset:
+    names = set()
+    for text in texts:
+        try:
+            names.update(name for _, name, _, _ in Formatter().parse(text) if name)
+        except ValueError:
+            continue
+    return frozenset(names)
+
+
+@lru_cache(maxsize=1)
+def _config_digest(settings: str) -> str:
+    # settings are the only config changed at runtime, the rest needs a restart
+    values = sorted((key, repr(value)) for key, value in vars(config_module).items() if key.isupper())
+    return hashlib.sha256(repr(values).encode()).hexdigest()
+
+
+def _subscription_templates() -> tuple:
+    return (
+        config_module.CLASH_SUBSCRIPTION_TEMPLATE,
+        config_module.CLASH_SETTINGS_TEMPLATE,
+        config_module.SINGBOX_SUBSCRIPTION_TEMPLATE,
+        config_module.SINGBOX_SETTINGS_TEMPLATE,
+        config_module.MUX_TEMPLATE,
+        config_module.V2RAY_SUBSCRIPTION_TEMPLATE,
+        config_module.V2RAY_SETTINGS_TEMPLATE,
+        config_module.USER_AGENT_TEMPLATE,
+        config_module.GRPC_USER_AGENT_TEMPLATE,
+        *config_module.V2RAY_SUBSCRIPTION_TEMPLATES.values(),
+    )
+
+
+def get_subscription_inputs_digest(user: "UserResponse") -> str:
+    """
+    Returns a digest of everything the subscription of `user` is generated from.
+
+    That is the user's proxies, inbounds and status, the values of the format
+    variables the remarks actually use, the hosts and xray config, the
+    subscription templates and the settings. Random choices made while
+    generating (address, sni, sid and the salt of wildcard hosts) are left
+    out, every outcome of them is an equally valid copy.
+
+    Remarks using {TIME_LEFT} change every minute, {DAYS_LEFT} every day and
+    {DATA_USAGE}, {DATA_LEFT} or {USAGE_PERCENTAGE} with any traffic, so users
+    on such hosts only get a 304 while those values stay the same.
+    """
+    from app.settings import SETTINGS_BY_KEY
+
+    _get_link_templates()
+    hosts_digest, variables = _link_templates_digest
+
+    status = user.status.value if hasattr(user.status, "value") else user.status
+    notes = get_status_notes(status) if status in {"expired", "limited", "disabled"} else []
+    if notes:
+        variables = variables | _format_field_names(tuple(notes))
+    format_variables = get_format_variables({
+        "username": user.username,
+        "used_traffic": user.used_traffic,
+        "data_limit": user.data_limit,
+        "expire": user.expire,
+        "status": user.status,
+        "on_hold_expire_duration": user.on_hold_expire_duration,
+    })
+
+    digest = hashlib.sha256(hosts_digest.encode())
+    digest.update(_config_digest(repr([getattr(config_module, key, None) for key in SETTINGS_BY_KEY])).encode())
+    for template in _subscription_templates():
+        digest.update(get_template_digest(template).encode())
+    digest.update(user.model_dump_json(include={"proxies", "inbounds"}).encode())
+    digest.update(repr((status, notes, sorted((name, format_variables[name]) for name in variables))).encode())
+    return digest.hexdigest()
+
+
+def _format(template: str, format_variables: dict) -> str:
+    if "{" not in template and "}" not in template:
+        return template
+    return template.format_map(format_variables)
+
+
 def process_inbounds_and_tags(
         inbounds: dict,
         proxies: dict,
@@ -469,101 +709,73 @@ def process_inbounds_and_tags(
         reverse=False,
         custom_remarks: list[str] | None = None,
 ) -> Union[List, str]:
-    _inbounds = []
-    for protocol, tags in inbounds.items():
-        for tag in tags:
-            _inbounds.append((protocol, [tag]))
-    index_dict = {proxy: index for index, proxy in enumerate(
-        xray.config.inbounds_by_tag.keys())}
+    order, link_templates = _get_link_templates()
     inbounds = sorted(
-        _inbounds, key=lambda x: index_dict.get(x[1][0], float('inf')))
+        ((protocol, tag) for protocol, tags in inbounds.items() for tag in tags),
+        key=lambda x: order.get(x[1], float('inf')),
+    )
 
     entries = []
-    for protocol, tags in inbounds:
+    dumped_settings = {}
+    for protocol, tag in inbounds:
         settings = proxies.get(protocol)
         if not settings:
             continue
+        if tag not in order:
+            continue
 
-        format_variables.update({"PROTOCOL": protocol.name})
-        for tag in tags:
-            inbound = xray.config.inbounds_by_tag.get(tag)
-            if not inbound:
+        if protocol not in dumped_settings:
+            dumped_settings[protocol] = settings.model_dump()
+        # a copy keeps the "<missing>" default of the variables
+        inbound_variables = format_variables.copy()
+        inbound_variables.update({
+            "PROTOCOL": protocol.name,
+            "TRANSPORT": xray.config.inbounds_by_tag[tag]["network"],
+        })
+
+        for template in link_templates.get(tag, ()):
+            if not template.allows(config_format):
                 continue
 
-            format_variables.update({"TRANSPORT": inbound["network"]})
-            hosts = xray.hosts.get(tag, [])
-            if hosts:
-                default_hosts = [host for host in hosts if is_default_host(host)]
-                custom_hosts = [host for host in hosts if not is_default_host(host)]
-                if custom_hosts:
-                    hosts = (
-                        custom_hosts
-                        if config_module.SUBSCRIPTION_HIDE_DEFAULT_HOSTS_WHEN_CUSTOM_HOSTS
-                        else custom_hosts + default_hosts
-                    )
-
-            for host in hosts:
-                if not _host_allows_subscription_type(host, config_format):
-                    continue
-                host_inbound = inbound.copy()
-                sni = ""
-                sni_list = host["sni"] or inbound["sni"]
-                if sni_list:
-                    salt = secrets.token_hex(8)
-                    sni = random.choice(sni_list).replace("*", salt)
-
-                sid_value = inbound.get("sid")
-                if sids := inbound.get("sids"):
-                    sid_value = random.choice(sids)
-
-                req_host = ""
-                req_host_list = host["host"] or inbound["host"]
-                if req_host_list:
-                    salt = secrets.token_hex(8)
-                    req_host = random.choice(req_host_list).replace("*", salt)
-
-                address = ""
-                address_list = host['address']
-                if host['address']:
-                    salt = secrets.token_hex(8)
-                    address = random.choice(address_list).replace('*', salt)
-
-                if host["path"] is not None:
-                    path = host["path"].format_map(format_variables)
-                else:
-                    path = inbound.get("path", "").format_map(format_variables)
-
-                if host.get("use_sni_as_host", False) and sni:
-                    req_host = sni
-
-                host_update = {
-                    "port": host["port"] or inbound["port"],
-                    "sni": sni,
-                    "host": req_host,
-                    "tls": inbound["tls"] if host["tls"] is None else host["tls"],
-                    "alpn": host["alpn"] if host["alpn"] else None,
-                    "path": path,
-                    "fp": host["fingerprint"] or inbound.get("fp", ""),
-                    "ais": host["allowinsecure"] or inbound.get("allowinsecure", ""),
-                    "mux_enable": host["mux_enable"],
-                    "fragment_setting": host["fragment_setting"],
-                    "noise_setting": host["noise_setting"],
-                    "random_user_agent": host["random_user_agent"],
-                    "sid": sid_value or "",
-                    "outbound_tag": host.get("outbound_tag"),
-                    "balancer_tags": host.get("balancer_tags"),
+            sni = ""
+            if template.sni:
+                salt = secrets.token_hex(8)
+                sni = random.choice(template.sni).replace("*", salt)
+
+            sid_value = template.inbound.get("sid")
+            if template.sids:
+                sid_value = random.choice(template.sids)
+
+            req_host = ""
+            if template.host:
+                salt = secrets.token_hex(8)
+                req_host = random.choice(template.host).replace("*", salt)
+
+            address = ""
+            if template.address:
+                salt = secrets.token_hex(8)
+                address = random.choice(template.address).replace('*', salt)
+
+            if template.use_sni_as_host and sni:
+                req_host = sni
+
+            host_inbound = dict(template.inbound)
+            host_inbound.update({
+                "sni": sni,
+                "host": req_host,
+                "path": _format(template.path, inbound_variables),
+                "sid": sid_value or "",
+            })
+
+            entries.append(
+                {
+                    "remark": _format(template.remark, inbound_variables),
+                    "address": _format(address, inbound_variables),
+                    "inbound": host_inbound,
+                    "settings": dumped_settings[protocol],
+                    "format_variables": inbound_variables,
                 }
-                host_inbound.update(host_update)
-
-                entries.append(
-                    {
-                        "remark": host["remark"].format_map(format_variables),
-                        "address": address.format_map(format_variables),
-                        "inbound": host_inbound,
-                        "settings": settings.model_dump(),
-                        "format_variables": format_variables.copy(),
-                    }
-                )
+            )
 
     if custom_remarks:
         total_entries = len(entries)
@@ -6,7 +6,7 @@ from app.utils.helpers import UUIDEncoder
 from jinja2.exceptions import TemplateNotFound
 
 from app.subscription.funcs import get_grpc_gun
-from app.templates import render_template
+from app.templates import render_parsed_template
 import config as config_module
 
 
@@ -14,13 +14,12 @@ class SingBoxConfiguration(str):
 
     def __init__(self):
         self.proxy_remarks = []
-        self.config = json.loads(
-            render_template(config_module.SINGBOX_SUBSCRIPTION_TEMPLATE)
-        )
-        self.mux_template = render_template(config_module.MUX_TEMPLATE)
-        user_agent_data = json.loads(
-            render_template(config_module.USER_AGENT_TEMPLATE)
+        # parsed templates are shared between requests, copy before changing them
+        self.config = copy.deepcopy(
+            render_parsed_template(config_module.SINGBOX_SUBSCRIPTION_TEMPLATE)
         )
+        self.mux_template = render_parsed_template(config_module.MUX_TEMPLATE)
+        user_agent_data = render_parsed_template(config_module.USER_AGENT_TEMPLATE)
 
         if 'list' in user_agent_data and isinstance(user_agent_data['list'], list):
             self.user_agent_list = user_agent_data['list']
@@ -28,9 +27,7 @@ class SingBoxConfiguration(str):
             self.user_agent_list = []
 
         try:
-            self.settings = json.loads(
-                render_template(config_module.SINGBOX_SETTINGS_TEMPLATE)
-            )
+            self.settings = render_parsed_template(config_module.SINGBOX_SETTINGS_TEMPLATE)
         except TemplateNotFound:
             self.settings = {}
 
@@ -275,8 +272,7 @@ class SingBoxConfiguration(str):
                                             pbk=pbk, sid=sid, alpn=alpn,
                                             ais=ais)
 
-        mux_json = json.loads(self.mux_template)
-        mux_config = mux_json["sing-box"]
+        mux_config = copy.deepcopy(self.mux_template["sing-box"])
 
         config['multiplex'] = mux_config
         if config['multiplex']["enabled"]:
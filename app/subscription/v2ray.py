@@ -10,7 +10,7 @@ from uuid import UUID
 from jinja2.exceptions import TemplateNotFound
 
 from app.subscription.funcs import get_grpc_gun, get_grpc_multi
-from app.templates import render_template
+from app.templates import render_parsed_template
 from app.utils.helpers import UUIDEncoder
 import config as config_module
 
@@ -523,26 +523,27 @@ class V2rayJsonConfig(str):
         self.config = []
         self._config_templates = {}
         self._merged_appended = set()
-        self.template = render_template(config_module.V2RAY_SUBSCRIPTION_TEMPLATE)
+        # parsed templates are shared between requests, copy before changing them
+        self.template = render_parsed_template(config_module.V2RAY_SUBSCRIPTION_TEMPLATE)
         self.templates = {}
         for keyword, template_path in config_module.V2RAY_SUBSCRIPTION_TEMPLATES.items():
             try:
-                self.templates[keyword.upper()] = render_template(template_path)
+                self.templates[keyword.upper()] = render_parsed_template(template_path)
             except TemplateNotFound:
                 pass
-        self.meta_config = render_template(config_module.V2RAY_META_CONFIG)
-        self.mux_template = render_template(config_module.MUX_TEMPLATE)
-        user_agent_data = json.loads(
-            render_template(config_module.USER_AGENT_TEMPLATE)
-        )
+        try:
+            self.meta_config = render_parsed_template(config_module.V2RAY_META_CONFIG)
+        except json.JSONDecodeError:
+            self.meta_config = []
+        self.mux_template = render_parsed_template(config_module.MUX_TEMPLATE)
+        user_agent_data = render_parsed_template(config_module.USER_AGENT_TEMPLATE)
 
         if 'list' in user_agent_data and isinstance(user_agent_data['list'], list):
             self.user_agent_list = user_agent_data['list']
         else:
             self.user_agent_list = []
 
-        grpc_user_agent_data = json.loads(
-            render_template(config_module.GRPC_USER_AGENT_TEMPLATE))
+        grpc_user_agent_data = render_parsed_template(config_module.GRPC_USER_AGENT_TEMPLATE)
 
         if 'list' in grpc_user_agent_data and isinstance(grpc_user_agent_data['list'], list):
             self.grpc_user_agent_data = grpc_user_agent_data['list']
@@ -550,8 +551,7 @@ class V2rayJsonConfig(str):
             self.grpc_user_agent_data = []
 
         try:
-            self.settings = json.loads(
-                render_template(config_module.V2RAY_SETTINGS_TEMPLATE))
+            self.settings = render_parsed_template(config_module.V2RAY_SETTINGS_TEMPLATE)
         except TemplateNotFound:
             self.settings = {}
 
@@ -605,22 +605,18 @@ class V2rayJsonConfig(str):
         search_text = " ".join(search_texts).upper()
         for keyword, template in self.templates.items():
             if keyword in search_text:
-                json_template = json.loads(template)
+                json_template = copy.deepcopy(template)
                 break
 
         if json_template is None:
-            json_template = json.loads(self.template)
+            json_template = copy.deepcopy(self.template)
 
-        try:
-            meta_configs = json.loads(self.meta_config)
-            for meta_rule in meta_configs:
-                if meta_rule.get("serverName", "").upper() in remarks.upper():
-                    meta_data = {k: v for k, v in meta_rule.items() if k != "serverName"}
-                    if meta_data:
-                        json_template["meta"] = meta_data
-                    break
-        except json.JSONDecodeError:
-            pass
+        for meta_rule in self.meta_config:
+            if meta_rule.get("serverName", "").upper() in remarks.upper():
+                meta_data = {k: copy.deepcopy(v) for k, v in meta_rule.items() if k != "serverName"}
+                if meta_data:
+                    json_template["meta"] = meta_data
+                break
 
         return json_template
 
@@ -848,9 +844,9 @@ class V2rayJsonConfig(str):
                 "header": {}
             }))
         else:
-            config = self.settings.get("httpSettings", {
+            config = copy.deepcopy(self.settings.get("httpSettings", {
                 "header": {}
-            })
+            }))
         if "header" not in config:
             config["header"] = {}
 
@@ -1220,8 +1216,7 @@ class V2rayJsonConfig(str):
             scStreamUpServerSecs=inbound.get("scStreamUpServerSecs"),
         )
 
-        mux_json = json.loads(self.mux_template)
-        mux_config = mux_json["v2ray"]
+        mux_config = copy.deepcopy(self.mux_template["v2ray"])
 
         if inbound.get('mux_enable', False):
             outbound["mux"] = mux_config
@@ -16,6 +16,7 @@ from telebot.util import extract_arguments, user_link
 
 from app import xray
 from app.db import GetDB, crud
+from app.db.user_review_queue import user_review_queue
 from app.models.proxy import ProxyTypes
 from app.models.user import (
     UserCreate,
@@ -47,9 +48,10 @@ def get_system_info():
     cpu = cpu_usage()
     with GetDB() as db:
         bandwidth = crud.get_system_usage(db)
-        total_users = crud.get_users_count(db)
-        active_users = crud.get_users_count(db, UserStatus.active)
-        onhold_users = crud.get_users_count(db, UserStatus.on_hold)
+        breakdown = crud.get_users_status_breakdown(db)
+        total_users = sum(breakdown.values())
+        active_users = breakdown[UserStatus.active]
+        onhold_users = breakdown[UserStatus.on_hold]
     return """\
 🖥 *CPU Usage*: `{cpu_percent}%`    
 🎛 *CPU Core*: `{cpu_cores}`
@@ -192,12 +194,13 @@ def reset_usage_user_command(call: types.CallbackQuery):
 @bot.callback_query_handler(cb_query_equals('edit_all'), is_admin=True)
 def edit_all_command(call: types.CallbackQuery):
     with GetDB() as db:
-        total_users = crud.get_users_count(db)
-        active_users = crud.get_users_count(db, UserStatus.active)
-        disabled_users = crud.get_users_count(db, UserStatus.disabled)
-        expired_users = crud.get_users_count(db, UserStatus.expired)
-        limited_users = crud.get_users_count(db, UserStatus.limited)
-        onhold_users = crud.get_users_count(db, UserStatus.on_hold)
+        breakdown = crud.get_users_status_breakdown(db)
+        total_users = sum(breakdown.values())
+        active_users = breakdown[UserStatus.active]
+        disabled_users = breakdown[UserStatus.disabled]
+        expired_users = breakdown[UserStatus.expired]
+        limited_users = breakdown[UserStatus.limited]
+        onhold_users = breakdown[UserStatus.on_hold]
         text = f"""
 👥 *Total Users*: `{total_users}`
 ✅ *Active Users*: `{active_users}`
@@ -563,7 +566,7 @@ def edit_user_expire_step(message: types.Message, username: str):
 def users_command(call: types.CallbackQuery):
     page = int(call.data.split(':')[1]) if len(call.data.split(':')) > 1 else 1
     with GetDB() as db:
-        total_pages = math.ceil(crud.get_users_count(db) / 10)
+        total_pages = math.ceil(sum(crud.get_users_status_breakdown(db).values()) / 10)
         users = crud.get_users(db, offset=(page - 1) * 10, limit=10, sort=[crud.UsersSortingOptions["-created_at"]])
         text = """👥 Users: (Page {page}/{total_pages})
 ✅ Active
@@ -794,6 +797,7 @@ def template_charge_command(call: types.CallbackQuery):
             db_user.data_limit = (user.data_limit - user.used_traffic + template.data_limit
                                   ) if user.data_limit else template.data_limit
             db_user.status = UserStatus.active
+            user_review_queue.mark_changed((db_user.id,))
             bot.edit_message_text(
                 f"""\
 ‼️ <b>If add template <u>Data limit</u> and <u>Time</u> to the user, the user will be this</b>:\n\n\
@@ -850,6 +854,7 @@ def template_charge_command(call: types.CallbackQuery):
             db_user.data_limit = (user.data_limit - user.used_traffic + template.data_limit
                                   ) if user.data_limit else template.data_limit
             db_user.status = UserStatus.active
+            user_review_queue.mark_changed((db_user.id,))
             bot.edit_message_text(
                 f"""\
 ‼️ <b>If add template <u>Data limit</u> and <u>Time</u> to the user, the user will be this</b>:\n\n\
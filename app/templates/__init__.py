@@ -1,7 +1,11 @@
+import hashlib
+import json
+import threading
 from datetime import datetime
-from typing import Union
+from typing import Any, Callable, Union
 
 import jinja2
+import yaml
 
 import config as config_module
 
@@ -10,6 +14,24 @@ from .filters import CUSTOM_FILTERS
 _env: jinja2.Environment | None = None
 _custom_templates_directory: str | None = None
 
+# template name and compiler -> (jinja template it was compiled from, compiled value)
+_compiled_templates: dict[tuple[str, Callable], tuple[jinja2.Template, Any]] = {}
+_compiled_templates_lock = threading.Lock()
+
+
+def _parse_json(template: jinja2.Template) -> Any:
+    return json.loads(template.render({}))
+
+
+def _parse_yaml(template: jinja2.Template) -> Any:
+    return yaml.load(template.render({}), Loader=yaml.SafeLoader)
+
+
+_PARSERS = {
+    "json": _parse_json,
+    "yaml": _parse_yaml,
+}
+
 
 def _build_environment(custom_directory: str | None) -> jinja2.Environment:
     template_directories = ["app/templates"]
@@ -30,9 +52,61 @@ def _ensure_environment() -> jinja2.Environment:
     if _env is None or custom_directory != _custom_templates_directory:
         _custom_templates_directory = custom_directory
         _env = _build_environment(custom_directory)
+        invalidate_parsed_templates()
     return _env
 
 
 def render_template(template: str, context: Union[dict, None] = None) -> str:
     env = _ensure_environment()
     return env.get_template(template).render(context or {})
+
+
+def get_compiled_template(template: str, compiler: Callable[[jinja2.Template], Any]) -> Any:
+    """
+    Returns `compiler` applied to the jinja template, cached per process.
+
+    The compiled value is shared between callers and must not be modified.
+    It is recompiled when the template file changes on disk or after
+    invalidate_parsed_templates().
+    """
+    env = _ensure_environment()
+    # jinja only hands out a new Template object when the file has changed
+    jinja_template = env.get_template(template)
+    key = (template, compiler)
+    cached = _compiled_templates.get(key)
+    if cached is not None and cached[0] is jinja_template:
+        return cached[1]
+
+    value = compiler(jinja_template)
+    with _compiled_templates_lock:
+        _compiled_templates[key] = (jinja_template, value)
+    return value
+
+
+def render_parsed_template(template: str, fmt: str = "json") -> Any:
+    """
+    Renders a context free template and parses it as `fmt` ("json" or "yaml").
+
+    The parsed value is shared between callers and must not be modified,
+    deep-copy whatever is going to be changed.
+    """
+    return get_compiled_template(template, _PARSERS[fmt])
+
+
+def _source_digest(template: jinja2.Template) -> str:
+    environment = template.environment
+    source, _, _ = environment.loader.get_source(environment, template.name)
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def get_template_digest(template: str) -> str:
+    """Returns a digest of the template source, an empty string if it doesn't exist."""
+    try:
+        return get_compiled_template(template, _source_digest)
+    except jinja2.TemplateNotFound:
+        return ""
+
+
+def invalidate_parsed_templates() -> None:
+    with _compiled_templates_lock:
+        _compiled_templates.clear()
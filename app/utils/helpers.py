@@ -1,5 +1,6 @@
 import json
 from datetime import datetime as dt
+from datetime import timedelta
 from uuid import UUID
 
 
@@ -11,6 +12,14 @@ def calculate_expiration_days(expire: int) -> int:
     return (dt.fromtimestamp(expire) - dt.utcnow()).days
 
 
+def expiration_days_reached_at(expire: int, days: int) -> float:
+    """Returns the first whole second at which calculate_expiration_days(expire) <= days."""
+    # calculate_expiration_days compares the local expire time with the naive UTC now, so the
+    # result is on the same clock as datetime.utcnow().timestamp() the review job compares it with
+    reached = dt.fromtimestamp(expire) - timedelta(days=days + 1)
+    return reached.timestamp() + 1
+
+
 def yml_uuid_representer(dumper, data):
     return dumper.represent_scalar('tag:yaml.org,2002:str', str(data))
 
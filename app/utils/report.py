@@ -176,20 +176,31 @@ def user_subscription_revoked(user: UserResponse, by: Admin, user_admin: Admin =
             pass
 
 
+def _add_reminder(db: Session, reminder_type: ReminderType, expires_at: Optional[dt], user_id: int,
+                  threshold: Optional[int], pending_reminders: Optional[list]) -> None:
+    if pending_reminders is None:
+        create_notification_reminder(db, reminder_type, expires_at=expires_at, user_id=user_id, threshold=threshold)
+    else:
+        pending_reminders.append(
+            {"type": reminder_type, "expires_at": expires_at, "user_id": user_id, "threshold": threshold}
+        )
+
+
 def data_usage_percent_reached(
-        db: Session, percent: float, user: UserResponse, user_id: int, expire: Optional[int] = None, threshold: Optional[int] = None) -> None:
+        db: Session, percent: float, user: UserResponse, user_id: int, expire: Optional[int] = None,
+        threshold: Optional[int] = None, pending_reminders: Optional[list] = None) -> None:
     if config_module.NOTIFY_IF_DATA_USAGE_PERCENT_REACHED:
         notify(ReachedUsagePercent(username=user.username, user=user, used_percent=percent))
-        create_notification_reminder(db, ReminderType.data_usage,
-                                     expires_at=dt.utcfromtimestamp(expire) if expire else None, user_id=user_id, threshold=threshold)
+        _add_reminder(db, ReminderType.data_usage, dt.utcfromtimestamp(expire) if expire else None,
+                      user_id, threshold, pending_reminders)
 
 
-def expire_days_reached(db: Session, days: int, user: UserResponse, user_id: int, expire: int, threshold=None) -> None:
+def expire_days_reached(db: Session, days: int, user: UserResponse, user_id: int, expire: int, threshold=None,
+                        pending_reminders: Optional[list] = None) -> None:
     notify(ReachedDaysLeft(username=user.username, user=user, days_left=days))
     if config_module.NOTIFY_IF_DAYS_LEFT_REACHED:
-        create_notification_reminder(
-            db, ReminderType.expiration_date, expires_at=dt.utcfromtimestamp(expire),
-            user_id=user_id, threshold=threshold)
+        _add_reminder(db, ReminderType.expiration_date, dt.utcfromtimestamp(expire),
+                      user_id, threshold, pending_reminders)
 
 
 def login(username: str, password: str, client_ip: str, success: bool) -> None:
@@ -0,0 +1,162 @@
+import glob
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from app import logger
+
+# (node_id, hour the usage belongs to) -> {uid: traffic}
+UsageBuckets = Dict[Tuple[Optional[int], datetime], Dict[int, int]]
+
+
+def merge_usage_buckets(*buckets_list: UsageBuckets) -> UsageBuckets:
+    merged: UsageBuckets = defaultdict(lambda: defaultdict(int))
+    for buckets in buckets_list:
+        for key, values in buckets.items():
+            bucket = merged[key]
+            for uid, value in values.items():
+                bucket[uid] += value
+    return {key: dict(values) for key, values in merged.items()}
+
+
+class UsageBatch:
+    def __init__(self, buckets: UsageBuckets, segments: List[str], node_buckets: Optional[UsageBuckets] = None):
+        self.buckets = buckets
+        self.segments = segments
+        # already added to the user totals, only the per node rows are missing
+        self.node_buckets = node_buckets or {}
+
+    def __bool__(self):
+        return bool(self.buckets or self.node_buckets)
+
+
+class UsageAccumulator:
+    """
+    Merges per-tick user usage deltas in memory until they are flushed to the database.
+
+    Every tick is also appended to an append-only spool file, so deltas that were
+    already reset in Xray survive a crash and are replayed on the next startup.
+    Replay is at-least-once: a crash after a flush committed but before its spool
+    segments were removed records that flush again.
+
+    Per node usages whose user totals were already written are kept apart, in
+    memory only, and handed back with the next batch.
+    """
+
+    def __init__(self, spool_path: Optional[str] = None):
+        self.spool_path = spool_path
+        self._lock = threading.Lock()
+        self._buckets: UsageBuckets = defaultdict(lambda: defaultdict(int))
+        self._size = 0
+        # spool files rotated out for a flush that has not succeeded yet
+        self._segments: List[str] = []
+        self._node_buckets: UsageBuckets = {}
+        self._spool = None
+
+        if self.spool_path:
+            self._replay()
+
+    def __len__(self):
+        return self._size
+
+    def __bool__(self):
+        return bool(self._size or self._node_buckets)
+
+    def add(self, hour: datetime, usages: Dict[Optional[int], Dict[int, int]]):
+        entry = {
+            "hour": hour.isoformat(),
+            "nodes": [[node_id, list(values.items())] for node_id, values in usages.items() if values],
+        }
+        if not entry["nodes"]:
+            return
+
+        with self._lock:
+            try:
+                self._write_spool(entry)
+            except OSError as exc:
+                # still counted in memory, only a crash before the next flush would lose it
+                logger.warning(f"Failed to write user usages to the spool {self.spool_path}: {exc}")
+            self._merge(entry)
+
+    def take(self) -> UsageBatch:
+        with self._lock:
+            buckets, self._buckets = self._buckets, defaultdict(lambda: defaultdict(int))
+            self._size = 0
+            segments, self._segments = self._segments, []
+            node_buckets, self._node_buckets = self._node_buckets, {}
+            if self._spool:
+                self._spool.close()
+                self._spool = None
+            if self.spool_path and os.path.exists(self.spool_path):
+                segment = f"{self.spool_path}.{time.time_ns()}"
+                os.replace(self.spool_path, segment)
+                segments.append(segment)
+
+        return UsageBatch(dict(buckets), segments, node_buckets)
+
+    def commit(self, batch: UsageBatch):
+        for segment in batch.segments:
+            try:
+                os.remove(segment)
+            except FileNotFoundError:
+                pass
+
+    def restore(self, batch: UsageBatch):
+        with self._lock:
+            for (node_id, hour), values in batch.buckets.items():
+                bucket = self._buckets[(node_id, hour)]
+                for uid, value in values.items():
+                    if uid not in bucket:
+                        self._size += 1
+                    bucket[uid] += value
+            self._segments = batch.segments + self._segments
+            if batch.node_buckets:
+                self._node_buckets = merge_usage_buckets(batch.node_buckets, self._node_buckets)
+
+    def defer_node_usages(self, buckets: UsageBuckets):
+        """Keeps per node usages whose user totals are already stored for the next flush."""
+        if not buckets:
+            return
+        with self._lock:
+            self._node_buckets = merge_usage_buckets(self._node_buckets, buckets)
+
+    def _merge(self, entry: dict):
+        hour = datetime.fromisoformat(entry["hour"])
+        for node_id, values in entry["nodes"]:
+            bucket = self._buckets[(node_id, hour)]
+            for uid, value in values:
+                if uid not in bucket:
+                    self._size += 1
+                bucket[uid] += value
+
+    def _write_spool(self, entry: dict):
+        if not self.spool_path:
+            return
+        if self._spool is None:
+            directory = os.path.dirname(self.spool_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._spool = open(self.spool_path, "a", encoding="utf-8")
+        self._spool.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self._spool.flush()
+        os.fsync(self._spool.fileno())
+
+    def _replay(self):
+        segments = sorted(glob.glob(f"{glob.escape(self.spool_path)}.*"))
+        for path in segments + [self.spool_path]:
+            if not os.path.exists(path):
+                continue
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._merge(json.loads(line))
+                    except (ValueError, KeyError, TypeError):
+                        # a torn last line from a crash mid-write
+                        logger.warning(f"Skipping corrupt usage spool entry in {path}")
+        self._segments = [path for path in segments if os.path.exists(path)]
+        if self._size:
+            logger.info(f"Replayed {self._size} pending user usages from {self.spool_path}")
@@ -4,7 +4,7 @@ from typing import TYPE_CHECKING, Dict, Sequence
 from app.models.proxy import ProxyHostSecurity
 from app.utils.store import DictStorage
 from app.utils.system import check_port
-from app.xray import operations
+from app.xray import collector, operations
 from app.xray.config import XRayConfig
 from app.xray.core import XRayCore
 from app.xray.node import XRayNode
@@ -77,6 +77,7 @@ __all__ = [
     "api",
     "nodes",
     "operations",
+    "collector",
     "exceptions",
     "exc",
     "types",
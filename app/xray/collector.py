@@ -0,0 +1,117 @@
+"""
+Concurrent stats collection from the main core and the nodes over `grpc.aio`.
+
+All calls run on a single background event loop, so the async channels stay
+bound to one loop and a slow node only costs a pending coroutine instead of a
+worker thread.
+"""
+
+import asyncio
+import threading
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple, TypeVar, Union
+
+from xray_api import AsyncXRay
+from xray_api import XRay as XRayAPI
+import config as config_module
+
+T = TypeVar("T")
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+# node id -> (the sync api the client was built from, its async twin)
+_clients: Dict[Hashable, Tuple[XRayAPI, AsyncXRay]] = {}
+# keeps pending channel closes referenced until they finish
+_closing: Set[asyncio.Task] = set()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="xray-stats-collector", daemon=True).start()
+        return _loop
+
+
+def _close_client(client: AsyncXRay) -> None:
+    # only called from inside the collector loop
+    task = asyncio.ensure_future(client.close())
+    _closing.add(task)
+    task.add_done_callback(_closing.discard)
+
+
+def _get_client(key: Hashable, api: XRayAPI) -> AsyncXRay:
+    # only called from inside the collector loop
+    cached = _clients.get(key)
+    if cached is not None and cached[0] is api:
+        return cached[1]
+    if cached is not None:
+        # the node rebuilt its api (reconnect, new certificate), the old channel is dead weight
+        _close_client(cached[1])
+    client = AsyncXRay.from_api(api)
+    _clients[key] = (api, client)
+    return client
+
+
+def forget(key: Hashable) -> None:
+    """Closes the async client of a removed node."""
+    loop = _loop
+    if loop is None or loop.is_closed():
+        return
+
+    def close():
+        cached = _clients.pop(key, None)
+        if cached is not None:
+            _close_client(cached[1])
+
+    loop.call_soon_threadsafe(close)
+
+
+async def _fan_out(apis: Dict[Hashable, XRayAPI],
+                   call: Callable[[AsyncXRay], Awaitable[T]],
+                   timeout: float,
+                   concurrency: int) -> Dict[Hashable, Union[T, Exception]]:
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def run(key, api):
+        async with semaphore:
+            try:
+                # the grpc deadline fires first, this only guards a stuck channel
+                return key, await asyncio.wait_for(call(_get_client(key, api)), timeout + 1)
+            except Exception as exc:
+                return key, exc
+
+    return dict(await asyncio.gather(*(run(key, api) for key, api in apis.items())))
+
+
+def fan_out(apis: Dict[Hashable, XRayAPI],
+            call: Callable[[AsyncXRay], Awaitable[T]],
+            timeout: float) -> Dict[Hashable, Union[T, Exception]]:
+    """
+    Runs `call` against every api concurrently with a per-api deadline.
+
+    Failures don't abort the others; the exception is returned in place of the result.
+
+    Args:
+        apis (Dict[Hashable, XRayAPI]): Sync api instances keyed by node id.
+        call (Callable[[AsyncXRay], Awaitable[T]]): Coroutine function run against the async twin of each api.
+        timeout (float): Per-api deadline in seconds.
+
+    Returns:
+        Dict[Hashable, Union[T, Exception]]: Result or raised exception per key.
+    """
+    if not apis:
+        return {}
+    future = asyncio.run_coroutine_threadsafe(
+        _fan_out(apis, call, timeout, config_module.JOB_STATS_COLLECTOR_CONCURRENCY),
+        _get_loop()
+    )
+    return future.result()
+
+
+def query_stats(apis: Dict[Hashable, XRayAPI], pattern: str, reset: bool = False, timeout: float = 10):
+    return fan_out(apis, lambda client: client.query_stats(pattern, reset=reset, timeout=timeout), timeout)
+
+
+def get_sys_stats(apis: Dict[Hashable, XRayAPI], timeout: float = 2):
+    return fan_out(apis, lambda client: client.get_sys_stats(timeout=timeout), timeout)
@@ -1,7 +1,7 @@
 from functools import lru_cache
 import threading
 import time
-from typing import TYPE_CHECKING, Dict, List, Tuple
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
 from sqlalchemy.exc import SQLAlchemyError
 
@@ -78,11 +78,11 @@ def _alter_inbound_user(api: XRayAPI, inbound_tag: str, account: Account):
         pass
 
 
-def add_user(dbuser: "DBUser"):
+def _user_accounts(dbuser: "DBUser") -> List[Tuple[str, Account]]:
     user = UserResponse.model_validate(dbuser)
     email = f"{dbuser.id}.{dbuser.username}"
-    healthy_nodes = get_healthy_nodes()
 
+    accounts = []
     for proxy_type, inbound_tags in user.inbounds.items():
         for inbound_tag in inbound_tags:
             inbound = xray.config.inbounds_by_tag.get(inbound_tag, {})
@@ -107,16 +107,57 @@ def add_user(dbuser: "DBUser"):
             ):
                 account.flow = XTLSFlows.NONE
 
-            _add_user_to_inbound(xray.api, inbound_tag, account)  # main core
-            for node_id, node in healthy_nodes:
-                try:
-                    _add_user_to_inbound(node.api, inbound_tag, account)
-                except Exception as e:
-                    logger.warning(
-                        f"XRAY node add failed for user \"{dbuser.username}\" on inbound \"{inbound_tag}\""
-                        f" (node {node_id}): {e}"
-                    )
-                    mark_node_error(node_id, str(e))
+            accounts.append((inbound_tag, account))
+    return accounts
+
+
+def add_user(dbuser: "DBUser"):
+    healthy_nodes = get_healthy_nodes()
+
+    for inbound_tag, account in _user_accounts(dbuser):
+        _add_user_to_inbound(xray.api, inbound_tag, account)  # main core
+        for node_id, node in healthy_nodes:
+            try:
+                _add_user_to_inbound(node.api, inbound_tag, account)
+            except Exception as e:
+                logger.warning(
+                    f"XRAY node add failed for user \"{dbuser.username}\" on inbound \"{inbound_tag}\""
+                    f" (node {node_id}): {e}"
+                )
+                mark_node_error(node_id, str(e))
+
+
+@threaded_function
+def _add_users_to_inbounds(api: XRayAPI, accounts: List[Tuple[str, Account]], node_id: Optional[int] = None):
+    # runs in its own thread, failures have to be handled here, the caller never sees them
+    try:
+        for inbound_tag, account in accounts:
+            try:
+                api.add_inbound_user(tag=inbound_tag, user=account, timeout=30)
+            except (
+                xray.exc.EmailExistsError,
+                xray.exc.TagNotFoundError,
+            ):
+                pass
+    except Exception as e:
+        # a connection error or timeout means the core is unreachable,
+        # the rest would only wait for their own timeouts
+        if node_id is None:
+            logger.warning(f"XRAY add failed for {len(accounts)} accounts on the main core: {e}")
+            return
+        logger.warning(f"XRAY node add failed for {len(accounts)} accounts (node {node_id}): {e}")
+        mark_node_error(node_id, str(e))
+
+
+def add_users(dbusers: List["DBUser"]):
+    """Adds many users with one worker per core instead of one per user, inbound and node."""
+    accounts = [account for dbuser in dbusers for account in _user_accounts(dbuser)]
+    if not accounts:
+        return
+
+    _add_users_to_inbounds(xray.api, accounts)  # main core
+    for node_id, node in get_healthy_nodes():
+        _add_users_to_inbounds(node.api, accounts, node_id)
 
 
 def remove_user(dbuser: "DBUser"):
@@ -205,6 +246,7 @@ def remove_node(node_id: int):
                 del xray.nodes[node_id]
             except KeyError:
                 pass
+            xray.collector.forget(node_id)
 
 
 def add_node(dbnode: "DBNode"):
@@ -0,0 +1,90 @@
+"""
+Times GET /api/users for a page of users with share links, without them
+(include_links=false) and with a small field projection.
+
+Run it from the repository root with the environment the panel runs with,
+links are generated from its Xray config and hosts:
+
+    python -m benchmarks.list_users --users 5000 --repeat 5
+
+The users are created in a temporary SQLite database.
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app import xray
+from app.db.base import Base
+from app.db.models import Proxy, User
+from app.models.admin import Admin
+from app.models.user import UserCreate, UsersResponse
+from app.routers.user import get_users
+
+VARIANTS = {
+    "with links": {"include_links": True, "fields": None},
+    "include_links=false": {"include_links": False, "fields": None},
+    "fields=username,status,used_traffic": {"include_links": False, "fields": "username,status,used_traffic"},
+}
+
+
+def populate(db: Session, users: int):
+    protocols = {inbound["protocol"]: {} for inbound in xray.config.inbounds_by_tag.values()}
+    for i in range(users):
+        user = UserCreate(username=f"bench{i}", proxies=protocols)
+        db.add(User(
+            username=user.username,
+            proxies=[Proxy(type=proxy_type.value, settings=settings.dict(no_obj=True))
+                     for proxy_type, settings in user.proxies.items()],
+            status=user.status,
+            data_limit_reset_strategy=user.data_limit_reset_strategy,
+        ))
+    db.commit()
+
+
+def list_users(db: Session, admin: Admin, users: int, include_links: bool, fields) -> bytes:
+    response = get_users(offset=None, limit=users, username=None, search=None, owner=None, status=None,
+                         sort=None, fields=fields, include_links=include_links, cursor=None, db=db, admin=admin)
+    if isinstance(response, dict):
+        # what FastAPI does with the response_model
+        return UsersResponse.model_validate(response).model_dump_json().encode()
+    return response.body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    admin = Admin(username="bench", is_sudo=True)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        engine = create_engine(f"sqlite:///{os.path.join(tmpdir, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        with Session(engine) as db:
+            populate(db, args.users)
+
+        print(f"{args.users} users, best and median of {args.repeat} runs")
+        print(f"{'variant':<40}{'best':>9}{'median':>9}{'size':>12}")
+        durations = {name: [] for name in VARIANTS}
+        sizes = {}
+        # variants take turns, so drift over the run doesn't favour one of them
+        for _ in range(args.repeat):
+            for name, params in VARIANTS.items():
+                # a fresh session per request, as the endpoint gets
+                with Session(engine) as db:
+                    started = time.perf_counter()
+                    sizes[name] = len(list_users(db, admin, args.users, **params))
+                    durations[name].append(time.perf_counter() - started)
+        for name, runs in durations.items():
+            print(f"{name:<40}{min(runs):>8.3f}s{statistics.median(runs):>8.3f}s{sizes[name] // 1024:>9} KiB")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -19,7 +19,10 @@ def list_users(
     username: Optional[List[str]] = typer.Option(None, *utils.FLAGS["username"], help="Search by username(s)"),
     search: Optional[str] = typer.Option(None, *utils.FLAGS["search"], help="Search by username/note"),
     status: Optional[crud.UserStatus] = typer.Option(None, *utils.FLAGS["status"]),
-    admins: Optional[List[str]] = typer.Option(None, *utils.FLAGS["admin"], help="Search by owner admin's username(s)")
+    admins: Optional[List[str]] = typer.Option(None, *utils.FLAGS["admin"], help="Search by owner admin's username(s)"),
+    cursor: Optional[str] = typer.Option(
+        None, "--cursor", help="Keyset pagination cursor, pass an empty value for the first page"
+    ),
 ):
     """
     Displays a table of users
@@ -27,11 +30,14 @@ def list_users(
     NOTE: Sorting is not currently available.
     """
     with GetDB() as db:
-        users: list[User] = crud.get_users(
-            db=db, offset=offset, limit=limit,
-            usernames=username, search=search, status=status,
-            admins=admins
-        )
+        try:
+            users, total = crud.get_users(
+                db=db, offset=offset, limit=limit,
+                usernames=username, search=search, status=status,
+                admins=admins, return_with_count=True, cursor=cursor
+            )
+        except ValueError as exc:
+            utils.error(str(exc))
 
         utils.print_table(
             table=Table(
@@ -53,6 +59,10 @@ def list_users(
             ]
         )
 
+        typer.echo(f"Total: {total}")
+        if cursor is not None and limit and len(users) == limit:
+            typer.echo(f"Next cursor: {crud.get_users_cursor(users[-1])}")
+
 
 @app.command(name="set-owner")
 def set_owner(
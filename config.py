@@ -132,6 +132,12 @@ ONHOLD_STATUS_TEXT = config("ONHOLD_STATUS_TEXT", default="On-Hold")
 
 USERS_AUTODELETE_DAYS = config("USERS_AUTODELETE_DAYS", default=-1, cast=int)
 USER_AUTODELETE_INCLUDE_LIMITED_ACCOUNTS = config("USER_AUTODELETE_INCLUDE_LIMITED_ACCOUNTS", default=False, cast=bool)
+# reuse the total count of a user listing with the same filters for this many seconds (0 always counts)
+USERS_COUNT_CACHE_TTL = config("USERS_COUNT_CACHE_TTL", default=0, cast=int)
+# per-status user counts of the dashboard and telegram stats, cached per admin for this many seconds
+USERS_STATUS_BREAKDOWN_CACHE_TTL = config("USERS_STATUS_BREAKDOWN_CACHE_TTL", default=5, cast=int)
+# search usernames and notes through the SQLite FTS5 / MySQL FULLTEXT index when the migration created it
+USERS_FULLTEXT_SEARCH = config("USERS_FULLTEXT_SEARCH", default=True, cast=bool)
 
 
 # USERNAME: PASSWORD
@@ -175,6 +181,17 @@ SUB_UPDATE_INTERVAL = config("SUB_UPDATE_INTERVAL", default="12")
 SUB_SUPPORT_URL = config("SUB_SUPPORT_URL", default="https://t.me/")
 SUB_PROFILE_TITLE = config("SUB_PROFILE_TITLE", default="Subscription")
 
+# generated subscriptions are cached per (user, format) variant until the user changes or the ttl passes
+# "memory" keeps a per-process LRU, "sqlite" shares an on-disk LRU between worker processes
+SUBSCRIPTION_CACHE_BACKEND = config("SUBSCRIPTION_CACHE_BACKEND", default="memory")
+SUBSCRIPTION_CACHE_PATH = config("SUBSCRIPTION_CACHE_PATH", default="subscription_cache.sqlite3")
+SUBSCRIPTION_CACHE_TTL = config("SUBSCRIPTION_CACHE_TTL", cast=int, default=60)
+SUBSCRIPTION_CACHE_MAX_ENTRIES = config("SUBSCRIPTION_CACHE_MAX_ENTRIES", cast=int, default=10000)
+SUBSCRIPTION_CACHE_MAX_BYTES = config("SUBSCRIPTION_CACHE_MAX_BYTES", cast=int, default=64 * 1024 * 1024)
+# compress subscription bodies larger than this (gzip, and brotli when the package is installed)
+SUBSCRIPTION_COMPRESSION = config("SUBSCRIPTION_COMPRESSION", cast=bool, default=True)
+SUBSCRIPTION_COMPRESSION_MIN_SIZE = config("SUBSCRIPTION_COMPRESSION_MIN_SIZE", cast=int, default=1024)
+
 def _parse_subscription_custom_headers(value):
     if value is None or value == "":
         return []
@@ -282,9 +299,17 @@ JOB_CORE_HEALTH_CHECK_INTERVAL = config("JOB_CORE_HEALTH_CHECK_INTERVAL", cast=i
 JOB_RECORD_NODE_USAGES_INTERVAL = config("JOB_RECORD_NODE_USAGES_INTERVAL", cast=int, default=30)
 JOB_RECORD_USER_USAGES_INTERVAL = config("JOB_RECORD_USER_USAGES_INTERVAL", cast=int, default=10)
 JOB_REVIEW_USERS_INTERVAL = config("JOB_REVIEW_USERS_INTERVAL", cast=int, default=10)
+# review only users whose usage or limits changed and whose timers fired, with a full scan every N seconds (0 always scans)
+JOB_REVIEW_USERS_FULL_SCAN_INTERVAL = config("JOB_REVIEW_USERS_FULL_SCAN_INTERVAL", cast=int, default=600)
 JOB_SEND_NOTIFICATIONS_INTERVAL = config("JOB_SEND_NOTIFICATIONS_INTERVAL", cast=int, default=30)
 JOB_RECORD_REALTIME_BANDWIDTH_INTERVAL = config("JOB_RECORD_REALTIME_BANDWIDTH_INTERVAL", cast=int, default=2)
 JOB_RECORD_USER_USAGES_WORKERS = config("JOB_RECORD_USER_USAGES_WORKERS", cast=int, default=10)
+# query nodes' stats concurrently over grpc.aio instead of the worker threads above
+# one stats query per node feeds both the user and node usage recorders every JOB_RECORD_USER_USAGES_INTERVAL,
+# node usages are then recorded on that interval instead of JOB_RECORD_NODE_USAGES_INTERVAL
+JOB_RECORD_USAGES_COMBINED = config("JOB_RECORD_USAGES_COMBINED", cast=bool, default=False)
+JOB_STATS_ASYNC_COLLECTOR = config("JOB_STATS_ASYNC_COLLECTOR", cast=bool, default=True)
+JOB_STATS_COLLECTOR_CONCURRENCY = config("JOB_STATS_COLLECTOR_CONCURRENCY", cast=int, default=50)
 JOB_CORE_HEALTH_CHECK_MAX_INSTANCES = config("JOB_CORE_HEALTH_CHECK_MAX_INSTANCES", cast=int, default=10)
 JOB_RECORD_USER_USAGES_MAX_INSTANCES = config("JOB_RECORD_USER_USAGES_MAX_INSTANCES", cast=int, default=10)
 JOB_RECORD_NODE_USAGES_MAX_INSTANCES = config("JOB_RECORD_NODE_USAGES_MAX_INSTANCES", cast=int, default=10)
@@ -294,3 +319,16 @@ JOB_RECORD_REALTIME_BANDWIDTH_MAX_INSTANCES = config(
     default=1
 )
 JOB_HWID_DEVICE_CLEANUP_INTERVAL = config("JOB_HWID_DEVICE_CLEANUP_INTERVAL", cast=int, default=3600)
+JOB_CHECK_USER_ADMIN_MAP_INTERVAL = config("JOB_CHECK_USER_ADMIN_MAP_INTERVAL", cast=int, default=3600)
+
+# Write-behind for user usages: 0 flushes every record tick right away, still through the spool
+JOB_FLUSH_USER_USAGES_INTERVAL = config("JOB_FLUSH_USER_USAGES_INTERVAL", cast=int, default=0)
+# flush earlier once this many (node, user) usages are pending
+USER_USAGES_FLUSH_THRESHOLD = config("USER_USAGES_FLUSH_THRESHOLD", cast=int, default=100000)
+USER_USAGES_SPOOL_PATH = config("USER_USAGES_SPOOL_PATH", default="/var/lib/marzban/user_usages.spool")
+
+# Delete hourly node_user_usages rows older than this many days (0 keeps them forever)
+USER_USAGES_RETENTION_DAYS = config("USER_USAGES_RETENTION_DAYS", cast=int, default=0)
+# only delete hours that have already been folded into the daily rollup
+USER_USAGES_RETENTION_REQUIRE_ROLLUP = config("USER_USAGES_RETENTION_REQUIRE_ROLLUP", cast=bool, default=True)
+USER_USAGES_RETENTION_CHUNK_SIZE = config("USER_USAGES_RETENTION_CHUNK_SIZE", cast=int, default=5000)
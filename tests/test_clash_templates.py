@@ -0,0 +1,146 @@
+"""
+Golden checks for Clash subscriptions: the compiled template path must emit
+exactly what rendering, parsing and yaml.dump(..., sort_keys=False,
+allow_unicode=True) of the template emits, for the default template and for
+custom ones.
+"""
+
+from uuid import UUID
+
+import pytest
+import yaml
+
+import config as config_module
+from app.subscription.clash import ClashConfiguration, _CompiledClashTemplate
+from app.templates import get_compiled_template, invalidate_parsed_templates, render_template
+from app.utils.helpers import yml_uuid_representer
+
+CUSTOM_TEMPLATES = {
+    # the default layout with sorted keys, as the yaml filter emits them
+    "sorted.yml": """\
+port: 7890
+{{ conf | yaml }}
+""",
+    # lists placed by hand, no groups of its own
+    "lists.yml": """\
+mixed-port: 7890
+allow-lan: false
+proxies:
+{{ conf.proxies | yaml }}
+proxy-groups:
+- name: all
+  type: select
+  proxies:
+  {{ proxy_remarks | yaml | indent(2) }}
+rules:
+- MATCH,all
+""",
+    # iterates the proxies itself, which the compiled path can't follow
+    "loop.yml": """\
+proxies:
+{% for proxy in conf.proxies %}
+- name: {{ proxy.name | tojson }}
+  type: {{ proxy.type }}
+  server: {{ proxy.server }}
+  port: {{ proxy.port }}
+{% endfor %}
+rules:
+- MATCH,DIRECT
+""",
+}
+
+
+def sample_proxies():
+    return [
+        {"name": "🇩🇪 Germany [VLESS - ws]", "type": "vless", "server": "de.example.com", "port": 443,
+         "uuid": UUID("4f6b8c1e-3c0a-4d8e-9a4f-1d2b3c4d5e6f"), "network": "ws", "tls": True, "udp": True,
+         "servername": "de.example.com", "client-fingerprint": "chrome",
+         "ws-opts": {"path": "/ws?ed=2048", "headers": {"Host": "de.example.com",
+                                                       "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                                                                     "AppleWebKit/537.36 (KHTML, like Gecko)"}}},
+        {"name": "yes", "type": "trojan", "server": "2001:db8::1", "port": 8443, "password": "0123",
+         "network": "tcp", "sni": "*.example.com", "udp": True, "skip-cert-verify": False},
+        {"name": "Сервер: 3 #note", "type": "ss", "server": "10.0.0.3", "port": 1080,
+         "cipher": "chacha20-ietf-poly1305", "password": "p@ss: 'quoted' \"double\"", "udp": False},
+    ]
+
+
+def baseline(conf: ClashConfiguration) -> str:
+    yaml.add_representer(UUID, yml_uuid_representer)
+    return yaml.dump(
+        yaml.load(
+            render_template(
+                config_module.CLASH_SUBSCRIPTION_TEMPLATE,
+                {"conf": conf.data, "proxy_remarks": conf.proxy_remarks}
+            ),
+            Loader=yaml.SafeLoader
+        ),
+        sort_keys=False,
+        allow_unicode=True,
+    )
+
+
+def compiled_structure(conf: ClashConfiguration):
+    compiled = get_compiled_template(config_module.CLASH_SUBSCRIPTION_TEMPLATE, _CompiledClashTemplate)
+    return compiled.structure({
+        "proxies": conf.data["proxies"],
+        "proxy-groups": conf.data["proxy-groups"],
+        "rules": conf.data["rules"],
+        "proxy_remarks": conf.proxy_remarks,
+    })
+
+
+@pytest.fixture
+def template(request, tmp_path, monkeypatch):
+    name = request.param
+    if name in CUSTOM_TEMPLATES:
+        (tmp_path / "clash").mkdir()
+        (tmp_path / "clash" / name).write_text(CUSTOM_TEMPLATES[name], encoding="utf-8")
+        monkeypatch.setattr(config_module, "CUSTOM_TEMPLATES_DIRECTORY", str(tmp_path))
+        name = f"clash/{name}"
+    monkeypatch.setattr(config_module, "CLASH_SUBSCRIPTION_TEMPLATE", name)
+    invalidate_parsed_templates()
+    yield name
+    invalidate_parsed_templates()
+
+
+def make_configuration(proxies, groups=(), rules=()) -> ClashConfiguration:
+    conf = ClashConfiguration()
+    for proxy in proxies:
+        conf.data["proxies"].append(proxy)
+        conf.proxy_remarks.append(proxy["name"])
+    conf.data["proxy-groups"].extend(groups)
+    conf.data["rules"].extend(rules)
+    return conf
+
+
+ALL_TEMPLATES = ["clash/default.yml"] + [*CUSTOM_TEMPLATES]
+
+
+@pytest.mark.parametrize("template", ALL_TEMPLATES, indirect=True)
+@pytest.mark.parametrize("groups,rules", [
+    ((), ()),
+    ([{"name": "🚀 Proxy", "type": "select", "proxies": ["yes", "DIRECT"]}],
+     ["DOMAIN-SUFFIX,example.com,🚀 Proxy", "GEOIP,IR,DIRECT", "MATCH,🚀 Proxy"]),
+])
+def test_matches_baseline(template, groups, rules):
+    conf = make_configuration(sample_proxies(), groups, rules)
+    assert conf.render() == baseline(conf)
+
+
+@pytest.mark.parametrize("template", ALL_TEMPLATES, indirect=True)
+def test_matches_baseline_without_proxies(template):
+    conf = make_configuration([])
+    assert conf.render() == baseline(conf)
+
+
+@pytest.mark.parametrize("template", ["clash/default.yml", "sorted.yml", "lists.yml"], indirect=True)
+def test_compiled_path_is_used(template):
+    conf = make_configuration(sample_proxies())
+    assert compiled_structure(conf) is not None
+
+
+@pytest.mark.parametrize("template", ["loop.yml"], indirect=True)
+def test_unfollowable_template_falls_back(template):
+    conf = make_configuration(sample_proxies())
+    assert compiled_structure(conf) is None
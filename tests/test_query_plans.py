@@ -0,0 +1,128 @@
+"""
+Query-plan regression checks for the indexes of the hot crud queries.
+
+Every test runs a crud function against an empty in-memory SQLite database,
+captures the statements it sends and asserts SQLite's EXPLAIN QUERY PLAN of
+the one touching the table searches the expected index.
+"""
+
+import re
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.db import crud
+from app.db.base import Base
+from app.db.models import (
+    Admin,
+    NodeUserUsage,
+    NodeUserUsageDaily,
+    NodeUserUsageMonthly,
+    User,
+)
+from app.models.user import ReminderType, UserStatus
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+@contextmanager
+def captured(engine):
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+
+def query_plan(engine, statement, parameters) -> str:
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+    return "\n".join(row[-1] for row in rows)
+
+
+def assert_index_used(engine, statements, table: str, index: str, where: str = ""):
+    plans = [
+        query_plan(engine, statement, parameters)
+        for statement, parameters in statements
+        if re.search(rf"\bFROM {table}\b", statement)
+        and statement.lstrip().upper().startswith(("SELECT", "DELETE"))
+        and where in statement
+    ]
+    assert plans, f"no query on {table} was captured"
+    for plan in plans:
+        assert index in plan, f"{table} query does not use {index}:\n{plan}"
+
+
+def test_count_online_users(engine, db):
+    with captured(engine) as statements:
+        crud.count_online_users(db)
+    assert_index_used(engine, statements, "users", "ix_users_online_at")
+
+
+def test_users_count_by_admin_and_status(engine, db):
+    admin = Admin(username="admin", hashed_password="x")
+    db.add(admin)
+    db.commit()
+
+    with captured(engine) as statements:
+        crud.get_users_count(db, status=UserStatus.active, admin=admin)
+    assert_index_used(engine, statements, "users", "ix_users_admin_id_status")
+
+
+def test_user_usages(engine, db):
+    user = User(username="user")
+    db.add(user)
+    db.commit()
+    now = datetime.utcnow()
+    # rollups up to last month and yesterday, so every granularity gets a segment
+    last_month = (now.replace(day=1) - timedelta(days=1)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    yesterday = (now - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    db.add(NodeUserUsageMonthly(created_at=last_month, user_id=user.id, used_traffic=1))
+    db.add(NodeUserUsageDaily(created_at=yesterday, user_id=user.id, used_traffic=1))
+    db.add(NodeUserUsage(created_at=now.replace(minute=0, second=0, microsecond=0), user_id=user.id, used_traffic=1))
+    db.commit()
+
+    with captured(engine) as statements:
+        crud.get_user_usages(db, user, last_month - timedelta(days=40), now)
+    for model in (NodeUserUsage, NodeUserUsageDaily, NodeUserUsageMonthly):
+        table = model.__tablename__
+        # the max(created_at) lookups of the compaction watermark are served by the unique index
+        assert_index_used(
+            engine, statements, table, f"ix_{table}_user_id_created_at", where=f"{table}.user_id = ?"
+        )
+
+
+def test_delete_expired_hwid_devices(engine, db):
+    with captured(engine) as statements:
+        crud.delete_expired_hwid_devices(db, 30)
+    assert_index_used(engine, statements, "user_hwid_devices", "ix_user_hwid_devices_last_seen_at")
+
+
+def test_notification_reminder(engine, db):
+    with captured(engine) as statements:
+        crud.get_notification_reminder(db, 1, ReminderType.expiration_date, threshold=3)
+    assert_index_used(
+        engine, statements, "notification_reminders", "ix_notification_reminders_user_id_type_threshold"
+    )
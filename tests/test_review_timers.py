@@ -0,0 +1,87 @@
+"""
+Expiration reminder timers must be due on the clock the review job uses,
+datetime.utcnow().timestamp(), whatever the host timezone is.
+"""
+
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+from app.db.user_review_queue import UserReviewQueue
+from app.models.user import UserStatus
+from app.utils import helpers
+
+
+@pytest.fixture
+def engine_db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture(params=["Asia/Tehran", "America/New_York", "Asia/Kolkata"])
+def local_timezone(request):
+    previous = os.environ.get("TZ")
+    os.environ["TZ"] = request.param
+    time.tzset()
+    yield request.param
+    if previous is None:
+        del os.environ["TZ"]
+    else:
+        os.environ["TZ"] = previous
+    time.tzset()
+
+
+def expiration_days_at(monkeypatch, expire: int, now_ts: float) -> int:
+    # calculate_expiration_days as the review job would see it when utcnow().timestamp() == now_ts
+    class FrozenDatetime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return datetime.fromtimestamp(now_ts)
+
+    monkeypatch.setattr(helpers, "dt", FrozenDatetime)
+    return helpers.calculate_expiration_days(expire)
+
+
+@pytest.mark.parametrize("days", [1, 3, 7])
+def test_reminder_is_due_when_expiration_days_are_reached(monkeypatch, local_timezone, days):
+    now_ts = datetime.utcnow().timestamp()
+    expire = int(now_ts) + (days + 2) * 86400 + 12345
+
+    reached_at = helpers.expiration_days_reached_at(expire, days)
+
+    assert now_ts < reached_at < now_ts + 3 * 86400
+    assert expiration_days_at(monkeypatch, expire, reached_at) <= days
+    assert expiration_days_at(monkeypatch, expire, reached_at - 1) > days
+
+
+def test_reminder_timer_is_kept_and_fires(local_timezone):
+    now = datetime.utcnow()
+    now_ts = now.timestamp()
+    # four days and five hours left: the 3 day reminder is due in five hours
+    expire = int((now + timedelta(days=4, hours=5)).timestamp())
+    user = type("User", (), {"id": 1, "status": UserStatus.active, "expire": expire, "on_hold_timeout": None})
+
+    queue = UserReviewQueue()
+    queue.schedule(user, now_ts, remind_days=[3])
+
+    assert queue.take(now_ts) == set()
+    assert queue.take(now_ts + 4 * 3600) == set()
+    assert queue.take(now_ts + 5 * 3600 + 1) == {1}
+
+
+def test_bulk_edit_forces_full_scan(engine_db):
+    queue = UserReviewQueue()
+    queue.load(engine_db, datetime.utcnow().timestamp())
+    assert queue.loaded
+
+    queue.mark_all_changed()
+    assert not queue.loaded
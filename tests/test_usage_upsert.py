@@ -0,0 +1,71 @@
+"""
+Usage counters are recorded with one upsert per batch, for node rows and for
+the master rows whose node_id is NULL.
+"""
+
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+from app.db.models import NodeUsage, NodeUserUsage
+from app.db.upsert import build_increment_upsert
+
+HOUR = datetime(2026, 10, 17, 1)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def user_usage_upsert(db, node_id):
+    if node_id is None:
+        return build_increment_upsert(db, NodeUserUsage, ('created_at', 'user_id'), ('used_traffic',),
+                                      index_where=NodeUserUsage.node_id.is_(None))
+    return build_increment_upsert(db, NodeUserUsage, ('created_at', 'user_id', 'node_id'), ('used_traffic',))
+
+
+@pytest.mark.parametrize("node_id", [None, 1])
+def test_user_usages_are_added_onto_existing_rows(db, node_id):
+    stmt = user_usage_upsert(db, node_id)
+    for _ in range(3):
+        db.execute(stmt, [
+            {'created_at': HOUR, 'user_id': uid, 'node_id': node_id, 'used_traffic': uid * 10}
+            for uid in (1, 2)
+        ])
+    db.commit()
+
+    rows = db.execute(
+        select(NodeUserUsage.user_id, func.count(), func.sum(NodeUserUsage.used_traffic)).
+        group_by(NodeUserUsage.user_id).order_by(NodeUserUsage.user_id)
+    ).all()
+    assert [tuple(row) for row in rows] == [(1, 1, 30), (2, 1, 60)]
+
+
+def test_master_and_node_rows_stay_apart(db):
+    for node_id in (None, 1, None):
+        db.execute(user_usage_upsert(db, node_id),
+                   [{'created_at': HOUR, 'user_id': 1, 'node_id': node_id, 'used_traffic': 5}])
+    db.commit()
+
+    rows = db.execute(select(NodeUserUsage.node_id, NodeUserUsage.used_traffic).order_by(NodeUserUsage.id)).all()
+    assert [tuple(row) for row in rows] == [(None, 10), (1, 5)]
+
+
+def test_master_node_usage(db):
+    stmt = build_increment_upsert(db, NodeUsage, ('created_at',), ('uplink', 'downlink'),
+                                  index_where=NodeUsage.node_id.is_(None))
+    for _ in range(2):
+        db.execute(stmt, {'created_at': HOUR, 'node_id': None, 'uplink': 1, 'downlink': 2})
+    db.commit()
+
+    rows = db.execute(select(NodeUsage.node_id, NodeUsage.uplink, NodeUsage.downlink)).all()
+    assert [tuple(row) for row in rows] == [(None, 2, 4)]
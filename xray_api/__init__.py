@@ -1,6 +1,7 @@
 from . import exceptions
 from . import exceptions as exc
 from . import types
+from .aio import AsyncXRay
 from .proxyman import Proxyman
 from .stats import Stats
 
@@ -11,6 +12,7 @@ class XRay(Proxyman, Stats):
 
 __all__ = [
     "XRay",
+    "AsyncXRay",
     "exceptions",
     "exc",
     "types"
@@ -0,0 +1,145 @@
+import typing
+
+import grpc
+from grpc import aio
+
+from .base import XRayBase
+from .exceptions import RelatedError
+from .proto.app.proxyman.command import command_pb2 as proxyman_pb2
+from .proto.app.proxyman.command import command_pb2_grpc as proxyman_pb2_grpc
+from .proto.app.stats.command import command_pb2, command_pb2_grpc
+from .proto.common.protocol import user_pb2
+from .stats import StatResponse, StatsSnapshot, SysStatsResponse, build_stats_snapshot
+from .types.account import Account
+from .types.message import Message, TypedMessage
+
+
+class AsyncXRayBase(object):
+    """
+    `grpc.aio` counterpart of `XRayBase`.
+
+    The channel is bound to the event loop it is first used in, so instances
+    must only be used from a single loop.
+    """
+
+    def __init__(self, address: str, port: int, ssl_cert: bytes = None, ssl_target_name: str = None):
+        self.address = address
+        self.port = port
+        self.ssl_cert = ssl_cert
+        self.ssl_target_name = ssl_target_name
+
+        if ssl_cert is None:
+            self._channel = aio.insecure_channel(f"{address}:{port}")
+        else:
+            creds = grpc.ssl_channel_credentials(root_certificates=ssl_cert)
+            opts = None
+            if ssl_target_name is not None:
+                opts = (('grpc.ssl_target_name_override', ssl_target_name,),)
+            self._channel = aio.secure_channel(f"{address}:{port}",
+                                               credentials=creds,
+                                               options=opts)
+
+        self._stats_stub = command_pb2_grpc.StatsServiceStub(self._channel)
+        self._handler_stub = proxyman_pb2_grpc.HandlerServiceStub(self._channel)
+
+    @classmethod
+    def from_api(cls, api: XRayBase):
+        return cls(api.address, api.port, ssl_cert=api.ssl_cert, ssl_target_name=api.ssl_target_name)
+
+    async def close(self):
+        await self._channel.close()
+
+
+class AsyncStats(AsyncXRayBase):
+    async def get_sys_stats(self, timeout: int = None) -> SysStatsResponse:
+        try:
+            r = await self._stats_stub.GetSysStats(command_pb2.SysStatsRequest(), timeout=timeout)
+        except grpc.RpcError as e:
+            raise RelatedError(e)
+
+        return SysStatsResponse(
+            num_goroutine=r.NumGoroutine,
+            num_gc=r.NumGC,
+            alloc=r.Alloc,
+            total_alloc=r.TotalAlloc,
+            sys=r.Sys,
+            mallocs=r.Mallocs,
+            frees=r.Frees,
+            live_objects=r.LiveObjects,
+            pause_total_ns=r.PauseTotalNs,
+            uptime=r.Uptime
+        )
+
+    async def query_stats(self, pattern: str, reset: bool = False, timeout: int = None) -> typing.List[StatResponse]:
+        try:
+            r = await self._stats_stub.QueryStats(
+                command_pb2.QueryStatsRequest(pattern=pattern, reset=reset),
+                timeout=timeout
+            )
+        except grpc.RpcError as e:
+            raise RelatedError(e)
+
+        stats = []
+        for stat in r.stat:
+            stat_type, name, _, link = stat.name.split('>>>')
+            stats.append(StatResponse(name, stat_type, link, stat.value))
+        return stats
+
+    async def get_users_stats(self, reset: bool = False, timeout: int = None) -> typing.List[StatResponse]:
+        return await self.query_stats("user>>>", reset=reset, timeout=timeout)
+
+    async def get_inbounds_stats(self, reset: bool = False, timeout: int = None) -> typing.List[StatResponse]:
+        return await self.query_stats("inbound>>>", reset=reset, timeout=timeout)
+
+    async def get_outbounds_stats(self, reset: bool = False, timeout: int = None) -> typing.List[StatResponse]:
+        return await self.query_stats("outbound>>>", reset=reset, timeout=timeout)
+
+    async def get_stats_snapshot(self, reset: bool = False, timeout: int = None) -> StatsSnapshot:
+        try:
+            r = await self._stats_stub.QueryStats(
+                command_pb2.QueryStatsRequest(pattern="", reset=reset),
+                timeout=timeout
+            )
+        except grpc.RpcError as e:
+            raise RelatedError(e)
+
+        return build_stats_snapshot(r.stat)
+
+
+class AsyncProxyman(AsyncXRayBase):
+    async def alter_inbound(self, tag: str, operation: TypedMessage, timeout: int = None) -> bool:
+        try:
+            await self._handler_stub.AlterInbound(
+                proxyman_pb2.AlterInboundRequest(tag=tag, operation=operation),
+                timeout=timeout,
+            )
+            return True
+
+        except grpc.RpcError as e:
+            raise RelatedError(e)
+
+    async def add_inbound_user(self, tag: str, user: Account, timeout: int = None) -> bool:
+        return await self.alter_inbound(
+            tag=tag,
+            operation=Message(
+                proxyman_pb2.AddUserOperation(
+                    user=user_pb2.User(
+                        level=user.level,
+                        email=user.email,
+                        account=user.message
+                    )
+                )
+            ), timeout=timeout)
+
+    async def remove_inbound_user(self, tag: str, email: str, timeout: int = None) -> bool:
+        return await self.alter_inbound(
+            tag=tag,
+            operation=Message(
+                proxyman_pb2.RemoveUserOperation(
+                    email=email
+                )
+            ), timeout=timeout)
+
+
+class AsyncXRay(AsyncProxyman, AsyncStats):
+    pass
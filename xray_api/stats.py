@@ -1,5 +1,7 @@
 import typing
+from array import array
 from dataclasses import dataclass
+from functools import cached_property
 
 import grpc
 
@@ -51,11 +53,56 @@ class OutboundStatsResponse:
     downlink: int
 
 
+@dataclass
+class StatsSnapshot:
+    # traffic (uplink + downlink) of user_emails[i] is user_traffic[i]
+    user_emails: typing.List[str]
+    user_traffic: array
+    outbound_uplink: int
+    outbound_downlink: int
+
+
+def build_stats_snapshot(stats: typing.Iterable) -> StatsSnapshot:
+    """Folds raw `user>>>` and `outbound>>>` traffic counters into a StatsSnapshot."""
+    user_index = {}
+    user_emails = []
+    user_traffic = array('q')
+    outbound_uplink = outbound_downlink = 0
+
+    for stat in stats:
+        if not stat.value:
+            continue
+        try:
+            stat_type, name, kind, link = stat.name.split('>>>')
+        except ValueError:
+            continue
+        if kind != 'traffic':
+            continue
+
+        if stat_type == 'user':
+            i = user_index.get(name)
+            if i is None:
+                i = user_index[name] = len(user_emails)
+                user_emails.append(name)
+                user_traffic.append(0)
+            user_traffic[i] += stat.value
+        elif stat_type == 'outbound':
+            if link == 'uplink':
+                outbound_uplink += stat.value
+            else:
+                outbound_downlink += stat.value
+
+    return StatsSnapshot(user_emails, user_traffic, outbound_uplink, outbound_downlink)
+
+
 class Stats(XRayBase):
+    @cached_property
+    def _stats_stub(self):
+        return command_pb2_grpc.StatsServiceStub(self._channel)
+
     def get_sys_stats(self, timeout: int = None) -> SysStatsResponse:
         try:
-            stub = command_pb2_grpc.StatsServiceStub(self._channel)
-            r = stub.GetSysStats(command_pb2.SysStatsRequest(), timeout=timeout)
+            r = self._stats_stub.GetSysStats(command_pb2.SysStatsRequest(), timeout=timeout)
 
         except grpc.RpcError as e:
             raise RelatedError(e)
@@ -75,8 +122,7 @@ class Stats(XRayBase):
 
     def query_stats(self, pattern: str, reset: bool = False, timeout: int = None) -> typing.Iterable[StatResponse]:
         try:
-            stub = command_pb2_grpc.StatsServiceStub(self._channel)
-            r = stub.QueryStats(
+            r = self._stats_stub.QueryStats(
                 command_pb2.QueryStatsRequest(pattern=pattern, reset=reset),
                 timeout=timeout
             )
@@ -108,6 +154,18 @@ class Stats(XRayBase):
     def get_outbounds_stats(self, reset: bool = False, timeout: int = None) -> typing.Iterable[StatResponse]:
         return self.query_stats("outbound>>>", reset=reset, timeout=timeout)
 
+    def get_stats_snapshot(self, reset: bool = False, timeout: int = None) -> StatsSnapshot:
+        """Fetches every traffic counter in a single QueryStats call."""
+        try:
+            r = self._stats_stub.QueryStats(
+                command_pb2.QueryStatsRequest(pattern="", reset=reset),
+                timeout=timeout
+            )
+        except grpc.RpcError as e:
+            raise RelatedError(e)
+
+        return build_stats_snapshot(r.stat)
+
     def get_user_stats(self, email: str, reset: bool = False, timeout: int = None) -> typing.Iterable[StatResponse]:
         uplink, downlink = 0, 0
         for stat in self.query_stats(f"user>>>{email}>>>", reset=reset, timeout=timeout):